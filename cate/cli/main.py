@@ -923,6 +923,34 @@ class ResourceCommand(SubCommandCommand):
                                  help='Output file to write the plot figure to.')
         plot_parser.set_defaults(sub_command_function=cls._execute_plot)
 
+        tiles_parser = subparsers.add_parser('tiles',
+                                             help='Render the image tiles of a variable of a dataset resource '
+                                                  'into the workspace\'s tile cache, so that they are served '
+                                                  'from disk when they are first viewed. The workspace should not '
+                                                  'be open in the Web API meanwhile. The Web API uses the tiles '
+                                                  'only if "use_workspace_imagery_cache" is set in Cate\'s '
+                                                  'configuration.')
+        tiles_parser.add_argument(*base_dir_args, **base_dir_kwargs)
+        tiles_parser.add_argument('res_name', metavar='NAME',
+                                  help='Name of an existing dataset resource.')
+        tiles_parser.add_argument('var_name', metavar='VAR',
+                                  help='Name of a variable of the dataset.')
+        tiles_parser.add_argument('-i', '--index', dest='var_index', metavar='INDEX', default='',
+                                  help='Indices into the variable\'s non-spatial dimensions. '
+                                       'Use format "index1,index2,...".')
+        tiles_parser.add_argument('-c', '--cmap', dest='cmap_name', metavar='CMAP', default='jet',
+                                  help='Name of a color map, defaults to "jet".')
+        tiles_parser.add_argument('--min', dest='cmap_min', metavar='MIN', type=float, default=float('nan'),
+                                  help='Value mapped to the lowest color, defaults to the variable\'s minimum.')
+        tiles_parser.add_argument('--max', dest='cmap_max', metavar='MAX', type=float, default=float('nan'),
+                                  help='Value mapped to the highest color, defaults to the variable\'s maximum.')
+        tiles_parser.add_argument('-z', '--max-level', dest='max_level', metavar='LEVEL', type=int,
+                                  help='Highest pyramid level to be rendered, defaults to the highest level.')
+        tiles_parser.add_argument('-w', '--workers', dest='num_workers', metavar='NUM', type=int,
+                                  help='Number of worker processes, defaults to the number of CPUs. '
+                                       'If 0, tiles are rendered without worker processes.')
+        tiles_parser.set_defaults(sub_command_function=cls._execute_tiles)
+
     @classmethod
     def _execute_open(cls, command_args):
         from cate.core.workspace import mk_op_kwargs
@@ -1024,6 +1052,28 @@ class ResourceCommand(SubCommandCommand):
         workspace_manager.print_workspace_resource(_base_dir(command_args.base_dir),
                                                    command_args.res_name_or_expr)
 
+    @classmethod
+    def _execute_tiles(cls, command_args):
+        from cate.webapi.prerender import render_tiles
+
+        try:
+            var_index = tuple(int(index) for index in command_args.var_index.split(',') if index.strip())
+        except ValueError:
+            raise CommandError('invalid INDEX "%s", use format "index1,index2,..."' % command_args.var_index)
+        num_tiles = render_tiles(_base_dir(command_args.base_dir),
+                                 command_args.res_name,
+                                 command_args.var_name,
+                                 var_index=var_index,
+                                 cmap_name=command_args.cmap_name,
+                                 cmap_min=command_args.cmap_min,
+                                 cmap_max=command_args.cmap_max,
+                                 max_level=command_args.max_level,
+                                 num_workers=command_args.num_workers,
+                                 monitor=cls.new_monitor())
+        print('%d tiles of variable "%s" of resource "%s" rendered.' % (num_tiles,
+                                                                       command_args.var_name,
+                                                                       command_args.res_name))
+
 
 class OperationCommand(SubCommandCommand):
     """
@@ -54,9 +54,49 @@ WEBAPI_USE_WORKSPACE_IMAGERY_CACHE = False
 # The number of bytes in a workspace's image file cache
 WEBAPI_WORKSPACE_FILE_TILE_CACHE_CAPACITY = 1 * _ONE_GIB
 
-# The number of bytes in a workspace's image in-memory cache
+#: The kind of store used by a workspace's image file cache, see REST "/res/tile/" API.
+#: 'segments' packs tiles into a few memory-mapped segment files, 'files' writes one file per tile.
+WEBAPI_WORKSPACE_FILE_TILE_CACHE_STORE = 'segments'
+
+# The number of bytes of all workspaces' image in-memory caches, divided equally among the open workspaces
 WEBAPI_WORKSPACE_MEM_TILE_CACHE_CAPACITY = 256 * _ONE_MIB
 
+# The maximum number of image pyramids kept per workspace, least recently used ones are disposed first
+WEBAPI_WORKSPACE_MAX_NUM_PYRAMIDS = 64
+
+#: The overview mode of image pyramids, see REST "/res/tile/" API.
+#: 'nearest' or 'mean' compute lower resolution levels once from overviews, None reads every tile from the full array.
+#: Overviews are kept in memory as long as their pyramid, about a third of the size of each displayed variable
+WEBAPI_TILE_OVERVIEW_MODE = None
+
+#: The number of worker threads per workspace prefetching the neighbours and children of requested tiles, 0 disables
+WEBAPI_TILE_PREFETCH_NUM_WORKERS = 2
+
+#: The image format of color mapped tiles, see REST "/res/tile/" API, either 'PNG' or 'WEBP'
+WEBAPI_TILE_FORMAT = 'PNG'
+
+#: Whether PNG tiles are palette images whose palette is the color map
+WEBAPI_TILE_PNG_PALETTE = True
+
+#: The zlib compression level from 0 to 9 of PNG tiles
+WEBAPI_TILE_PNG_COMPRESS_LEVEL = 6
+
+#: The quality from 0 to 100 of WEBP tiles, None for lossless WEBP tiles
+WEBAPI_TILE_WEBP_QUALITY = None
+
+#: The number of worker threads computing requested image tiles, see REST "/res/tile/" API
+WEBAPI_TILE_COMPUTATION_NUM_WORKERS = 4
+
+#: The number of tile requests waiting for a worker, further requests are answered with "503 Service Unavailable"
+WEBAPI_TILE_COMPUTATION_MAX_QUEUE_SIZE = 64
+
+#: Whether the Natural Earth base-layer tiles are read into memory at startup, see REST "/ne2/tile/" API
+WEBAPI_NE2_PRELOAD_TILES = True
+
+#: The maximum number of feature collections per workspace, and of GeoJSON files, whose geometries are kept
+#: prepared for simplification, see REST "/res/geojson/" API. Each takes about 32 bytes per point
+WEBAPI_FEATURE_GEOMETRIES_CACHE_NUM_ENTRIES = 8
+
 #: where the information about a running WebAPI service is stored
 WEBAPI_INFO_FILE = os.path.join(DEFAULT_VERSION_DATA_PATH, 'webapi.json')
 
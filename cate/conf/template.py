@@ -19,6 +19,60 @@
 #
 # use_workspace_imagery_cache = False
 
+# The kind of store used by the workspace imagery cache. If 'segments', image tiles are packed into
+# a few large memory-mapped segment files. If 'files', every image tile is written into its own file.
+#
+# workspace_imagery_cache_store = 'segments'
+
+# The overview mode used to compute the lower resolution levels of image pyramids. If 'nearest', every 2x2 block
+# of pixels is represented by its upper left pixel, if 'mean', by the mean of its valid pixels.
+# Overviews are computed once, each from the next higher resolution. If None, every tile is read from
+# the full resolution data. Overviews are kept in memory as long as the image pyramid of a variable,
+# they take about a third of the size of the variable's displayed 2D array.
+#
+# tile_overview_mode = None
+
+# The number of worker threads per workspace which prefetch the neighbours and the children of requested
+# image tiles in the background. Set to 0 to disable prefetching.
+#
+# tile_prefetch_num_workers = 2
+
+# The image format of color mapped tiles, either 'PNG' or 'WEBP'. WEBP requires Pillow with WEBP support,
+# otherwise PNG is used.
+#
+# tile_format = 'PNG'
+
+# Whether PNG tiles are encoded as palette images whose palette is the color map. Palette images
+# are much faster to encode and smaller than RGBA images, but use 255 instead of 256 colors.
+#
+# tile_png_palette = True
+
+# The zlib compression level of PNG tiles from 0 (fastest) to 9 (smallest).
+#
+# tile_png_compress_level = 6
+
+# The quality of WEBP tiles from 0 to 100. If None, WEBP tiles are lossless.
+#
+# tile_webp_quality = None
+
+# The number of worker threads computing requested image tiles, and the number of tile requests
+# that may wait for a free worker. Further tile requests are answered with "503 Service Unavailable".
+#
+# tile_computation_num_workers = 4
+# tile_computation_max_queue_size = 64
+
+# Whether the Natural Earth base-layer tiles (about 470 KB) are read into memory when the Web API starts,
+# so that they are served without file system access. Otherwise, every tile is read from file when requested.
+#
+# ne2_preload_tiles = True
+
+# The maximum number of feature collections per workspace, and of GeoJSON files, whose geometries are kept
+# in memory, reprojected and ranked for simplification, so that any simplification level is served quickly.
+# Each feature collection takes about 32 bytes per point of its geometries. Least recently used ones
+# are removed first.
+#
+# feature_geometries_cache_num_entries = 8
+
 # Default prefix for names generated for new workspace resources originating from opening data sources
 # or executing workflow steps.
 # This prefix is used only if no specific prefix is defined for a given operation.
@@ -115,6 +115,7 @@ import xarray as xr
 
 from .opimpl import get_lat_dim_name_impl, get_lon_dim_name_impl
 from ..util.im import GeoExtent, TilingScheme
+from ..util.im.utils import get_chunk_size
 from ..util.misc import object_to_qualified_name, qualified_name_to_object
 
 __author__ = "Norman Fomferra (Brockmann Consult GmbH)," \
@@ -342,6 +343,8 @@ def get_lat_dim_name(ds: Union[xr.Dataset, xr.DataArray]) -> Optional[str]:
 def get_tiling_scheme(var: xr.DataArray) -> Optional[TilingScheme]:
     """
     Compute a tiling scheme for the given variable *var*.
+    If *var* is chunked, e.g. by dask or in a netCDF file, tile sizes are chosen to align with its
+    spatial chunks, so that a tile does not have to be read from several chunks.
 
     :param var: A variable of an xarray dataset.
     :return:  a new TilingScheme object or None if *var* cannot be represented as a spatial image
@@ -356,7 +359,12 @@ def get_tiling_scheme(var: xr.DataArray) -> Optional[TilingScheme]:
     lats = var.coords[lat_dim_name]
     lons = var.coords[lon_dim_name]
     geo_extent = GeoExtent.from_coord_arrays(lons, lats)
+    chunk_width, chunk_height = None, None
+    chunk_size = get_chunk_size(var)
+    if chunk_size and len(chunk_size) >= 2:
+        chunk_width, chunk_height = chunk_size[-1], chunk_size[-2]
     try:
-        return TilingScheme.create(width, height, 360, 360, geo_extent)
+        return TilingScheme.create(width, height, 360, 360, geo_extent,
+                                   chunk_width=chunk_width, chunk_height=chunk_height)
     except ValueError:
         return TilingScheme(1, 1, 1, width, height, geo_extent)
@@ -143,6 +143,10 @@ class Workspace:
 
     @property
     def user_data(self) -> dict:
+        """
+        Arbitrary data associated with this workspace, e.g. by the Web API.
+        Values that have a ``close()`` method are closed when the workspace is closed.
+        """
         return self._user_data
 
     @classmethod
@@ -188,6 +192,7 @@ class Workspace:
         if self._is_closed:
             return
         with self._lock:
+            self._close_user_data()
             self._resource_cache.close()
             # Remove all resource files that are no longer required
             if os.path.isdir(self.workspace_dir):
@@ -202,6 +207,17 @@ class Workspace:
                             except (OSError, IOError) as e:
                                 print('error:', e)
 
+    def _close_user_data(self):
+        user_data_values = list(self._user_data.values())
+        self._user_data.clear()
+        for value in user_data_values:
+            if hasattr(value, 'close'):
+                # noinspection PyBroadException
+                try:
+                    value.close()
+                except Exception as e:
+                    print('error:', e)
+
     def save(self, monitor: Monitor = Monitor.NONE):
         self._assert_open()
         with self._lock:
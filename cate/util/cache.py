@@ -27,13 +27,22 @@ Description
 This module defines the :py:class:`Cache` class which represents a general-purpose cache.
 A cache is configured by a :py:class:`CacheStore` which is responsible for storing and reloading cached items.
 
+A :py:class:`ShardedCache` distributes its items onto multiple, independently locked :py:class:`Cache` instances
+and should be used if a cache is accessed concurrently by many threads.
+
 The default cache stores are
 
 * :py:class:`MemoryCacheStore`
 * :py:class:`FileCacheStore`
+* :py:class:`IndexedFileCacheStore`
+* :py:class:`SegmentedFileCacheStore`
 
-Every cache has capacity in physical units defined by the :py:class:`CacheStore`. When the cache capacity is exceeded
+Every cache has capacity in physical units defined by the :py:class:`CacheStore`. The :py:class:`MemoryCacheStore`
+measures values in bytes using :py:func:`compute_object_size`, sizers for further types can be added
+using :py:func:`register_object_sizer`. When the cache capacity is exceeded
 a replacement policy for cached items is applied until the cache size falls below a given ratio of the total capacity.
+A replacement policy is a :py:class:`CachePolicy` that indexes the cached items so that getting, putting and evicting
+an item takes O(1) amortised time.
 
 The default replacement policies are
 
@@ -41,6 +50,10 @@ The default replacement policies are
 * :py:data:`POLICY_MRU`
 * :py:data:`POLICY_LFU`
 * :py:data:`POLICY_RR`
+* :py:data:`POLICY_TINY_LFU`
+
+Every cache counts its hits, misses, evictions and the time spent in its store, see :py:class:`CacheStats`,
+so that policies and capacities can be compared by replaying recorded access traces or from production data.
 
 This package is independent of other ``cate.*``packages and can therefore be used stand-alone.
 
@@ -48,12 +61,20 @@ Components
 ==========
 """
 
+import mmap
 import os
 import os.path
+import random
+import shutil
+import sqlite3
+import struct
 import sys
+import tempfile
 import time
 from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
 from threading import RLock
+from typing import Any, Callable, Iterable, Optional, Tuple
 
 __author__ = "Norman Fomferra (Brockmann Consult GmbH)"
 
@@ -66,6 +87,14 @@ class CacheStore(metaclass=ABCMeta):
     Represents a store to which cached values can be stored into and restored from.
     """
 
+    @property
+    def is_persistent(self) -> bool:
+        """
+        Whether stored values outlive the process, e.g. because they are written to files.
+        The default implementation returns False.
+        """
+        return False
+
     @abstractmethod
     def can_load_from_key(self, key) -> bool:
         """
@@ -113,10 +142,33 @@ class CacheStore(metaclass=ABCMeta):
         """
         pass
 
+    def load_index(self) -> Iterable[Tuple[Any, Any, Any]]:
+        """
+        Load the keys of all values that are already held by this store, e.g. from a previous process run.
+        The default implementation returns an empty sequence.
+        :return: an iterable of 3-element tuples (key, stored_value, stored_size), least recently accessed first
+        """
+        return ()
+
+    def access_value(self, key, stored_value):
+        """
+        Notify this store that the value has been accessed. The default implementation does nothing.
+        :param key: the key
+        :param stored_value: the stored representation of the value
+        """
+        pass
+
+    def clear(self) -> bool:
+        """
+        Discard all values at once. The default implementation does nothing and returns False.
+        :return: True, if all values have been discarded, False if this operation is not supported.
+        """
+        return False
+
 
 class MemoryCacheStore(CacheStore):
     """
-    Simple memory store.
+    Simple memory store. The size of a value is its size in bytes as computed by :py:func:`compute_object_size`.
     """
 
     def can_load_from_key(self, key) -> bool:
@@ -128,12 +180,12 @@ class MemoryCacheStore(CacheStore):
 
     def store_value(self, key, value):
         """
-        Return (value, 1).
+        Return ([key, value], size).
         :param key: the key
         :param value: the original value
         :return: the tuple (stored value, size) where stored value is the sequence [key, value].
         """
-        return [key, value], _compute_object_size(value)
+        return [key, value], compute_object_size(value)
 
     def restore_value(self, key, stored_value):
         """
@@ -155,16 +207,25 @@ class MemoryCacheStore(CacheStore):
             raise ValueError('key does not match stored value')
         stored_value[1] = None
 
+    def clear(self) -> bool:
+        # Nothing to do, stored values are released with the cache items
+        return True
+
 
 class FileCacheStore(CacheStore):
     """
     Simple file store for values which can be written and read as bytes, e.g. encoded PNG images.
+    Files are written to a temporary file first which is then renamed, so that readers never see incomplete files.
     """
 
     def __init__(self, cache_dir: str, ext: str):
         self.cache_dir = cache_dir
         self.ext = ext
 
+    @property
+    def is_persistent(self) -> bool:
+        return True
+
     def can_load_from_key(self, key) -> bool:
         path = self._key_to_path(key)
         return os.path.exists(path)
@@ -176,10 +237,22 @@ class FileCacheStore(CacheStore):
     def store_value(self, key, value):
         path = self._key_to_path(key)
         dir_path = os.path.dirname(path)
-        if not os.path.exists(dir_path):
-            os.makedirs(dir_path, exist_ok=True)
-        with open(path, 'wb') as fp:
-            fp.write(value)
+        while True:
+            if not os.path.exists(dir_path):
+                os.makedirs(dir_path, exist_ok=True)
+            try:
+                fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=dir_path)
+                break
+            except FileNotFoundError:
+                # dir_path has been pruned concurrently
+                pass
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(value)
+            os.replace(temp_path, path)
+        except BaseException:
+            _remove_file(temp_path)
+            raise
         return path, os.path.getsize(path)
 
     def restore_value(self, key, stored_value):
@@ -189,42 +262,844 @@ class FileCacheStore(CacheStore):
 
     def discard_value(self, key, stored_value):
         path = self._key_to_path(key)
-        try:
-            os.remove(path)
-            # TODO (forman): also remove empty directories up to self.cache_dir
-        except IOError:
-            pass
+        if _remove_file(path):
+            self._prune_dirs(os.path.dirname(path))
 
     def _key_to_path(self, key):
         return os.path.join(self.cache_dir, str(key) + self.ext)
 
+    def _prune_dirs(self, dir_path):
+        """Remove empty directories from *dir_path* up to, but excluding, *cache_dir*."""
+        cache_dir = os.path.abspath(self.cache_dir)
+        dir_path = os.path.abspath(dir_path)
+        while dir_path != cache_dir and dir_path.startswith(cache_dir):
+            try:
+                os.rmdir(dir_path)
+            except OSError:
+                # not empty or already removed
+                break
+            dir_path = os.path.dirname(dir_path)
+
+
+class IndexedFileCacheStore(FileCacheStore):
+    """
+    A :py:class:`FileCacheStore` that maintains an index of the keys, sizes and access times of its files
+    in an SQLite database within *cache_dir*. A :py:class:`Cache` using this store recovers its items from the
+    index on first use, so that the cache's capacity and replacement policy are effective across process restarts.
+
+    The store owns *cache_dir*: calling :py:meth:`clear` removes it entirely.
+
+    :param cache_dir: the cache directory
+    :param ext: the file name extension
+    :param commit_interval: maximum number of index updates before they are committed
+    """
+
+    INDEX_FILE_NAME = '.index.sqlite'
+
+    def __init__(self, cache_dir: str, ext: str, commit_interval: int = 100):
+        super().__init__(cache_dir, ext)
+        self._commit_interval = commit_interval
+        self._num_pending_updates = 0
+        self._connection = None
+        self._lock = RLock()
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.cache_dir, self.INDEX_FILE_NAME)
+
+    def load_index(self):
+        with self._lock:
+            cursor = self._get_connection().execute('SELECT key, size FROM items ORDER BY access_time')
+            return [(key, self._key_to_path(key), size) for key, size in cursor.fetchall()]
+
+    def load_from_key(self, key):
+        stored_value, stored_size = super().load_from_key(key)
+        self._update_index('INSERT OR REPLACE INTO items (key, size, access_time) VALUES (?, ?, ?)',
+                           (str(key), stored_size, time.time()))
+        return stored_value, stored_size
+
+    def store_value(self, key, value):
+        stored_value, stored_size = super().store_value(key, value)
+        self._update_index('INSERT OR REPLACE INTO items (key, size, access_time) VALUES (?, ?, ?)',
+                           (str(key), stored_size, time.time()))
+        return stored_value, stored_size
+
+    def restore_value(self, key, stored_value):
+        try:
+            return super().restore_value(key, stored_value)
+        except FileNotFoundError:
+            # File has been deleted externally, the index is out of date
+            return None
+
+    def access_value(self, key, stored_value):
+        self._update_index('UPDATE items SET access_time = ? WHERE key = ?', (time.time(), str(key)))
+
+    def discard_value(self, key, stored_value):
+        super().discard_value(key, stored_value)
+        self._update_index('DELETE FROM items WHERE key = ?', (str(key),))
+
+    def clear(self) -> bool:
+        with self._lock:
+            self.close()
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+        return True
+
+    def flush(self):
+        """Commit pending index updates."""
+        with self._lock:
+            if self._connection is not None and self._num_pending_updates:
+                self._connection.commit()
+                self._num_pending_updates = 0
+
+    def close(self):
+        """Commit pending index updates and close the index."""
+        with self._lock:
+            if self._connection is not None:
+                self.flush()
+                self._connection.close()
+                self._connection = None
+
+    def _update_index(self, sql, params):
+        with self._lock:
+            self._get_connection().execute(sql, params)
+            self._num_pending_updates += 1
+            if self._num_pending_updates >= self._commit_interval:
+                self.flush()
+
+    def _get_connection(self):
+        if self._connection is None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # The connection is guarded by self._lock, it may be used from any thread
+            self._connection = sqlite3.connect(self.index_path, check_same_thread=False)
+            self._connection.execute('CREATE TABLE IF NOT EXISTS items '
+                                     '(key TEXT PRIMARY KEY, size INTEGER, access_time REAL)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS items_access_time ON items (access_time)')
+            self._connection.commit()
+        return self._connection
+
+
+class SegmentedFileCacheStore(CacheStore):
+    """
+    A store for values which can be written and read as bytes, e.g. encoded PNG images.
+    Values are appended as records to a few large segment files in *cache_dir* rather than written
+    to one file per value. Values are restored as ``memoryview`` slices of memory-mapped segment files,
+    so restoring a value requires neither system calls nor copying.
+
+    Discarding a value appends a small tombstone record. Once the ratio of discarded bytes in a segment
+    exceeds *compaction_threshold*, its remaining values are moved to the current segment and the segment
+    file is deleted. On first use, the index of all values is rebuilt by scanning the segment file headers,
+    so that a :py:class:`Cache` using this store recovers its items across process restarts.
+
+    Segment files that cannot be deleted, e.g. on Windows while restored values still refer to their
+    memory map, are deleted later by :py:meth:`close` or the next compaction. Until then, all tombstones
+    are kept, so that the values of these segments are not restored by a later scan.
+
+    The store owns *cache_dir*: calling :py:meth:`clear` removes it entirely.
+
+    :param cache_dir: the cache directory
+    :param segment_size: the size in bytes after which a new segment file is started
+    :param compaction_threshold: ratio of discarded bytes in a segment that triggers its compaction
+    """
+
+    SEGMENT_FILE_PREFIX = 'segment-'
+    SEGMENT_FILE_EXT = '.dat'
+
+    # Record header: key length, value length (-1 for tombstones)
+    _HEADER = struct.Struct('<Hi')
+
+    def __init__(self, cache_dir: str, segment_size: int = 64 * 1024 * 1024, compaction_threshold: float = 0.5):
+        self.cache_dir = cache_dir
+        self.segment_size = segment_size
+        self.compaction_threshold = compaction_threshold
+        # key --> (segment_id, value offset, value length)
+        self._index = None
+        # segment_id --> [total bytes, live bytes]
+        self._segment_sizes = dict()
+        # segment_id --> set of keys
+        self._segment_keys = dict()
+        # segment_id --> dict of tombstoned key --> segment_id of discarded record
+        self._segment_tombstones = dict()
+        self._mmaps = dict()
+        # IDs of compacted segments whose files could not be deleted yet
+        self._undeleted_segment_ids = set()
+        self._active_segment_id = -1
+        self._active_fp = None
+        self._lock = RLock()
+
+    @property
+    def is_persistent(self) -> bool:
+        return True
+
+    def can_load_from_key(self, key) -> bool:
+        with self._lock:
+            return str(key) in self._get_index()
+
+    def load_from_key(self, key):
+        with self._lock:
+            key = str(key)
+            return key, self._get_index()[key][2]
+
+    def load_index(self):
+        with self._lock:
+            # Segment order, i.e. least recently written first
+            return [(key, key, entry[2]) for key, entry in sorted(self._get_index().items(),
+                                                                   key=lambda e: (e[1][0], e[1][1]))]
+
+    def store_value(self, key, value):
+        with self._lock:
+            key = str(key)
+            index = self._get_index()
+            if key in index:
+                self._discard(key)
+            self._append_record(key, value)
+            return key, len(value)
+
+    def restore_value(self, key, stored_value):
+        with self._lock:
+            entry = self._get_index().get(str(key))
+            if entry is None:
+                return None
+            segment_id, offset, length = entry
+            return memoryview(self._get_mmap(segment_id, offset + length))[offset:offset + length]
+
+    def discard_value(self, key, stored_value):
+        with self._lock:
+            key = str(key)
+            if key in self._get_index():
+                self._discard(key)
+
+    def clear(self) -> bool:
+        with self._lock:
+            self.close()
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+            self._index = None
+            self._undeleted_segment_ids.clear()
+            if os.path.exists(self.cache_dir):
+                # Some segment files could not be deleted, discard their values so that they are not restored
+                for key in list(self._get_index().keys()):
+                    if key in self._index:
+                        self._discard(key)
+        return True
+
+    def close(self):
+        """
+        Close all segment files. Memory maps are released once no value refers to them anymore.
+        Files of compacted segments that could not be deleted before are deleted now, if possible.
+        """
+        with self._lock:
+            if self._active_fp is not None:
+                self._active_fp.close()
+                self._active_fp = None
+            self._mmaps.clear()
+            self._delete_undeleted_segments()
+
+    def _discard(self, key):
+        segment_id, offset, length = self._index.pop(key)
+        self._segment_keys[segment_id].discard(key)
+        self._segment_sizes[segment_id][1] -= self._HEADER.size + len(key.encode('utf-8')) + length
+        self._append_tombstone(key, segment_id)
+        if segment_id != self._active_segment_id:
+            total_size, live_size = self._segment_sizes[segment_id]
+            if total_size - live_size >= self.compaction_threshold * total_size:
+                self._compact_segment(segment_id)
+
+    def _compact_segment(self, segment_id):
+        self._delete_undeleted_segments()
+        mm = self._get_mmap(segment_id, 0)
+        for key in list(self._segment_keys[segment_id]):
+            _, offset, length = self._index[key]
+            self._append_record(key, mm[offset:offset + length])
+        for key, record_segment_id in self._segment_tombstones[segment_id].items():
+            # Keep tombstones whose discarded records still exist in other segments. Undeleted segment files
+            # may still hold records of any discarded key, so then all tombstones are kept.
+            if key not in self._index and record_segment_id != segment_id \
+                    and (record_segment_id in self._segment_sizes or self._undeleted_segment_ids):
+                self._append_tombstone(key, record_segment_id)
+        del self._segment_sizes[segment_id]
+        del self._segment_keys[segment_id]
+        del self._segment_tombstones[segment_id]
+        # Don't close the memory map, restored values may still refer to it
+        self._mmaps.pop(segment_id, None)
+        if not _remove_file(self._segment_path(segment_id)):
+            # E.g. on Windows, memory-mapped files cannot be deleted
+            self._undeleted_segment_ids.add(segment_id)
+
+    def _delete_undeleted_segments(self):
+        for segment_id in list(self._undeleted_segment_ids):
+            path = self._segment_path(segment_id)
+            if _remove_file(path) or not os.path.exists(path):
+                self._undeleted_segment_ids.discard(segment_id)
+
+    def _append_record(self, key, value):
+        key_bytes = key.encode('utf-8')
+        fp = self._get_active_fp(len(value))
+        header_offset = fp.tell()
+        fp.write(self._HEADER.pack(len(key_bytes), len(value)))
+        fp.write(key_bytes)
+        fp.write(value)
+        fp.flush()
+        segment_id = self._active_segment_id
+        record_size = self._HEADER.size + len(key_bytes) + len(value)
+        self._index[key] = segment_id, header_offset + self._HEADER.size + len(key_bytes), len(value)
+        self._segment_keys[segment_id].add(key)
+        self._segment_sizes[segment_id][0] += record_size
+        self._segment_sizes[segment_id][1] += record_size
+
+    def _append_tombstone(self, key, record_segment_id):
+        key_bytes = key.encode('utf-8')
+        fp = self._get_active_fp(0)
+        fp.write(self._HEADER.pack(len(key_bytes), -1))
+        fp.write(key_bytes)
+        fp.flush()
+        self._segment_sizes[self._active_segment_id][0] += self._HEADER.size + len(key_bytes)
+        self._segment_tombstones[self._active_segment_id][key] = record_segment_id
+
+    def _get_active_fp(self, value_size):
+        if self._active_fp is not None and self._active_fp.tell() + value_size > self.segment_size \
+                and self._active_fp.tell() > 0:
+            self._active_fp.close()
+            self._active_fp = None
+            self._active_segment_id += 1
+        if self._active_fp is None:
+            if self._active_segment_id < 0:
+                self._active_segment_id = 0
+            segment_id = self._active_segment_id
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._active_fp = open(self._segment_path(segment_id), 'ab')
+            self._init_segment(segment_id, os.path.getsize(self._segment_path(segment_id)))
+        return self._active_fp
+
+    def _init_segment(self, segment_id, size):
+        if segment_id not in self._segment_sizes:
+            self._segment_sizes[segment_id] = [size, 0]
+            self._segment_keys[segment_id] = set()
+            self._segment_tombstones[segment_id] = dict()
+
+    def _get_mmap(self, segment_id, min_size):
+        mm = self._mmaps.get(segment_id)
+        if mm is None or len(mm) < min_size:
+            # (Re-)map, because the active segment has grown. A replaced map is released once unused.
+            with open(self._segment_path(segment_id), 'rb') as fp:
+                mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            self._mmaps[segment_id] = mm
+        return mm
+
+    def _get_index(self):
+        if self._index is None:
+            # Undeleted segment files are scanned like any other, their values are overridden by later records
+            self._delete_undeleted_segments()
+            self._undeleted_segment_ids.clear()
+            self._index = dict()
+            self._segment_sizes.clear()
+            self._segment_keys.clear()
+            self._segment_tombstones.clear()
+            self._active_segment_id = -1
+            for segment_id in self._list_segment_ids():
+                self._scan_segment(segment_id)
+                self._active_segment_id = segment_id
+        return self._index
+
+    def _scan_segment(self, segment_id):
+        path = self._segment_path(segment_id)
+        with open(path, 'rb') as fp:
+            size = os.fstat(fp.fileno()).st_size
+            self._init_segment(segment_id, size)
+            offset = 0
+            while offset + self._HEADER.size <= size:
+                key_length, value_length = self._HEADER.unpack(fp.read(self._HEADER.size))
+                key_offset = offset + self._HEADER.size
+                value_offset = key_offset + key_length
+                next_offset = value_offset + max(value_length, 0)
+                if next_offset > size:
+                    break
+                key = fp.read(key_length).decode('utf-8')
+                old_entry = self._index.pop(key, None)
+                if old_entry is not None:
+                    old_segment_id = old_entry[0]
+                    self._segment_keys[old_segment_id].discard(key)
+                    self._segment_sizes[old_segment_id][1] -= self._HEADER.size + key_length + old_entry[2]
+                if value_length >= 0:
+                    self._index[key] = segment_id, value_offset, value_length
+                    self._segment_keys[segment_id].add(key)
+                    self._segment_sizes[segment_id][1] += next_offset - offset
+                    fp.seek(next_offset)
+                else:
+                    self._segment_tombstones[segment_id][key] = old_entry[0] if old_entry else segment_id
+                offset = next_offset
+        if offset < size:
+            # Incomplete record, e.g. after a crash
+            with open(path, 'r+b') as fp:
+                fp.truncate(offset)
+            self._segment_sizes[segment_id][0] = offset
+
+    def _list_segment_ids(self):
+        if not os.path.isdir(self.cache_dir):
+            return []
+        segment_ids = []
+        prefix, ext = self.SEGMENT_FILE_PREFIX, self.SEGMENT_FILE_EXT
+        for filename in os.listdir(self.cache_dir):
+            if filename.startswith(prefix) and filename.endswith(ext):
+                try:
+                    segment_ids.append(int(filename[len(prefix):-len(ext)]))
+                except ValueError:
+                    pass
+        return sorted(segment_ids)
+
+    def _segment_path(self, segment_id):
+        return os.path.join(self.cache_dir, '%s%06d%s' % (self.SEGMENT_FILE_PREFIX, segment_id, self.SEGMENT_FILE_EXT))
+
+
+def _remove_file(path) -> bool:
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
+
+
+class CachePolicy(metaclass=ABCMeta):
+    """
+    A cache replacement policy. It keeps track of the items of a :py:class:`Cache` and selects the next item
+    to be evicted when the cache's capacity is exceeded.
+
+    All methods are called while the cache holds its lock and should run in O(1) (amortised) time.
+    """
+
+    @abstractmethod
+    def add_item(self, item: 'Cache.Item'):
+        """
+        Start tracking the given, newly stored item.
+        :param item: the cache item
+        """
+        pass
+
+    @abstractmethod
+    def access_item(self, item: 'Cache.Item'):
+        """
+        Notify this policy that the given item has been accessed.
+        :param item: the cache item
+        """
+        pass
+
+    @abstractmethod
+    def remove_item(self, item: 'Cache.Item'):
+        """
+        Stop tracking the given item.
+        :param item: the cache item
+        """
+        pass
+
+    @abstractmethod
+    def next_victim(self) -> Optional['Cache.Item']:
+        """
+        Return the item to be evicted next without removing it.
+        :return: the next item to be evicted or None, if there are no items
+        """
+        pass
+
+    @abstractmethod
+    def clear(self):
+        """
+        Stop tracking all items.
+        """
+        pass
+
+    def set_max_size(self, max_size):
+        """
+        Notify this policy about the maximum size of the cache. Called by the cache initially and
+        whenever its capacity changes. The default implementation does nothing.
+        :param max_size: the size in units used by the cache store, up to which the cache is filled
+        """
+        pass
+
+
+class LruCachePolicy(CachePolicy):
+    """
+    Discards the Least Recently Used items first. Uses an ordered dictionary of items,
+    the least recently used item is the first.
+    """
+
+    def __init__(self):
+        self._items = OrderedDict()
+
+    def add_item(self, item):
+        self._items[item.key] = item
+
+    def access_item(self, item):
+        self._items.move_to_end(item.key)
+
+    def remove_item(self, item):
+        del self._items[item.key]
+
+    def next_victim(self):
+        for item in self._items.values():
+            return item
+        return None
+
+    def clear(self):
+        self._items.clear()
+
+
+class MruCachePolicy(LruCachePolicy):
+    """
+    Discards the Most Recently Used items first.
+    """
+
+    def next_victim(self):
+        for item in reversed(self._items.values()):
+            return item
+        return None
+
+
+class LfuCachePolicy(CachePolicy):
+    """
+    Discards the Least Frequently Used items first. Items are kept in frequency buckets, each bucket is an ordered
+    dictionary, so that the least recently used item among the least frequently used ones is discarded first.
+    """
+
+    def __init__(self):
+        self._buckets = dict()
+        self._min_count = 0
+
+    def add_item(self, item):
+        self._add_to_bucket(item)
+        if not self._min_count or item.access_count < self._min_count:
+            self._min_count = item.access_count
+
+    def access_item(self, item):
+        # item.access_count has already been incremented by one
+        old_count = item.access_count - 1
+        self._remove_from_bucket(item, old_count)
+        self._add_to_bucket(item)
+        if old_count == self._min_count and old_count not in self._buckets:
+            self._min_count = item.access_count
+
+    def remove_item(self, item):
+        self._remove_from_bucket(item, item.access_count)
+        if item.access_count == self._min_count and item.access_count not in self._buckets:
+            # Lazily recomputed in next_victim()
+            self._min_count = 0
+
+    def next_victim(self):
+        if not self._buckets:
+            return None
+        if not self._min_count:
+            # Only happens after removals, number of distinct access counts is usually small
+            self._min_count = min(self._buckets.keys())
+        for item in self._buckets[self._min_count].values():
+            return item
+        return None
+
+    def clear(self):
+        self._buckets.clear()
+        self._min_count = 0
+
+    def _add_to_bucket(self, item):
+        bucket = self._buckets.get(item.access_count)
+        if bucket is None:
+            bucket = OrderedDict()
+            self._buckets[item.access_count] = bucket
+        bucket[item.key] = item
+
+    def _remove_from_bucket(self, item, access_count):
+        bucket = self._buckets[access_count]
+        del bucket[item.key]
+        if not bucket:
+            del self._buckets[access_count]
+
+
+class RrCachePolicy(CachePolicy):
+    """
+    Discards items by Random Replacement. Uses an array of items from which items are removed by swapping
+    them with the last one.
+    """
+
+    def __init__(self, seed=None):
+        self._items = []
+        self._indexes = dict()
+        self._random = random.Random(seed)
+        self._victim = None
+
+    def add_item(self, item):
+        self._indexes[item.key] = len(self._items)
+        self._items.append(item)
+
+    def access_item(self, item):
+        pass
+
+    def remove_item(self, item):
+        index = self._indexes.pop(item.key)
+        last_item = self._items.pop()
+        if last_item is not item:
+            self._items[index] = last_item
+            self._indexes[last_item.key] = index
+        if self._victim is item:
+            self._victim = None
+
+    def next_victim(self):
+        if not self._items:
+            return None
+        if self._victim is None:
+            self._victim = self._items[self._random.randrange(len(self._items))]
+        return self._victim
+
+    def clear(self):
+        self._items.clear()
+        self._indexes.clear()
+        self._victim = None
+
+
+class SortKeyCachePolicy(CachePolicy):
+    """
+    Adapts a sort key function that maps a :py:class:`Cache.Item` to a numerical value to the
+    :py:class:`CachePolicy` interface. Items with the smallest value are discarded first.
+    Selecting a victim takes O(n) time, so prefer one of the indexed policies.
+
+    :param sort_key: the sort key function
+    """
 
-def _policy_lru(item):
-    return item.access_time
+    def __init__(self, sort_key):
+        self._sort_key = sort_key
+        self._items = dict()
 
+    def add_item(self, item):
+        self._items[item.key] = item
 
-def _policy_mru(item):
-    return -item.access_time
+    def access_item(self, item):
+        pass
 
+    def remove_item(self, item):
+        del self._items[item.key]
 
-def _policy_lfu(item):
-    return item.access_count
+    def next_victim(self):
+        if not self._items:
+            return None
+        return min(self._items.values(), key=self._sort_key)
 
+    def clear(self):
+        self._items.clear()
 
-def _policy_rr(item):
-    return item.access_count % 2
+
+class TinyLfuCachePolicy(CachePolicy):
+    """
+    A scan-resistant, size-aware replacement policy that implements W-TinyLFU, see
+    https://arxiv.org/abs/1512.00727
+
+    New items enter a small LRU *window*. The main space is a segmented LRU consisting of a *probation*
+    and a *protected* segment; items accessed while on probation are promoted to the protected segment.
+    When the window exceeds its share of the cache's maximum size, its least recently used item is
+    a candidate for the main space. The candidate is only admitted if its estimated access frequency
+    is higher than the one of the item that would have to be evicted from the main space, otherwise
+    the candidate is evicted itself. As every item the candidate displaces is compared in turn, larger
+    items must be more popular than all the items they replace. Candidates larger than the main space
+    are never admitted.
+
+    Access frequencies, including those of items no longer in the cache, are estimated by a
+    compact count-min sketch whose counters are halved periodically, so that past popularity fades.
+
+    A sequential scan over many new keys, e.g. panning across a high zoom level of an image pyramid,
+    therefore only flushes the window, but not the frequently used items in the main space.
+
+    :param window_ratio: share of the cache's maximum size used for the window
+    :param protected_ratio: share of the main space used for the protected segment
+    :param sketch_width: number of counters per row of the frequency sketch, rounded up to a power of two.
+           Should be greater than the expected number of items in the cache.
+    """
+
+    def __init__(self, window_ratio: float = 0.01, protected_ratio: float = 0.8, sketch_width: int = 16384):
+        self._window_ratio = window_ratio
+        self._protected_ratio = protected_ratio
+        self._sketch = _FrequencySketch(sketch_width)
+        self._window = OrderedDict()
+        self._probation = OrderedDict()
+        self._protected = OrderedDict()
+        # key --> the segment (one of the ordered dictionaries above) the item is in
+        self._segments = dict()
+        self._protected_size = 0
+        self._main_size = 0
+        self._main_max_size = None
+        self._protected_max_size = None
+
+    def set_max_size(self, max_size):
+        self._main_max_size = max_size * (1.0 - self._window_ratio)
+        self._protected_max_size = self._main_max_size * self._protected_ratio
+
+    def frequency(self, key) -> int:
+        """
+        :param key: the key
+        :return: the estimated access frequency of the given key
+        """
+        return self._sketch.frequency(key)
+
+    def add_item(self, item):
+        self._sketch.increment(item.key)
+        self._window[item.key] = item
+        self._segments[item.key] = self._window
+
+    def access_item(self, item):
+        self._sketch.increment(item.key)
+        segment = self._segments[item.key]
+        if segment is self._probation:
+            del self._probation[item.key]
+            self._protected[item.key] = item
+            self._segments[item.key] = self._protected
+            self._protected_size += item.stored_size
+            if self._protected_max_size is not None:
+                while self._protected_size > self._protected_max_size and len(self._protected) > 1:
+                    _, demoted_item = self._protected.popitem(last=False)
+                    self._probation[demoted_item.key] = demoted_item
+                    self._segments[demoted_item.key] = self._probation
+                    self._protected_size -= demoted_item.stored_size
+        else:
+            segment.move_to_end(item.key)
+
+    def remove_item(self, item):
+        segment = self._segments.pop(item.key)
+        del segment[item.key]
+        if segment is not self._window:
+            self._main_size -= item.stored_size
+            if segment is self._protected:
+                self._protected_size -= item.stored_size
+
+    def next_victim(self):
+        # The main space never exceeds its maximum size, so if the cache is full,
+        # the window is full too and its least recently used item must leave it.
+        if self._main_max_size is not None:
+            while self._window:
+                candidate = _first_value(self._window)
+                if candidate.stored_size > self._main_max_size:
+                    return candidate
+                if self._main_size + candidate.stored_size <= self._main_max_size:
+                    self._admit(candidate)
+                    continue
+                victim = _first_value(self._probation) or _first_value(self._protected)
+                if self._sketch.frequency(candidate.key) > self._sketch.frequency(victim.key):
+                    return victim
+                return candidate
+        return _first_value(self._probation) or _first_value(self._protected) or _first_value(self._window)
+
+    def clear(self):
+        self._window.clear()
+        self._probation.clear()
+        self._protected.clear()
+        self._segments.clear()
+        self._protected_size = 0
+        self._main_size = 0
+
+    def _admit(self, item):
+        del self._window[item.key]
+        self._probation[item.key] = item
+        self._segments[item.key] = self._probation
+        self._main_size += item.stored_size
+
+
+class _FrequencySketch:
+    """
+    A count-min sketch of 4 rows of saturating counters in the range 0 to 15 that estimates the access frequency
+    of keys. After a number of increments that is ten times the width, all counters are halved.
+    """
+
+    _SEEDS = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93)
+    _MAX_COUNT = 15
+    _HALVE_TABLE = bytes(i >> 1 for i in range(256))
+
+    def __init__(self, width: int):
+        width = 1 << max(4, (width - 1).bit_length())
+        self._mask = width - 1
+        self._rows = [bytearray(width) for _ in self._SEEDS]
+        self._sample_size = 10 * width
+        self._count = 0
+
+    def frequency(self, key) -> int:
+        return min(row[index] for row, index in zip(self._rows, self._indexes(key)))
+
+    def increment(self, key):
+        max_count = self._MAX_COUNT
+        for row, index in zip(self._rows, self._indexes(key)):
+            if row[index] < max_count:
+                row[index] += 1
+        self._count += 1
+        if self._count >= self._sample_size:
+            for row in self._rows:
+                row[:] = row.translate(self._HALVE_TABLE)
+            self._count //= 2
+
+    def _indexes(self, key):
+        h = hash(key) & 0xFFFFFFFFFFFFFFFF
+        mask = self._mask
+        return [(x ^ (x >> 32)) & mask for x in ((h * seed) & 0xFFFFFFFFFFFFFFFF for seed in self._SEEDS)]
+
+
+def _first_value(ordered_dict: OrderedDict):
+    for value in ordered_dict.values():
+        return value
+    return None
 
 
 #: Discard Least Recently Used items first
-POLICY_LRU = _policy_lru
+POLICY_LRU = LruCachePolicy
 #: Discard Most Recently Used first
-POLICY_MRU = _policy_mru
+POLICY_MRU = MruCachePolicy
 #: Discard Least Frequently Used first
-POLICY_LFU = _policy_lfu
+POLICY_LFU = LfuCachePolicy
 #: Discard items by Random Replacement
-POLICY_RR = _policy_rr
+POLICY_RR = RrCachePolicy
+#: Admit only items more frequently used than the ones they replace (W-TinyLFU), resistant to scans
+POLICY_TINY_LFU = TinyLfuCachePolicy
 
-_T0 = time.clock()
+_T0 = time.perf_counter()
+
+
+class CacheStats:
+    """
+    Counters of the activity of a :py:class:`Cache` since its creation or the last call of its
+    :py:meth:`Cache.reset_stats` method. Times are given in seconds.
+    """
+
+    def __init__(self):
+        #: The number of calls to :py:meth:`Cache.get_value` that found the value in the cache
+        self.hit_count = 0
+        #: The number of calls to :py:meth:`Cache.get_value` that did not find the value in the cache
+        self.miss_count = 0
+        #: The number of misses for which the value was found in the parent cache
+        self.parent_hit_count = 0
+        #: The number of calls to :py:meth:`Cache.put_value`
+        self.put_count = 0
+        #: The number of items evicted by the replacement policy
+        self.eviction_count = 0
+        #: The total size of evicted items in units used by the cache store
+        self.evicted_size = 0
+        #: Time spent in :py:meth:`Cache.trim`
+        self.trim_time = 0.0
+        #: Time spent storing values in the cache store
+        self.store_time = 0.0
+        #: Time spent loading and restoring values from the cache store
+        self.restore_time = 0.0
+
+    @property
+    def hit_ratio(self) -> float:
+        """The ratio of hits to all calls to :py:meth:`Cache.get_value`, zero if there were no calls."""
+        access_count = self.hit_count + self.miss_count
+        return self.hit_count / access_count if access_count else 0.0
+
+    def copy(self) -> 'CacheStats':
+        stats = CacheStats()
+        stats.__dict__.update(self.__dict__)
+        return stats
+
+    def add(self, other: 'CacheStats'):
+        """
+        Add the counters of *other* to the counters of this object.
+        :param other: other cache statistics
+        """
+        for name, value in other.__dict__.items():
+            setattr(self, name, getattr(self, name) + value)
+
+    def to_dict(self) -> dict:
+        """
+        :return: a JSON-serializable dictionary of all counters including the hit ratio
+        """
+        return dict(self.__dict__, hit_ratio=self.hit_ratio)
 
 
 class Cache:
@@ -254,6 +1129,15 @@ class Cache:
             item._load_from_key(store, key)
             return item
 
+        @staticmethod
+        def load_from_index(key, stored_value, stored_size):
+            item = Cache.Item()
+            item.key = key
+            item.stored_value = stored_value
+            item.stored_size = stored_size
+            item._access()
+            return item
+
         def store(self, store, key, value):
             self.key = key
             self.access_count = 0
@@ -264,6 +1148,7 @@ class Cache:
 
         def restore(self, store, key):
             self._access()
+            store.access_value(key, self.stored_value)
             return store.restore_value(key, self.stored_value)
 
         def discard(self, store, key):
@@ -279,7 +1164,7 @@ class Cache:
             self.stored_size = stored_size
 
         def _access(self):
-            self.access_time = time.clock() - _T0
+            self.access_time = time.perf_counter() - _T0
             self.access_count += 1
 
     def __init__(self, store=MemoryCacheStore(), capacity=1000, threshold=0.75, policy=POLICY_LRU, parent_cache=None):
@@ -289,19 +1174,25 @@ class Cache:
         :param store: the cache store, see CacheStore interface
         :param capacity: the size capacity in units used by the store's store() method
         :param threshold: a number greater than zero and less than one
-        :param policy: cache replacement policy. This is a function that maps a :py:class:`Cache.Item`
-                       to a numerical value. See :py:data:`POLICY_LRU`,
-                       :py:data:`POLICY_MRU`, :py:data:`POLICY_LFU`, :py:data:`POLICY_RR`
+        :param policy: cache replacement policy. Either a :py:class:`CachePolicy` subclass, see
+                       :py:data:`POLICY_LRU`, :py:data:`POLICY_MRU`, :py:data:`POLICY_LFU`, :py:data:`POLICY_RR`,
+                       :py:data:`POLICY_TINY_LFU`, or a :py:class:`CachePolicy` instance, which must not be
+                       used by any other cache.
+                       For backward compatibility, any other callable is taken as a function that maps a
+                       :py:class:`Cache.Item` to a numerical value, see :py:class:`SortKeyCachePolicy`.
         """
         self._store = store
         self._capacity = capacity
         self._threshold = threshold
         self._policy = policy
+        self._policy_impl = _new_cache_policy(policy)
         self._parent_cache = parent_cache
         self._size = 0
         self._max_size = self._capacity * self._threshold
+        self._policy_impl.set_max_size(self._max_size)
+        self._stats = CacheStats()
         self._item_dict = {}
-        self._item_list = []
+        self._is_index_loaded = False
         self._lock = RLock()
 
     @property
@@ -316,143 +1207,502 @@ class Cache:
     def capacity(self):
         return self._capacity
 
+    @capacity.setter
+    def capacity(self, capacity):
+        """Change the capacity. If the cache size exceeds the new maximum size, the cache is trimmed."""
+        with self._lock:
+            self._capacity = capacity
+            self._max_size = capacity * self._threshold
+            self._policy_impl.set_max_size(self._max_size)
+            self.trim()
+
     @property
     def threshold(self):
         return self._threshold
 
     @property
     def size(self):
-        return self._size
+        with self._lock:
+            self._load_index()
+            return self._size
 
     @property
     def max_size(self):
         return self._max_size
 
+    @property
+    def stats(self) -> CacheStats:
+        """A snapshot of this cache's counters."""
+        with self._lock:
+            return self._stats.copy()
+
+    @property
+    def hit_count(self) -> int:
+        """The number of calls to :py:meth:`get_value` that found the value in this cache."""
+        return self._stats.hit_count
+
+    @property
+    def miss_count(self) -> int:
+        """The number of calls to :py:meth:`get_value` that did not find the value in this cache."""
+        return self._stats.miss_count
+
+    @property
+    def hit_ratio(self) -> float:
+        """The ratio of hits to all calls to :py:meth:`get_value`, zero if there were no calls."""
+        return self._stats.hit_ratio
+
+    def reset_stats(self):
+        """Reset all counters, see :py:attr:`stats`."""
+        with self._lock:
+            self._stats = CacheStats()
+
     def get_value(self, key):
-        self._lock.acquire()
-        item = self._item_dict.get(key)
-        value = None
-        restored = False
-        if item:
-            value = item.restore(self._store, key)
-            restored = True
-            if _DEBUG_CACHE:
-                _debug_print('restored value for key "%s" from cache' % key)
-        elif self._parent_cache:
-            item = self._parent_cache.get_value(key)
+        with self._lock:
+            self._load_index()
+            item = self._item_dict.get(key)
             if item:
-                value = item.restore(self._parent_cache.store, key)
-                restored = True
+                value = self._restore_item(item)
+                if value is not None:
+                    self._stats.hit_count += 1
+                    if _DEBUG_CACHE:
+                        _debug_print('restored value for key "%s" from cache' % key)
+                    return value
+                # The stored value is lost, e.g. its file has been deleted outside of this cache
+                self._remove_item(item)
+                item.discard(self._store, key)
                 if _DEBUG_CACHE:
-                    _debug_print('restored value for key "%s" from parent cache' % key)
-        if not restored:
+                    _debug_print('discarded lost value for key "%s" from cache' % key)
+            if self._parent_cache:
+                value = self._parent_cache.get_value(key)
+                if value is not None:
+                    self._stats.miss_count += 1
+                    self._stats.parent_hit_count += 1
+                    if _DEBUG_CACHE:
+                        _debug_print('restored value for key "%s" from parent cache' % key)
+                    return value
+            t0 = time.perf_counter()
             item = Cache.Item.load_from_key(self._store, key)
+            self._stats.restore_time += time.perf_counter() - t0
             if item:
                 self._add_item(item)
-                value = item.restore(self._store, key)
-                if _DEBUG_CACHE:
-                    _debug_print('restored value for key "%s" from cache' % key)
-        self._lock.release()
-        return value
+                value = self._restore_item(item)
+                if value is not None:
+                    self._stats.hit_count += 1
+                    if _DEBUG_CACHE:
+                        _debug_print('restored value for key "%s" from cache' % key)
+                    return value
+                self._remove_item(item)
+                item.discard(self._store, key)
+            self._stats.miss_count += 1
+            return None
+
+    def has_value(self, key) -> bool:
+        """
+        Test whether this cache holds a value for *key*, without restoring the value and without
+        looking into the parent cache or loading the value from the store.
+        :param key: the key
+        :return: True, if so
+        """
+        with self._lock:
+            self._load_index()
+            return key in self._item_dict
 
     def put_value(self, key, value):
-        self._lock.acquire()
-        if self._parent_cache:
-            # remove value from parent cache, because this cache will now take over
-            self._parent_cache.remove_value(key)
-        item = self._item_dict.get(key)
-        if item:
-            self._remove_item(item)
-            item.discard(self._store, key)
+        with self._lock:
+            self._load_index()
+            self._stats.put_count += 1
+            if self._parent_cache:
+                # remove value from parent cache, because this cache will now take over
+                self._parent_cache.remove_value(key)
+            item = self._item_dict.get(key)
+            if item:
+                self._remove_item(item)
+                item.discard(self._store, key)
+                if _DEBUG_CACHE:
+                    _debug_print('discarded value for key "%s" from cache' % key)
+            else:
+                item = Cache.Item()
+            t0 = time.perf_counter()
+            item.store(self._store, key, value)
+            self._stats.store_time += time.perf_counter() - t0
             if _DEBUG_CACHE:
-                _debug_print('discarded value for key "%s" from cache' % key)
-        else:
-            item = Cache.Item()
-        item.store(self._store, key, value)
-        if _DEBUG_CACHE:
-            _debug_print('stored value for key "%s" in cache' % key)
-        self._add_item(item)
-        self._lock.release()
+                _debug_print('stored value for key "%s" in cache' % key)
+            self._add_item(item)
 
     def remove_value(self, key):
-        self._lock.acquire()
-        if self._parent_cache:
-            self._parent_cache.remove_value(key)
-        item = self._item_dict.get(key)
-        if item:
-            self._remove_item(item)
-            item.discard(self._store, key)
-            if _DEBUG_CACHE:
-                _debug_print('cate.util.im.cache.Cache: discarded value for key "%s" from parent cache' % key)
-        self._lock.release()
+        with self._lock:
+            self._load_index()
+            if self._parent_cache:
+                self._parent_cache.remove_value(key)
+            item = self._item_dict.get(key)
+            if item:
+                self._remove_item(item)
+                item.discard(self._store, key)
+                if _DEBUG_CACHE:
+                    _debug_print('discarded value for key "%s" from cache' % key)
+
+    def _load_index(self):
+        if self._is_index_loaded:
+            return
+        self._is_index_loaded = True
+        for key, stored_value, stored_size in self._store.load_index():
+            item = Cache.Item.load_from_index(key, stored_value, stored_size)
+            self._item_dict[key] = item
+            self._policy_impl.add_item(item)
+            self._size += stored_size
+        if self._size > self._max_size:
+            self.trim()
 
     def _add_item(self, item):
-        self._item_dict[item.key] = item
-        self._item_list.append(item)
         if self._size + item.stored_size > self._max_size:
             self.trim(item.stored_size)
+        self._item_dict[item.key] = item
+        self._policy_impl.add_item(item)
         self._size += item.stored_size
 
     def _remove_item(self, item):
         self._item_dict.pop(item.key)
-        self._item_list.remove(item)
+        self._policy_impl.remove_item(item)
         self._size -= item.stored_size
 
+    def _restore_item(self, item):
+        t0 = time.perf_counter()
+        value = item.restore(self._store, item.key)
+        self._stats.restore_time += time.perf_counter() - t0
+        self._policy_impl.access_item(item)
+        return value
+
     def trim(self, extra_size=0):
         if _DEBUG_CACHE:
             _debug_print('trimming...')
-        self._lock.acquire()
-        self._item_list.sort(key=self._policy)
-        keys = []
-        size = self._size
-        max_size = self._max_size
-        for item in self._item_list:
-            if size + extra_size > max_size:
-                keys.append(item.key)
-                size -= item.stored_size
-        self._lock.release()
-        # release lock to give another thread a chance then require lock again
-        self._lock.acquire()
-        for key in keys:
-            if self._parent_cache:
-                # Before discarding item fully, put its value into the parent cache
-                value = self.get_value(key)
-                self.remove_value(key)
-                if value:
-                    self._parent_cache.put_value(key, value)
-            else:
-                self.remove_value(key)
-        self._lock.release()
+        with self._lock:
+            self._load_index()
+            t0 = time.perf_counter()
+            while self._size + extra_size > self._max_size:
+                item = self._policy_impl.next_victim()
+                if item is None:
+                    break
+                key = item.key
+                self._remove_item(item)
+                self._stats.eviction_count += 1
+                self._stats.evicted_size += item.stored_size
+                if self._parent_cache:
+                    # Before discarding item fully, put its value into the parent cache
+                    value = item.restore(self._store, key)
+                    item.discard(self._store, key)
+                    if value is not None:
+                        self._parent_cache.put_value(key, value)
+                else:
+                    item.discard(self._store, key)
+                if _DEBUG_CACHE:
+                    _debug_print('evicted value for key "%s" from cache' % key)
+            self._stats.trim_time += time.perf_counter() - t0
 
     def clear(self, clear_parent=True):
-        self._lock.acquire()
-        if self._parent_cache and clear_parent:
-            self._parent_cache.clear(clear_parent)
-        keys = list(self._item_dict.keys())
-        self._lock.release()
+        with self._lock:
+            self._load_index()
+            if self._parent_cache and clear_parent:
+                self._parent_cache.clear(clear_parent)
+            if (not self._parent_cache or clear_parent) and self._store.clear():
+                # Fast path: store discarded all values at once
+                for item in self._item_dict.values():
+                    item.__init__()
+                self._item_dict.clear()
+                self._policy_impl.clear()
+                self._size = 0
+                return
+            keys = list(self._item_dict.keys())
         for key in keys:
             if self._parent_cache and not clear_parent:
                 value = self.get_value(key)
-                if value:
+                if value is not None:
                     self._parent_cache.put_value(key, value)
             self.remove_value(key)
 
 
+class ShardedCache:
+    """
+    A cache that distributes its keys by their hash values onto *num_shards* independent :py:class:`Cache` shards.
+    Every shard has its own lock and replacement policy and gets an equal share of the total *capacity*.
+    This reduces lock contention when the cache is accessed concurrently from many threads,
+    e.g. when computing image tiles in a thread pool.
+
+    A sharded cache has the same interface as :py:class:`Cache`. The *size* is the sum of all shard sizes.
+    Stores that maintain an index of their values (see :py:meth:`CacheStore.load_index`) cannot be shared by shards.
+
+    :param store: the cache store, see CacheStore interface. It is shared by all shards.
+    :param capacity: the total size capacity in units used by the store's store() method
+    :param threshold: a number greater than zero and less than one
+    :param policy: cache replacement policy, see :py:class:`Cache`. Must not be a :py:class:`CachePolicy` instance,
+           because every shard creates a policy of its own.
+    :param parent_cache: optional parent cache shared by all shards
+    :param num_shards: the number of shards
+    """
+
+    def __init__(self, store=MemoryCacheStore(), capacity=1000, threshold=0.75, policy=POLICY_LRU, parent_cache=None,
+                 num_shards=16):
+        if num_shards < 1:
+            raise ValueError('num_shards must be greater than zero')
+        if isinstance(policy, CachePolicy):
+            # Every shard needs a policy of its own
+            raise ValueError('policy must be a CachePolicy class or a sort key function, not an instance')
+        self._store = store
+        self._capacity = capacity
+        self._threshold = threshold
+        self._policy = policy
+        self._parent_cache = parent_cache
+        self._shards = [Cache(store=store,
+                              capacity=capacity / num_shards,
+                              threshold=threshold,
+                              policy=policy,
+                              parent_cache=parent_cache) for _ in range(num_shards)]
+
+    @property
+    def policy(self):
+        return self._policy
+
+    @property
+    def store(self):
+        return self._store
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @capacity.setter
+    def capacity(self, capacity):
+        """Change the total capacity, which is divided equally among the shards."""
+        self._capacity = capacity
+        for shard in self._shards:
+            shard.capacity = capacity / len(self._shards)
+
+    @property
+    def threshold(self):
+        return self._threshold
+
+    @property
+    def size(self):
+        return sum(shard.size for shard in self._shards)
+
+    @property
+    def max_size(self):
+        return sum(shard.max_size for shard in self._shards)
+
+    @property
+    def stats(self) -> CacheStats:
+        stats = CacheStats()
+        for shard in self._shards:
+            stats.add(shard.stats)
+        return stats
+
+    @property
+    def hit_count(self) -> int:
+        return sum(shard.hit_count for shard in self._shards)
+
+    @property
+    def miss_count(self) -> int:
+        return sum(shard.miss_count for shard in self._shards)
+
+    @property
+    def hit_ratio(self) -> float:
+        return self.stats.hit_ratio
+
+    def reset_stats(self):
+        for shard in self._shards:
+            shard.reset_stats()
+
+    @property
+    def num_shards(self):
+        return len(self._shards)
+
+    @property
+    def shards(self):
+        return list(self._shards)
+
+    def get_shard(self, key) -> Cache:
+        """
+        :param key: the key
+        :return: the shard responsible for the given key
+        """
+        return self._shards[hash(key) % len(self._shards)]
+
+    def get_value(self, key):
+        return self.get_shard(key).get_value(key)
+
+    def has_value(self, key) -> bool:
+        return self.get_shard(key).has_value(key)
+
+    def put_value(self, key, value):
+        self.get_shard(key).put_value(key, value)
+
+    def remove_value(self, key):
+        self.get_shard(key).remove_value(key)
+
+    def trim(self, extra_size=0):
+        for shard in self._shards:
+            shard.trim(extra_size / len(self._shards))
+
+    def clear(self, clear_parent=True):
+        for shard in self._shards:
+            shard.clear(clear_parent=clear_parent)
+
+
+def _new_cache_policy(policy) -> CachePolicy:
+    if isinstance(policy, CachePolicy):
+        return policy
+    if isinstance(policy, type) and issubclass(policy, CachePolicy):
+        return policy()
+    if callable(policy):
+        return SortKeyCachePolicy(policy)
+    raise ValueError('policy must be a CachePolicy or a callable')
+
+
 def _debug_print(msg):
     print("cate.util.cache.Cache:", msg)
 
 
-def _compute_object_size(obj):
-    if hasattr(obj, 'nbytes'):
-        # A numpy ndarray instance
-        return obj.nbytes
-    elif hasattr(obj, 'size') and hasattr(obj, 'mode'):
-        # A PIL Image instance
-        w, h = obj.size
-        m = obj.mode
-        return w * h * (4 if m in ('RGBA', 'RGBx', 'I', 'F') else
-                        3 if m in ('RGB', 'YCbCr', 'LAB', 'HSV') else
-                        1. / 8. if m == '1' else
-                        1)
-    else:
-        return sys.getsizeof(obj)
+def register_object_sizer(obj_type, sizer: Callable[[Any], int]):
+    """
+    Register a function that computes the size in bytes of objects of the given type, see
+    :py:func:`compute_object_size`. A sizer registered for a type is also used for its subclasses,
+    unless a sizer is registered for the subclass itself.
+
+    :param obj_type: the object type or its fully qualified name, e.g. ``"numpy.ndarray"``.
+           Passing a name avoids importing optional packages.
+    :param sizer: a function that takes an object and returns its size in bytes
+    """
+    if isinstance(obj_type, type):
+        obj_type = _qualified_type_name(obj_type)
+    _OBJECT_SIZERS[obj_type] = sizer
+    _RESOLVED_OBJECT_SIZERS.clear()
+
+
+def compute_object_size(obj) -> int:
+    """
+    Compute the number of bytes of memory kept alive by the given object.
+    Uses the sizer registered for the object's type, see :py:func:`register_object_sizer`,
+    or ``sys.getsizeof()`` if there is none.
+
+    Sizers are registered for numpy arrays, including masked arrays and views, which keep the whole buffer of
+    their base object alive, ``memoryview`` objects, PIL images, pandas indexes, xarray variables,
+    data arrays and datasets, and dask arrays, for which only data embedded in their task graphs are counted.
+
+    :param obj: the object
+    :return: the size in bytes
+    """
+    obj_type = type(obj)
+    sizer = _RESOLVED_OBJECT_SIZERS.get(obj_type)
+    if sizer is None:
+        sizer = sys.getsizeof
+        for cls in obj_type.__mro__:
+            registered_sizer = _OBJECT_SIZERS.get(_qualified_type_name(cls))
+            if registered_sizer is not None:
+                sizer = registered_sizer
+                break
+        _RESOLVED_OBJECT_SIZERS[obj_type] = sizer
+    return sizer(obj)
+
+
+def _qualified_type_name(cls: type) -> str:
+    return cls.__module__ + '.' + cls.__qualname__
+
+
+def _sizeof_memoryview(view) -> int:
+    # A memoryview keeps its whole underlying object alive
+    return sys.getsizeof(view) + compute_object_size(view.obj)
+
+
+def _sizeof_ndarray(array) -> int:
+    # sys.getsizeof() includes the data buffer only if the array owns it.
+    # A view keeps the whole buffer of its base object alive.
+    base = _get_base_object(array)
+    if base is array:
+        return sys.getsizeof(array)
+    return sys.getsizeof(array) + compute_object_size(base)
+
+
+def _get_base_object(array):
+    base = array
+    while getattr(base, 'base', None) is not None:
+        base = base.base
+    return base
+
+
+def _sizeof_masked_array(array) -> int:
+    size = _sizeof_ndarray(array)
+    mask = array._mask
+    # If there is no mask, it is the shared numpy.ma.nomask scalar
+    if mask.ndim > 0:
+        size += _sizeof_ndarray(mask)
+    return size
+
+
+def _sizeof_pil_image(image) -> int:
+    # PIL stores pixels of all multi-band and 32-bit modes in 4 bytes
+    width, height = image.size
+    mode = image.mode
+    pixel_size = 1 if mode in ('1', 'L', 'P') else 2 if mode.startswith('I;16') else 4
+    return sys.getsizeof(image) + width * height * pixel_size
+
+
+def _sizeof_pandas_index(index) -> int:
+    return sys.getsizeof(index) + index.memory_usage()
+
+
+def _sizeof_dask_array(array) -> int:
+    # A dask array is not computed, only its task graph is kept in memory. The graph may embed arrays,
+    # e.g. if the dask array has been created by dask.array.from_array().
+    # Chunks of such arrays are views that share the buffer of one base object, which is counted once.
+    size = sys.getsizeof(array)
+    base_ids = set()
+    for value in array.__dask_graph__().values():
+        if hasattr(value, 'nbytes') and hasattr(value, '__array__'):
+            base = _get_base_object(value)
+            if base is not value:
+                size += sys.getsizeof(value)
+            if id(base) not in base_ids:
+                base_ids.add(id(base))
+                size += compute_object_size(base)
+    return size
+
+
+def _sizeof_xarray_variable(variable) -> int:
+    # Use the private "_data" attribute, because "data" and "values" would load lazily loaded data.
+    data = variable._data
+    # Unwrap xarray's array adapters, e.g. the one wrapping the pandas index of a coordinate variable
+    while type(data).__module__.startswith('xarray.') and hasattr(data, 'array'):
+        data = data.array
+    if type(data).__module__.startswith('xarray.'):
+        # Data not loaded yet
+        return sys.getsizeof(variable)
+    return sys.getsizeof(variable) + compute_object_size(data)
+
+
+def _sizeof_xarray_data_array(data_array) -> int:
+    return sys.getsizeof(data_array) + _sizeof_xarray_variables(data_array.variable,
+                                                                 *data_array.coords.variables.values())
+
+
+def _sizeof_xarray_dataset(dataset) -> int:
+    return sys.getsizeof(dataset) + _sizeof_xarray_variables(*dataset.variables.values())
+
+
+def _sizeof_xarray_variables(*variables) -> int:
+    return sum(_sizeof_xarray_variable(variable) for variable in variables)
+
+
+# Maps qualified type names to sizers
+_OBJECT_SIZERS = {
+    'builtins.memoryview': _sizeof_memoryview,
+    'numpy.ndarray': _sizeof_ndarray,
+    'numpy.ma.core.MaskedArray': _sizeof_masked_array,
+    'PIL.Image.Image': _sizeof_pil_image,
+    'pandas.core.indexes.base.Index': _sizeof_pandas_index,
+    'dask.array.core.Array': _sizeof_dask_array,
+    'xarray.core.variable.Variable': _sizeof_xarray_variable,
+    'xarray.core.dataarray.DataArray': _sizeof_xarray_data_array,
+    'xarray.core.dataset.Dataset': _sizeof_xarray_dataset,
+}
+
+# Maps types to sizers resolved from _OBJECT_SIZERS
+_RESOLVED_OBJECT_SIZERS = dict()
@@ -49,6 +49,8 @@ Components
 from .cmaps import get_cmaps
 from .geoextent import GeoExtent
 from .image import *
+from .prefetch import TilePrefetcher
+from .stats import compute_array_statistics
 from .tilingscheme import TilingScheme
 from .utils import *
 
@@ -20,6 +20,7 @@
 # SOFTWARE.
 
 import os
+from typing import List, Optional
 
 from ..geoextent import GeoExtent
 from ..image import AbstractTiledImage, ImagePyramid
@@ -41,7 +42,7 @@ class NaturalEarth2Image(AbstractTiledImage):
     TILE_SIZE = 256
 
     @staticmethod
-    def get_pyramid():
+    def get_pyramid(preload: bool = False):
         """
         Return an instance of a 'Natural Earth v2' image pyramid:
         * global coverage
@@ -49,6 +50,9 @@ class NaturalEarth2Image(AbstractTiledImage):
         * 3 levels of detail: 0 to 2
         * tile size: 256 pixels
         * 2 x 1 tiles on level zero
+
+        :param preload: whether all tiles are read into memory at once, about 470 KB, so that getting
+               a tile requires no file system access. Otherwise, every tile is read when requested.
         """
         dir_path = os.path.join(os.path.dirname(__file__), 'NaturalEarth2')
         return ImagePyramid(TilingScheme(NaturalEarth2Image.NUM_LEVELS,
@@ -57,9 +61,10 @@ class NaturalEarth2Image(AbstractTiledImage):
                                          NaturalEarth2Image.TILE_SIZE,
                                          NaturalEarth2Image.TILE_SIZE,
                                          GeoExtent()),
-                            [NaturalEarth2Image(dir_path, level) for level in range(NaturalEarth2Image.NUM_LEVELS)])
+                            [NaturalEarth2Image(dir_path, level, preload=preload)
+                             for level in range(NaturalEarth2Image.NUM_LEVELS)])
 
-    def __init__(self, dir_path, z_index):
+    def __init__(self, dir_path, z_index, preload: bool = False):
         factor = 1 << z_index
         num_tiles_x = factor * NaturalEarth2Image.NUM_LEVEL_0_TILES_X
         num_tiles_y = factor * NaturalEarth2Image.NUM_LEVEL_0_TILES_Y
@@ -69,8 +74,23 @@ class NaturalEarth2Image(AbstractTiledImage):
         super().__init__((num_tiles_x * tile_size, num_tiles_y * tile_size),
                          tile_size=(tile_size, tile_size),
                          num_tiles=(num_tiles_x, num_tiles_y), format='JPEG', mode='RGB')
+        # The tiles in row-major order, if preloaded
+        self._tiles = self._read_tiles() if preload else None  # type: Optional[List[bytes]]
 
     def get_tile(self, tile_x, tile_y):
+        if self._tiles is not None:
+            num_tiles_x, num_tiles_y = self.num_tiles
+            if not (0 <= tile_x < num_tiles_x and 0 <= tile_y < num_tiles_y):
+                raise IndexError('tile (%d, %d) out of range' % (tile_x, tile_y))
+            # Immutable bytes, which Tornado writes without copying
+            return self._tiles[tile_y * num_tiles_x + tile_x]
+        return self._read_tile(tile_x, tile_y)
+
+    def _read_tiles(self) -> List[bytes]:
+        num_tiles_x, num_tiles_y = self.num_tiles
+        return [self._read_tile(tile_x, tile_y) for tile_y in range(num_tiles_y) for tile_x in range(num_tiles_x)]
+
+    def _read_tile(self, tile_x, tile_y) -> bytes:
         num_tiles_y = self.num_tiles[1]
         path = '%s/%d/%d.jpg' % (self._base_path, tile_x, num_tiles_y - 1 - tile_y)
         with open(path, 'rb') as fp:
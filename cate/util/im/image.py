@@ -20,9 +20,12 @@
 # SOFTWARE.
 
 import io
+import os.path
 import time
 import uuid
 from abc import ABCMeta, abstractmethod
+from concurrent.futures import Future
+from threading import Lock
 from typing import Tuple, Sequence, Union, Any, Callable, Optional
 
 import matplotlib.cm as cm
@@ -31,12 +34,14 @@ from PIL import Image
 
 from .geoextent import GeoExtent
 from .tilingscheme import TilingScheme
-from .utils import downsample_ndarray, aggregate_ndarray_first
+from .utils import downsample_ndarray, downsample_ndarray_2x2, aggregate_ndarray_first, aggregate_ndarray_min, \
+    aggregate_ndarray_max, aggregate_ndarray_sum, aggregate_ndarray_mean, aggregate_ndarray_nanmean
 from ..cache import Cache, MemoryCacheStore
 
 __author__ = "Norman Fomferra (Brockmann Consult GmbH)"
 
 _DEFAULT_TILE_CACHE = None
+_CMAP_LUTS = {}
 _DEBUG_OP_IMAGE = True
 
 X = int
@@ -54,6 +59,10 @@ LevelMapper = Callable[['TiledImage', int, Optional[Any]], 'TiledImage']
 TileAggregator = Callable[[Tile, Tile, Tile, Tile], Tile]
 LevelImageIdFactory = Callable[[int], str]
 
+#: Overview modes, see :py:class:`OverviewArrays`
+OVERVIEW_MODE_NEAREST = 'nearest'
+OVERVIEW_MODE_MEAN = 'mean'
+
 
 def set_default_tile_cache(cache=None, no_cache=False, capacity=64 * 1024 * 1024, threshold=0.75):
     global _DEFAULT_TILE_CACHE
@@ -209,6 +218,9 @@ class OpImage(AbstractTiledImage, metaclass=ABCMeta):
     An abstract base class for images that compute their tiles.
     Derived classes must implement the compute_tile(tile_x, tile_y, rect) method only.
 
+    Concurrent requests for the same tile are coalesced: while a tile is being computed,
+    other threads requesting it wait for and receive the first computation's result (or exception).
+
     :param size: the image size as (width, height)
     :param tile_size: optional tile size as (tile_width, tile_height)
     :param num_tiles: optional number of tiles as (num_tiles_x, num_tiles_y)
@@ -222,36 +234,77 @@ class OpImage(AbstractTiledImage, metaclass=ABCMeta):
                  mode: str = None, format: str = None, image_id: str = None, tile_cache: Cache = None):
         super().__init__(size, tile_size, num_tiles, mode=mode, format=format, image_id=image_id)
         self._tile_cache = tile_cache if tile_cache is not None else get_default_tile_cache()
+        self._pending_tiles = dict()
+        self._pending_tiles_lock = Lock()
+        # IDs of the tiles this image has put into the tile cache, see dispose(), guarded by _pending_tiles_lock
+        self._cached_tile_ids = set()
+        self._max_num_cached_tile_ids = 64
 
     @property
     def tile_cache(self) -> Cache:
         return self._tile_cache
 
     def get_tile(self, tile_x: int, tile_y: int) -> Tile:
-        t0 = 0
-        tile_id = None
+        tile_id = self.get_tile_id(tile_x, tile_y)
+        tile = self._get_cached_tile(tile_id)
+        if tile is not None:
+            return tile
+
+        with self._pending_tiles_lock:
+            pending_tile = self._pending_tiles.get(tile_id)
+            is_computing_thread = pending_tile is None
+            if is_computing_thread:
+                pending_tile = Future()
+                self._pending_tiles[tile_id] = pending_tile
+
+        if not is_computing_thread:
+            # Another thread is already computing this tile, wait for its result
+            return pending_tile.result()
+
+        try:
+            # The tile may have been computed and cached since we last looked
+            tile = self._get_cached_tile(tile_id)
+            if tile is None:
+                tile = self._compute_and_cache_tile(tile_x, tile_y, tile_id)
+            pending_tile.set_result(tile)
+        except BaseException as e:
+            pending_tile.set_exception(e)
+            raise
+        finally:
+            with self._pending_tiles_lock:
+                del self._pending_tiles[tile_id]
+        return tile
+
+    def _get_cached_tile(self, tile_id: str) -> Optional[Tile]:
         cache = self._tile_cache
-        if cache:
-            tile_id = self.get_tile_id(tile_x, tile_y)
-            if _DEBUG_OP_IMAGE:
-                t0 = time.clock()
-            tile = cache.get_value(tile_id)
-            if tile is not None:
-                if _DEBUG_OP_IMAGE:
-                    print('tile "%s": restored from cache, took %.4f sec' % (tile_id, time.clock() - t0))
-                return tile
+        if not cache:
+            return None
+        t0 = time.perf_counter()
+        tile = cache.get_value(tile_id)
+        if tile is not None and _DEBUG_OP_IMAGE:
+            print('tile "%s": restored from cache, took %.4f sec' % (tile_id, time.perf_counter() - t0))
+        return tile
+
+    def _compute_and_cache_tile(self, tile_x: int, tile_y: int, tile_id: str) -> Tile:
         tw, th = self.tile_size
-        if _DEBUG_OP_IMAGE:
-            t0 = time.clock()
+        t0 = time.perf_counter()
         tile = self.compute_tile(tile_x, tile_y, (tw * tile_x, th * tile_y, tw, th))
         if _DEBUG_OP_IMAGE:
-            print('tile "%s": computed, took %.4f sec' % (self.get_tile_id(tile_x, tile_y), time.clock() - t0))
+            print('tile "%s": computed, took %.4f sec' % (tile_id, time.perf_counter() - t0))
+        cache = self._tile_cache
         if cache:
-            if _DEBUG_OP_IMAGE:
-                t0 = time.clock()
+            t0 = time.perf_counter()
             cache.put_value(tile_id, tile)
+            if not cache.store.is_persistent:
+                with self._pending_tiles_lock:
+                    self._cached_tile_ids.add(tile_id)
+                    if len(self._cached_tile_ids) > self._max_num_cached_tile_ids:
+                        # Forget the tiles the cache has evicted meanwhile
+                        self._cached_tile_ids = {tile_id for tile_id in self._cached_tile_ids
+                                                 if cache.has_value(tile_id)}
+                        self._max_num_cached_tile_ids = max(64, 2 * len(self._cached_tile_ids))
             if _DEBUG_OP_IMAGE:
-                print('tile "%s": stored in cache, took %.4f sec' % (tile_id, time.clock() - t0))
+                print('tile "%s": stored in cache, took %.4f sec' % (tile_id, time.perf_counter() - t0))
         return tile
 
     @abstractmethod
@@ -259,12 +312,19 @@ class OpImage(AbstractTiledImage, metaclass=ABCMeta):
         pass
 
     def dispose(self) -> None:
+        """
+        Remove the tiles this image has computed from its tile cache, unless the cache's store is persistent.
+        Tiles in persistent stores, e.g. files, are meant to be reused by later processes.
+        """
         cache = self._tile_cache
+        with self._pending_tiles_lock:
+            tile_ids = self._cached_tile_ids
+            self._cached_tile_ids = set()
         if cache:
-            num_tiles_x, num_tiles_y = self.num_tiles
-            for tile_y in range(num_tiles_y):
-                for tile_x in range(num_tiles_x):
-                    cache.remove_value(self.get_tile_id(tile_x, tile_y))
+            for tile_id in tile_ids:
+                # Skip the tiles the cache has evicted meanwhile
+                if cache.has_value(tile_id):
+                    cache.remove_value(tile_id)
 
 
 class DecoratorImage(OpImage, metaclass=ABCMeta):
@@ -391,8 +451,14 @@ class ColorMappedRgbaImage(DecoratorImage):
     :param num_colors: Number of colors
     :param no_data_value: No-data value
     :param encode: Whether to create tiles that are encoded image bytes according to *format*.
-    :param format: Image format, e.g. "JPEG", "PNG"
+    :param format: Image format, e.g. "JPEG", "PNG", "WEBP"
     :param tile_cache: optional tile cache
+    :param palette: Whether to encode PNG tiles as palette images whose palette is the color map.
+           As one palette entry is reserved for transparent no-data pixels, at most 255 colors are used.
+    :param compress_level: Optional zlib compression level from 0 to 9 used to encode PNG tiles.
+           Lower levels encode faster but produce larger tiles. Defaults to 6.
+    :param quality: Optional quality from 0 to 100 used to encode lossy WEBP and JPEG tiles.
+           If not given, WEBP tiles are lossless.
     """
 
     def __init__(self,
@@ -404,63 +470,131 @@ class ColorMappedRgbaImage(DecoratorImage):
                  no_data_value: Union[int, float] = None,
                  encode: bool = False,
                  format: str = None,
-                 tile_cache=None):
+                 tile_cache=None,
+                 palette: bool = False,
+                 compress_level: int = None,
+                 quality: int = None):
         super().__init__(source_image, image_id=image_id, format=format, mode='RGBA', tile_cache=tile_cache)
+        self._palette = palette and encode and format is not None and format.upper() == 'PNG'
+        if self._palette:
+            num_colors = min(num_colors, 255)
         self._value_range = value_range
         self._cmap_name = cmap_name if cmap_name else 'jet'
-        self._cmap = cm.get_cmap(self._cmap_name, num_colors)
-        self._cmap.set_bad('k', 0)
+        self._num_colors = num_colors
+        self._cmap_lut = get_cmap_lut(self._cmap_name, num_colors)
         self._no_data_value = no_data_value
         self._encode = encode
+        self._save_options = {}
+        if encode and format:
+            if format.upper() == 'PNG':
+                if compress_level is not None:
+                    self._save_options['compress_level'] = compress_level
+            elif format.upper() == 'WEBP':
+                if quality is not None:
+                    self._save_options['quality'] = quality
+                else:
+                    self._save_options['lossless'] = True
+            elif quality is not None:
+                self._save_options['quality'] = quality
 
     def compute_tile_from_source_tile(self,
                                       tile_x: int, tile_y: int,
                                       rectangle: Rectangle2D, source_tile: Tile) -> Tile:
-        value_min, value_max = self._value_range
-        if not np.ma.is_masked(source_tile):
+        if np.ma.isMaskedArray(source_tile):
+            data = source_tile.data
+            mask = np.ma.getmaskarray(source_tile)
+        else:
+            data = np.asarray(source_tile)
             if self._no_data_value is not None:
-                array = np.ma.masked_equal(source_tile, self._no_data_value)
-                array = array.clip(value_min, value_max, out=array)
-            elif np.issubdtype(source_tile.dtype, float) or np.issubdtype(source_tile.dtype, complex):
-                array = np.ma.masked_invalid(source_tile)
-                array = array.clip(value_min, value_max, out=array)
+                mask = data == self._no_data_value
+            elif np.issubdtype(data.dtype, np.floating):
+                mask = ~np.isfinite(data)
             else:
-                array = source_tile.clip(value_min, value_max)
-        else:
-            array = source_tile.clip(value_min, value_max)
+                mask = None
 
-        old_shape = array.shape
+        old_shape = data.shape
         height = old_shape[-2]
         width = old_shape[-1]
-        if width * height == array.size:
-            array = np.reshape(array, (height, width))
+        if width * height == data.size:
+            data = np.reshape(data, (height, width))
+            mask = np.reshape(mask, (height, width)) if mask is not None else None
         else:
             # noinspection PyTypeChecker
-            index = [0] * (array.ndim - 2) + [slice(None), slice(None)]
-            array = array[index]
-
-        # check if we can optimize the following calls by using Numexpr
-        # see https://github.com/pydata/numexpr/wiki/Numexpr-Users-Guide
-        array -= value_min
-        array *= 1.0 / (value_max - value_min)
-        array = self._cmap(array, bytes=True)
-        image = Image.fromarray(array, mode=self.mode)
+            index = tuple([0] * (data.ndim - 2) + [slice(None), slice(None)])
+            data = data[index]
+            mask = mask[index] if mask is not None else None
+
+        indices = self._get_color_indices(data, mask)
+        if self._palette:
+            image = Image.fromarray(indices, mode='P')
+            image.putpalette(self._cmap_lut[:, 0:3].tobytes())
+            # Written as PNG tRNS chunk
+            image.info['transparency'] = self._cmap_lut[:, 3].tobytes()
+        else:
+            array = self._cmap_lut[indices]
+            image = Image.fromarray(array, mode=self.mode)
 
         if self._encode and self.format:
             ostream = io.BytesIO()
-            image.save(ostream, format=self.format)
+            image.save(ostream, format=self.format, **self._save_options)
             encoded_image = ostream.getvalue()
             ostream.close()
             return encoded_image
         else:
             return image
 
+    def _get_color_indices(self, data: np.ndarray, mask: Optional[np.ndarray]) -> np.ndarray:
+        """
+        Quantise *data* into indices into the color map's LUT. Masked and NaN values map to the last LUT entry.
+        The arithmetic is the same as in ``matplotlib.colors.Colormap.__call__()``, so that colors are identical,
+        but with a single floating point temporary.
+        """
+        value_min, value_max = self._value_range
+        num_colors = self._num_colors
+        dtype = data.dtype if np.issubdtype(data.dtype, np.floating) else np.float64
+        values = np.array(data, dtype=dtype)
+        scale = 1.0 / (value_max - value_min) if value_max != value_min else 0.0
+        with np.errstate(invalid='ignore'):
+            np.clip(values, value_min, value_max, out=values)
+            # Like masked array arithmetic, offset and scale in double precision
+            np.subtract(values, value_min, out=values, dtype=np.float64, casting='unsafe')
+            np.multiply(values, scale, out=values, dtype=np.float64, casting='unsafe')
+            values *= num_colors
+            np.minimum(values, num_colors - 1, out=values)
+        bad = np.isnan(values)
+        if mask is not None:
+            bad |= mask
+        values[bad] = num_colors
+        return values.astype(np.uint16 if num_colors >= 256 else np.uint8)
+
     def create_pyramid(self, **kwargs) -> 'ImagePyramid':
         if self._encode:
             raise TypeError("can't create pyramid from encoded hi-res tiles")
         return ImagePyramid.create_from_image(self, create_pil_downsampling_image, **kwargs)
 
 
+def get_cmap_lut(cmap_name: str, num_colors: int = 256) -> np.ndarray:
+    """
+    Get the look-up table (LUT) of a Matplotlib color map as a ``(num_colors + 1, 4)`` array of RGBA bytes.
+    The last entry is the fully transparent color used for masked values.
+    LUTs are computed once per color map name and number of colors.
+
+    :param cmap_name: A Matplotlib color map name
+    :param num_colors: Number of colors
+    :return: the LUT, must not be modified
+    """
+    key = (cmap_name, num_colors)
+    lut = _CMAP_LUTS.get(key)
+    if lut is None:
+        cmap = cm.get_cmap(cmap_name, num_colors)
+        lut = np.empty((num_colors + 1, 4), dtype=np.uint8)
+        lut[:num_colors] = cmap(np.arange(num_colors), bytes=True)
+        lut[num_colors] = 0
+        lut.flags.writeable = False
+        _CMAP_LUTS[key] = lut
+    return lut
+
+
 class DownsamplingImage(OpImage):
     """
     Abstract base class for images that downsample a tiled source image.
@@ -557,9 +691,11 @@ class NdarrayDownsamplingImage(DownsamplingImage):
     :param source_image: a tiled source image (type TiledImage) whose source tiles must be PIL Images
     :param image_id: optional unique image identifier
     :param tile_cache: an optional tile cache
-    :param aggregator: an aggregator function which will be called like so:
-            aggregator(downsampled_tile_00, downsampled_tile_01, downsampled_tile_10, downsampled_tile_11).
-            see utils.downsample_ndarray() function
+    :param aggregator: either the name of a NaN- and mask-aware downsampling method, see
+            utils.downsample_ndarray_2x2() function, or an aggregator function which will be called like so:
+            aggregator(downsampled_tile_00, downsampled_tile_01, downsampled_tile_10, downsampled_tile_11),
+            see utils.downsample_ndarray() function. The aggregator functions of module utils are replaced
+            by their downsampling method.
     """
 
     def __init__(self,
@@ -569,8 +705,11 @@ class NdarrayDownsamplingImage(DownsamplingImage):
                  aggregator=aggregate_ndarray_first):
         super().__init__(source_image, image_id=image_id, tile_cache=tile_cache)
         self._aggregator = aggregator
+        self._method = aggregator if isinstance(aggregator, str) else _AGGREGATOR_METHODS.get(aggregator)
 
     def aggregate_and_stitch_source_tiles(self, source_tiles: TileQuad, target_size: Size2D, target_positions) -> Tile:
+        if self._method is not None:
+            return self._downsample_and_stitch_source_tiles(source_tiles, target_size, target_positions)
         prototype_tile = source_tiles[0]
         agg_tiles = [downsample_ndarray(source_tile, aggregator=self._aggregator) for source_tile in source_tiles]
         target_shape = list(prototype_tile.shape)
@@ -589,6 +728,37 @@ class NdarrayDownsamplingImage(DownsamplingImage):
             target_tile[..., agg_y:agg_y + agg_h, agg_x:agg_x + agg_w] = agg_tile
         return target_tile
 
+    def _downsample_and_stitch_source_tiles(self, source_tiles: TileQuad, target_size: Size2D, target_positions):
+        prototype_tile = source_tiles[0]
+        target_shape = prototype_tile.shape[:-2] + (target_size[1], target_size[0])
+        dtype = prototype_tile.dtype
+        if self._method == 'mean' and not np.issubdtype(dtype, np.floating):
+            dtype = np.float64
+        # Aggregated source tiles are written directly into the target tile
+        target_data = np.empty(target_shape, dtype=dtype)
+        is_masked = any(np.ma.isMaskedArray(source_tile) for source_tile in source_tiles)
+        target_mask = np.zeros(target_shape, dtype=np.bool_) if is_masked else None
+        for source_tile, (agg_x, agg_y) in zip(source_tiles, target_positions):
+            agg_h, agg_w = source_tile.shape[-2] // 2, source_tile.shape[-1] // 2
+            region = (Ellipsis, slice(agg_y, agg_y + agg_h), slice(agg_x, agg_x + agg_w))
+            downsample_ndarray_2x2(source_tile,
+                                   method=self._method,
+                                   out=target_data[region],
+                                   out_mask=target_mask[region] if is_masked else None)
+        if is_masked:
+            return np.ma.MaskedArray(target_data, mask=target_mask)
+        return target_data
+
+
+_AGGREGATOR_METHODS = {
+    aggregate_ndarray_first: 'first',
+    aggregate_ndarray_min: 'min',
+    aggregate_ndarray_max: 'max',
+    aggregate_ndarray_sum: 'sum',
+    aggregate_ndarray_mean: 'mean',
+    aggregate_ndarray_nanmean: 'mean',
+}
+
 
 class FastNdarrayDownsamplingImage(OpImage):
     """
@@ -663,6 +833,145 @@ class FastNdarrayDownsamplingImage(OpImage):
         return tile
 
 
+class OverviewArrays:
+    """
+    The overviews of a numpy ndarray-like array, i.e. arrays whose resolution is reduced by factors 2, 4, 8, ...
+    with respect to the array's last two dimensions.
+
+    Overviews are computed lazily and only once: overview ``level`` is computed from overview ``level - 1``
+    in blocks of rows, so that the source array is read only once and in parts. Computed overviews are
+    kept in memory or, if *overview_dir* is given, in memory-mapped ``.npy`` files in that directory.
+    In memory, all overviews together take about a third of the size of the array.
+
+    :param array: a numpy ndarray-like array, e.g. a ``xarray.DataArray``
+    :param mode: the aggregation mode, either ``'nearest'`` (pick the upper left pixel of each 2x2 block) or
+           ``'mean'`` (mean of the valid pixels of each 2x2 block, ignoring NaN and *no_data_value*)
+    :param no_data_value: optional no-data value ignored by the ``'mean'`` mode
+    :param block_height: the maximum number of rows of a source array read at once
+    :param overview_dir: optional directory for memory-mapped overview files
+    """
+
+    def __init__(self,
+                 array,
+                 mode: str = OVERVIEW_MODE_NEAREST,
+                 no_data_value: Number = None,
+                 block_height: int = 512,
+                 overview_dir: str = None):
+        if mode not in (OVERVIEW_MODE_NEAREST, OVERVIEW_MODE_MEAN):
+            raise ValueError('illegal overview mode "%s", must be one of "%s", "%s"'
+                             % (mode, OVERVIEW_MODE_NEAREST, OVERVIEW_MODE_MEAN))
+        if block_height < 2:
+            raise ValueError('block_height must be at least 2')
+        self._array = array
+        self._mode = mode
+        self._no_data_value = no_data_value
+        self._block_height = block_height
+        self._overview_dir = overview_dir
+        if mode == OVERVIEW_MODE_MEAN:
+            self._dtype = np.result_type(array.dtype, np.float32)
+        else:
+            self._dtype = np.dtype(array.dtype)
+        self._overviews = {}
+        self._lock = Lock()
+
+    @property
+    def mode(self) -> str:
+        return self._mode
+
+    @property
+    def dtype(self) -> np.dtype:
+        """The data type of the overviews."""
+        return self._dtype
+
+    def get_shape(self, level: int) -> Tuple[int, ...]:
+        """
+        :param level: the overview level, 0 refers to the source array
+        :return: the shape of the overview at the given level
+        """
+        shape = tuple(self._array.shape)
+        return shape[:-2] + (shape[-2] >> level, shape[-1] >> level)
+
+    def get_lazy_overview(self, level: int):
+        """
+        Get an array-like object for the given overview level which computes the overview on first access.
+        Its shape and dtype are available without computing it.
+
+        :param level: the overview level, 0 refers to the source array
+        :return: an array-like object
+        """
+        if level == 0:
+            return self._array
+        return _LazyOverviewArray(self, level)
+
+    def get_overview(self, level: int):
+        """
+        Get the overview of the given level, compute it (and all the overviews it depends on) if not yet done.
+
+        :param level: the overview level, 0 refers to the source array
+        :return: the overview array
+        """
+        if level == 0:
+            return self._array
+        with self._lock:
+            return self._get_overview(level)
+
+    def _get_overview(self, level: int):
+        overview = self._overviews.get(level)
+        if overview is None:
+            source = self._array if level == 1 else self._get_overview(level - 1)
+            overview = self._new_overview(level)
+            self._compute_overview(source, overview)
+            if isinstance(overview, np.memmap):
+                overview.flush()
+            self._overviews[level] = overview
+        return overview
+
+    def _new_overview(self, level: int) -> np.ndarray:
+        shape = self.get_shape(level)
+        if self._overview_dir:
+            os.makedirs(self._overview_dir, exist_ok=True)
+            path = os.path.join(self._overview_dir, 'overview-%d.npy' % level)
+            return np.lib.format.open_memmap(path, mode='w+', dtype=self._dtype, shape=shape)
+        return np.empty(shape, dtype=self._dtype)
+
+    def _compute_overview(self, source, overview: np.ndarray):
+        height, width = overview.shape[-2], overview.shape[-1]
+        block_height = self._block_height // 2
+        for y in range(0, height, block_height):
+            h = min(block_height, height - y)
+            block = source[..., 2 * y:2 * (y + h), 0:2 * width]
+            if hasattr(block, 'values'):
+                # E.g. xarray.DataArray
+                block = block.values
+            self._downsample_block(np.asarray(block), overview[..., y:y + h, :])
+
+    def _downsample_block(self, block: np.ndarray, out: np.ndarray):
+        if self._mode == OVERVIEW_MODE_NEAREST:
+            out[...] = downsample_ndarray(block, aggregate_ndarray_first)
+            return
+        no_data_value = self._no_data_value
+        if no_data_value is not None and not np.isnan(no_data_value):
+            block = np.ma.MaskedArray(block, mask=block == no_data_value)
+            result = downsample_ndarray_2x2(block, method='mean', out=out)
+            out[result.mask] = no_data_value
+            return
+        downsample_ndarray_2x2(block, method='mean', out=out)
+
+
+class _LazyOverviewArray:
+    """An array-like proxy for an overview computed on first item access."""
+
+    def __init__(self, overview_arrays: OverviewArrays, level: int):
+        self._overview_arrays = overview_arrays
+        self._level = level
+        self.shape = overview_arrays.get_shape(level)
+        self.dtype = overview_arrays.dtype
+        self.ndim = len(self.shape)
+
+    def __getitem__(self, item):
+        return self._overview_arrays.get_overview(self._level)[item]
+
+
 LC_STANDARD_NAMES = {'land_cover_lccs algorithmic_confidence', 'land_cover_lccs status_flag', 'land_cover_lccs',
                      'land_cover_lccs number_of_observations', 'land_cover_lccs status_flag'}
 
@@ -715,6 +1024,9 @@ class ImagePyramid:
                           array: np.ndarray,
                           tiling_scheme: TilingScheme,
                           level_image_id_factory: LevelImageIdFactory = None,
+                          overview_mode: str = None,
+                          overview_no_data_value: Number = None,
+                          overview_dir: str = None,
                           **kwargs) -> 'ImagePyramid':
 
         """
@@ -723,24 +1035,42 @@ class ImagePyramid:
         For example, if array is a H5Py dataset object, the created pyramid will take advantage of
         the HDF-5 libraries's slicing.
 
+        Without an *overview_mode*, the tiles of every level are read from the full resolution array,
+        so that a single tile of a low resolution level may read large parts of the array.
+        Given an *overview_mode*, the lower resolution levels are computed from overviews instead,
+        which are computed only once, each one from the next higher resolution one, see :py:class:`OverviewArrays`.
+
         :param array: numpy-like array that supports stepping in it's subscript operator, e.g.
                       array[..., y::step, x:step]
         :param tiling_scheme:the tiling scheme
         :param level_image_id_factory: a factory function for unique image identifiers
+        :param overview_mode: optional overview mode, either ``'nearest'`` or ``'mean'``
+        :param overview_no_data_value: optional no-data value ignored by the ``'mean'`` overview mode
+        :param overview_dir: optional directory for memory-mapped overviews, if not given, overviews are kept in memory
         :param kwargs: keyword arguments passed to FastNdarrayDownsamplingImage constructor
         :return: a new ImagePyramid instance
         """
         tile_size = tiling_scheme.tile_size
         num_levels = tiling_scheme.num_levels
+        overview_arrays = OverviewArrays(array,
+                                         mode=overview_mode,
+                                         no_data_value=overview_no_data_value,
+                                         overview_dir=overview_dir) if overview_mode else None
         level_images = [None] * num_levels
         z_index_max = num_levels - 1
         for i in range(0, num_levels):
             z_index = z_index_max - i
             image_id = level_image_id_factory(z_index) if level_image_id_factory else None
-            level_images[z_index] = FastNdarrayDownsamplingImage(array,
-                                                                 tile_size,
-                                                                 i,
-                                                                 image_id=image_id, **kwargs)
+            if overview_arrays is not None:
+                level_images[z_index] = FastNdarrayDownsamplingImage(overview_arrays.get_lazy_overview(i),
+                                                                     tile_size,
+                                                                     0,
+                                                                     image_id=image_id, **kwargs)
+            else:
+                level_images[z_index] = FastNdarrayDownsamplingImage(array,
+                                                                     tile_size,
+                                                                     i,
+                                                                     image_id=image_id, **kwargs)
         return ImagePyramid(tiling_scheme, level_images)
 
     def __init__(self,
@@ -0,0 +1,263 @@
+# The MIT License (MIT)
+# Copyright (c) 2016, 2017 by the ESA CCI Toolbox development team and contributors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is furnished to do
+# so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Description
+===========
+
+Background prefetching of image pyramid tiles.
+
+After a tile (x, y, z) has been served, a :py:class:`TilePrefetcher` computes its 8 neighbours and
+its 4 children at level z + 1 on a small pool of worker threads, so that the tile caches of the pyramid
+are warm when a client pans or zooms in. Neighbours are prefetched before children and tiles of recent
+requests before tiles of older ones. Prefetch tasks of requests that are no longer recent are dropped,
+and workers pause while foreground requests are being served.
+
+Components
+==========
+"""
+
+import heapq
+import itertools
+from contextlib import contextmanager
+from threading import Condition, Thread
+from typing import Any, Hashable, List, Tuple
+
+__author__ = "Norman Fomferra (Brockmann Consult GmbH)"
+
+#: Priority of the neighbours of a requested tile
+PRIORITY_NEIGHBOUR = 1
+#: Priority of the children of a requested tile
+PRIORITY_CHILD = 2
+
+_NEIGHBOUR_OFFSETS = [(-1, -1), (0, -1), (1, -1),
+                      (-1, 0), (1, 0),
+                      (-1, 1), (0, 1), (1, 1)]
+
+
+class TilePrefetcher:
+    """
+    Prefetches the neighbours and children of requested tiles on a bounded pool of worker threads.
+
+    Every call of :py:meth:`prefetch` counts as a new foreground request. Prefetch tasks that were queued
+    more than *max_request_lag* requests ago are considered stale, because the client has moved away
+    meanwhile, and are dropped. Workers do not start new tasks while at least *max_foreground* foreground
+    requests are active, see :py:meth:`foreground`.
+
+    :param num_workers: the number of worker threads, which are started on demand
+    :param max_queue_size: the maximum number of queued tasks, lower priority and older tasks are dropped first
+    :param max_request_lag: the number of requests after which a queued task is considered stale
+    :param max_foreground: the number of active foreground requests at which workers back off
+    :param wrap_x: whether tiles wrap around in x-direction, e.g. for global images
+    """
+
+    def __init__(self,
+                 num_workers: int = 2,
+                 max_queue_size: int = 256,
+                 max_request_lag: int = 32,
+                 max_foreground: int = 1,
+                 wrap_x: bool = True):
+        if num_workers < 1:
+            raise ValueError('num_workers must be a positive integer')
+        self._num_workers = num_workers
+        self._max_queue_size = max_queue_size
+        self._max_request_lag = max_request_lag
+        self._max_foreground = max_foreground
+        self._wrap_x = wrap_x
+        self._queue = []
+        self._queued_keys = set()
+        self._counter = itertools.count()
+        self._request_count = 0
+        self._foreground_count = 0
+        self._active_count = 0
+        self._workers = []
+        self._closed = False
+        self._condition = Condition()
+        self.prefetch_count = 0
+        self.drop_count = 0
+        self.error_count = 0
+
+    @property
+    def queue_size(self) -> int:
+        """The number of queued prefetch tasks."""
+        return len(self._queue)
+
+    @property
+    def is_closed(self) -> bool:
+        return self._closed
+
+    @contextmanager
+    def foreground(self):
+        """
+        A context manager that marks the computation of a foreground (client) request.
+        Workers back off while foreground requests are active.
+        """
+        with self._condition:
+            self._foreground_count += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._foreground_count -= 1
+                self._condition.notify_all()
+
+    def prefetch(self, pyramid, tile_x: int, tile_y: int, z_index: int, group_id: Hashable = None) -> int:
+        """
+        Queue the 8 neighbours and the 4 children of the tile (*tile_x*, *tile_y*, *z_index*) of the given pyramid.
+
+        :param pyramid: the image pyramid, see :py:class:`cate.util.im.ImagePyramid`
+        :param tile_x: the requested tile's x index
+        :param tile_y: the requested tile's y index
+        :param z_index: the requested tile's level index
+        :param group_id: identifies the pyramid's tasks for :py:meth:`cancel`, defaults to the pyramid's ``id()``
+        :return: the number of newly queued tasks
+        """
+        if group_id is None:
+            group_id = id(pyramid)
+        with self._condition:
+            if self._closed:
+                return 0
+            self._request_count += 1
+            request_index = self._request_count
+            num_queued = 0
+            for priority, x, y, z in self._get_tile_indices(pyramid, tile_x, tile_y, z_index):
+                key = (group_id, x, y, z)
+                if key in self._queued_keys:
+                    continue
+                self._queued_keys.add(key)
+                # Lower priority values first, then more recent requests first
+                heapq.heappush(self._queue, (priority, -request_index, next(self._counter), key, pyramid))
+                num_queued += 1
+            if len(self._queue) > self._max_queue_size:
+                self._trim_queue()
+            self._ensure_workers()
+            self._condition.notify_all()
+            return num_queued
+
+    def cancel(self, group_id: Hashable = None) -> int:
+        """
+        Drop queued tasks. Tasks that are already being computed are completed.
+
+        :param group_id: if given, only the tasks of this group are dropped
+        :return: the number of dropped tasks
+        """
+        with self._condition:
+            if group_id is None:
+                dropped_tasks = self._queue
+                self._queue = []
+            else:
+                dropped_tasks = [task for task in self._queue if task[3][0] == group_id]
+                self._queue = [task for task in self._queue if task[3][0] != group_id]
+                heapq.heapify(self._queue)
+            for task in dropped_tasks:
+                self._queued_keys.discard(task[3])
+            self.drop_count += len(dropped_tasks)
+            self._condition.notify_all()
+            return len(dropped_tasks)
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Wait until all queued tasks are either computed or dropped.
+
+        :param timeout: optional timeout in seconds
+        :return: True, if there are no more pending tasks, False if the timeout occurred
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._queue and self._active_count == 0, timeout=timeout)
+
+    def close(self):
+        """
+        Drop all queued tasks and stop the workers.
+        """
+        with self._condition:
+            self._closed = True
+        self.cancel()
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+    def _get_tile_indices(self, pyramid, tile_x: int, tile_y: int, z_index: int) -> List[Tuple[int, int, int, int]]:
+        tile_indices = []
+        num_tiles_x, num_tiles_y = pyramid.get_level_image(z_index).num_tiles
+        for dx, dy in _NEIGHBOUR_OFFSETS:
+            x, y = tile_x + dx, tile_y + dy
+            if self._wrap_x:
+                x %= num_tiles_x
+            if 0 <= x < num_tiles_x and 0 <= y < num_tiles_y and (x, y) != (tile_x, tile_y):
+                tile_indices.append((PRIORITY_NEIGHBOUR, x, y, z_index))
+        if z_index + 1 < pyramid.num_levels:
+            for dy in (0, 1):
+                for dx in (0, 1):
+                    tile_indices.append((PRIORITY_CHILD, 2 * tile_x + dx, 2 * tile_y + dy, z_index + 1))
+        # Remove duplicates, e.g. when wrapping around narrow levels
+        return list(dict.fromkeys(tile_indices))
+
+    def _trim_queue(self):
+        kept_tasks = heapq.nsmallest(self._max_queue_size, self._queue)
+        kept_keys = set(task[3] for task in kept_tasks)
+        self.drop_count += len(self._queue) - len(kept_tasks)
+        self._queued_keys &= kept_keys
+        self._queue = kept_tasks
+        heapq.heapify(self._queue)
+
+    def _ensure_workers(self):
+        while len(self._workers) < self._num_workers:
+            worker = Thread(target=self._run_worker, name='TilePrefetcher-%d' % len(self._workers), daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    def _next_task(self) -> Any:
+        with self._condition:
+            while True:
+                if self._closed:
+                    return None
+                if self._queue and self._foreground_count < self._max_foreground:
+                    task = heapq.heappop(self._queue)
+                    self._queued_keys.discard(task[3])
+                    request_index = -task[1]
+                    if self._request_count - request_index >= self._max_request_lag:
+                        # The client has moved away since this task was queued
+                        self.drop_count += 1
+                        self._condition.notify_all()
+                        continue
+                    self._active_count += 1
+                    return task
+                self._condition.wait()
+
+    def _run_worker(self):
+        while True:
+            task = self._next_task()
+            if task is None:
+                return
+            _, _, _, (_, x, y, z), pyramid = task
+            try:
+                pyramid.get_tile(x, y, z)
+                succeeded = True
+            except Exception:
+                # Prefetching is best effort, a failing tile is reported when it is actually requested
+                succeeded = False
+            with self._condition:
+                self._active_count -= 1
+                if succeeded:
+                    self.prefetch_count += 1
+                else:
+                    self.error_count += 1
+                self._condition.notify_all()
@@ -0,0 +1,171 @@
+# The MIT License (MIT)
+# Copyright (c) 2016, 2017 by the ESA CCI Toolbox development team and contributors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is furnished to do
+# so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Description
+===========
+
+Statistics of numpy ndarray-like arrays, e.g. to determine the display range of images.
+
+The statistics are computed in a single pass over blocks of the array that are aligned with its chunks,
+so that large (e.g. dask-backed) arrays are neither loaded at once nor read twice.
+
+Components
+==========
+"""
+
+import math
+from typing import Any, Dict, Iterator, Sequence
+
+import numpy as np
+
+from .utils import get_chunk_size
+from ..monitor import Monitor
+
+__author__ = "Norman Fomferra (Brockmann Consult GmbH)"
+
+#: The percentiles computed by default
+DEFAULT_PERCENTILES = (1, 2, 5, 25, 50, 75, 95, 98, 99)
+
+
+def compute_array_statistics(array,
+                             num_bins: int = 128,
+                             percentiles: Sequence[float] = DEFAULT_PERCENTILES,
+                             max_sample_size: int = 1000000,
+                             stride: int = 1,
+                             max_block_size: int = 1 << 24,
+                             monitor: Monitor = Monitor.NONE) -> Dict[str, Any]:
+    """
+    Compute statistics of the valid, i.e. unmasked and finite, values of an array in a single pass.
+
+    *count*, *min*, *max*, *mean* and *std* are exact, unless a *stride* is given.
+    Percentiles and histogram are computed from a regular sample of at most *max_sample_size* values
+    and are therefore approximate for larger arrays. The histogram's counts are scaled to the number of valid values.
+
+    :param array: a numpy ndarray-like array, e.g. a ``xarray.DataArray``
+    :param num_bins: the number of histogram bins between minimum and maximum
+    :param percentiles: the percentiles to compute, numbers from 0 to 100
+    :param max_sample_size: the maximum number of values used to compute percentiles and the histogram
+    :param stride: if greater than one, only every *stride*-th value in each dimension is considered
+    :param max_block_size: the maximum number of values read at once, unless a single chunk
+           of the array's first dimension is larger
+    :param monitor: a progress monitor
+    :return: a dictionary with keys *count*, *min*, *max*, *mean*, *std*, *percentiles*, which maps
+             percentile names such as ``'50'`` to values, *histogram*, a dictionary with keys *edges* and *counts*,
+             and *sample_size*. If there are no valid values, all statistics except *count* are None.
+    """
+    if stride < 1:
+        raise ValueError('stride must be a positive integer')
+    ndim = len(array.shape)
+    total_size = int(np.prod([int(math.ceil(n / stride)) for n in array.shape]))
+    sample_step = max(1, int(math.ceil(total_size / max_sample_size)))
+
+    count = 0
+    mean = 0.0
+    m2 = 0.0
+    value_min = math.inf
+    value_max = -math.inf
+    sample_parts = []
+    sample_offset = 0
+
+    block_slices = list(_get_block_slices(array, ndim, max_block_size))
+    with monitor.starting('Computing statistics', total_work=len(block_slices)):
+        for block_slice in block_slices:
+            monitor.check_for_cancellation()
+            values = _get_valid_values(array, block_slice, ndim, stride)
+            if values.size:
+                block_count = values.size
+                block_mean = float(np.mean(values, dtype=np.float64))
+                block_m2 = float(np.sum(np.square(values - block_mean, dtype=np.float64)))
+                # Chan et al.'s parallel algorithm for mean and variance
+                delta = block_mean - mean
+                new_count = count + block_count
+                mean += delta * block_count / new_count
+                m2 += block_m2 + delta * delta * count * block_count / new_count
+                count = new_count
+                value_min = min(value_min, float(np.min(values)))
+                value_max = max(value_max, float(np.max(values)))
+                sample_parts.append(values[sample_offset::sample_step])
+                sample_offset = (sample_offset - block_count) % sample_step
+            monitor.progress(work=1)
+
+    if count == 0:
+        return dict(count=0, min=None, max=None, mean=None, std=None,
+                    percentiles={_percentile_name(p): None for p in percentiles},
+                    histogram=None, sample_size=0)
+
+    sample = np.concatenate(sample_parts)
+    percentile_values = np.percentile(sample, percentiles) if len(percentiles) else []
+    histogram_counts, histogram_edges = np.histogram(sample, bins=num_bins, range=(value_min, value_max))
+    histogram_counts = np.rint(histogram_counts * (count / sample.size)).astype(np.int64)
+    return dict(count=count,
+                min=value_min,
+                max=value_max,
+                mean=mean,
+                std=math.sqrt(m2 / count),
+                percentiles={_percentile_name(p): float(v) for p, v in zip(percentiles, percentile_values)},
+                histogram=dict(edges=[float(e) for e in histogram_edges],
+                               counts=[int(c) for c in histogram_counts]),
+                sample_size=int(sample.size))
+
+
+def _percentile_name(percentile: float) -> str:
+    return '%g' % percentile
+
+
+def _get_block_slices(array, ndim: int, max_block_size: int) -> Iterator[slice]:
+    """Slices of the first dimension which cover whole chunks and comprise at most *max_block_size* values."""
+    if ndim == 0:
+        yield slice(None)
+        return
+    length = array.shape[0]
+    row_size = int(np.prod(array.shape[1:])) if ndim > 1 else 1
+    block_length = max(1, max_block_size // max(1, row_size))
+    chunk_size = get_chunk_size(array)
+    if chunk_size and chunk_size[0]:
+        chunk_length = int(chunk_size[0])
+        block_length = max(1, block_length // chunk_length) * chunk_length
+    for start in range(0, length, block_length):
+        yield slice(start, min(length, start + block_length))
+
+
+def _get_valid_values(array, block_slice: slice, ndim: int, stride: int) -> np.ndarray:
+    if ndim == 0:
+        block = array[()]
+    elif stride > 1:
+        # Keep the stride aligned across blocks
+        start = block_slice.start + (-block_slice.start) % stride
+        block = array[(slice(start, block_slice.stop),) + (slice(None),) * (ndim - 1)]
+    else:
+        block = array[block_slice]
+    if hasattr(block, 'values') and not isinstance(block, np.ndarray):
+        # E.g. xarray.DataArray
+        block = block.values
+    if stride > 1 and ndim > 0:
+        # Strides are applied after reading, strided reads of chunked arrays are slow
+        block = block[(slice(None, None, stride),) * ndim]
+    if np.ma.isMaskedArray(block):
+        values = block.compressed()
+    else:
+        values = np.asarray(block).ravel()
+    if np.issubdtype(values.dtype, np.floating):
+        values = values[np.isfinite(values)]
+    return values
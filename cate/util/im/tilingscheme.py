@@ -145,7 +145,9 @@ class TilingScheme:
     def create(cls,
                w: int, h: int,
                tile_width: int, tile_height: int,
-               geo_extent: GeoExtent) -> 'TilingScheme':
+               geo_extent: GeoExtent,
+               chunk_width: Optional[int] = None,
+               chunk_height: Optional[int] = None) -> 'TilingScheme':
         """
         Create a new TilingScheme object for image size given by *w* and *h*.
 
@@ -166,6 +168,9 @@ class TilingScheme:
         :param tile_width: optimal tile width
         :param tile_height: optimal tile height
         :param geo_extent: The geo-spatial extent
+        :param chunk_width: optional chunk width of the image's storage, tile widths that divide or are multiples
+               of it are preferred, so that tiles do not straddle chunk boundaries
+        :param chunk_height: optional chunk height of the image's storage, see *chunk_width*
         :return: A new TilingScheme object
         """
         gsb_x1, gsb_y1, gsb_x2, gsb_y2 = geo_extent.coords
@@ -189,7 +194,9 @@ class TilingScheme:
         (w_new, h_new), (tw, th), (nt0x, nt0y), nl = pow2_2d_subdivision(w, h,
                                                                          w_mode=w_mode, h_mode=h_mode,
                                                                          tw_opt=min(w, tile_width or 512),
-                                                                         th_opt=min(h, tile_height or 512))
+                                                                         th_opt=min(h, tile_height or 512),
+                                                                         tw_chunk=chunk_width,
+                                                                         th_chunk=chunk_height)
 
         assert w_new >= w
         assert h_new >= h
@@ -235,7 +242,8 @@ def pow2_2d_subdivision(w: int, h: int,
                         tw_min: Optional[int] = None, th_min: Optional[int] = None,
                         tw_max: Optional[int] = None, th_max: Optional[int] = None,
                         nt0_max: Optional[int] = None,
-                        nl_max: Optional[int] = None):
+                        nl_max: Optional[int] = None,
+                        tw_chunk: Optional[int] = None, th_chunk: Optional[int] = None):
     """
     Get a pyramidal quad-tree subdivision of a 2D image rectangle given by image width *w* and height *h*.
     We want all pyramid levels to use the same tile size *tw*, *th*. All but the lowest resolution level, level zero,
@@ -244,9 +252,11 @@ def pow2_2d_subdivision(w: int, h: int,
     As there can be multiple of such subdivisions, we select an optimum subdivision by constraints. We want
     (in this order):
     1. the resolution of the highest pyramid level, *nl* - 1, to be as close as possible to *w*, *h*;
-    2. the number of tiles in level zero to be as small as possible;
-    3. the tile sizes *tw*, *th* to be as close as possible to *tw_opt*, *th_opt*, if given;
-    4. a maximum number of levels.
+    2. the tile sizes *tw*, *th* to be aligned with the chunk sizes *tw_chunk*, *th_chunk*, if given,
+       i.e. to be divisors or multiples of them;
+    3. the number of tiles in level zero to be as small as possible;
+    4. the tile sizes *tw*, *th* to be as close as possible to *tw_opt*, *th_opt*, if given;
+    5. a maximum number of levels.
 
     :param w: image width
     :param h: image height
@@ -260,6 +270,8 @@ def pow2_2d_subdivision(w: int, h: int,
     :param th_max: optional maximum tile height
     :param nt0_max: optional maximum number of tiles at level zero of pyramid
     :param nl_max: optional maximum number of pyramid levels
+    :param tw_chunk: optional chunk width of the image's storage
+    :param th_chunk: optional chunk height of the image's storage
     :return: a tuple ((*w_act*, *h_act*), (*tw*, *th*), (*nt0_x*, *nt0_y*), *nl*) with
              *w_act*, *h_act* being the final image width and height in the pyramids's highest resolution level;
              *tw*, *th* being the tile width and height;
@@ -268,10 +280,10 @@ def pow2_2d_subdivision(w: int, h: int,
     """
     w_act, tw, nt0_x, nl_x = pow2_1d_subdivision(w, s_mode=w_mode,
                                                  ts_opt=tw_opt, ts_min=tw_min, ts_max=tw_max,
-                                                 nt0_max=nt0_max, nl_max=nl_max)
+                                                 nt0_max=nt0_max, nl_max=nl_max, ts_chunk=tw_chunk)
     h_act, th, nt0_y, nl_y = pow2_1d_subdivision(h, s_mode=h_mode,
                                                  ts_opt=th_opt, ts_min=th_min, ts_max=th_max,
-                                                 nt0_max=nt0_max, nl_max=nl_max)
+                                                 nt0_max=nt0_max, nl_max=nl_max, ts_chunk=th_chunk)
     if nl_x < nl_y:
         nl = nl_x
         nt0_y = h_act // (1 << (nl - 1)) // th
@@ -290,12 +302,14 @@ def pow2_1d_subdivision(s_act: int,
                         ts_min: Optional[int] = None,
                         ts_max: Optional[int] = None,
                         nt0_max: Optional[int] = None,
-                        nl_max: Optional[int] = None):
+                        nl_max: Optional[int] = None,
+                        ts_chunk: Optional[int] = None):
     return pow2_1d_subdivisions(s_act,
                                 s_mode=s_mode,
                                 ts_opt=ts_opt,
                                 ts_min=ts_min, ts_max=ts_max,
-                                nt0_max=nt0_max, nl_max=nl_max)[0]
+                                nt0_max=nt0_max, nl_max=nl_max,
+                                ts_chunk=ts_chunk)[0]
 
 
 def pow2_1d_subdivisions(s: int,
@@ -304,7 +318,8 @@ def pow2_1d_subdivisions(s: int,
                          ts_min: Optional[int] = None,
                          ts_max: Optional[int] = None,
                          nt0_max: Optional[int] = None,
-                         nl_max: Optional[int] = None):
+                         nl_max: Optional[int] = None,
+                         ts_chunk: Optional[int] = None):
     if s is None or s < 1:
         raise ValueError('invalid s')
 
@@ -366,7 +381,19 @@ def pow2_1d_subdivisions(s: int,
         subdivisions.sort(key=lambda r: abs(r[1] - ts_opt))
     # minimize nt0
     subdivisions.sort(key=lambda r: r[2])
+    if ts_chunk and ts_chunk < s:
+        # prefer tiles that do not straddle chunk boundaries
+        subdivisions.sort(key=lambda r: not is_chunk_aligned(r[1], ts_chunk))
     # minimize s_max - s_min
     subdivisions.sort(key=lambda r: r[0] - s)
 
     return subdivisions
+
+
+def is_chunk_aligned(ts: int, ts_chunk: int) -> bool:
+    """
+    :param ts: a tile size
+    :param ts_chunk: a chunk size
+    :return: whether tiles of size *ts* do not straddle chunks of size *ts_chunk*, given both start at index zero
+    """
+    return ts_chunk % ts == 0 or ts % ts_chunk == 0
@@ -21,8 +21,14 @@
 
 __author__ = "Norman Fomferra (Brockmann Consult GmbH)"
 
+import zlib
+from typing import Any, Dict, Tuple
+
 import numpy as np
 
+#: The no-data value of arrays encoded as quantised ``uint16``, see :py:func:`encode_ndarray`
+UINT16_NO_DATA = 65535
+
 
 def aggregate_ndarray_first(a1, a2, a3, a4):
     return a1
@@ -50,6 +56,16 @@ def aggregate_ndarray_mean(a1, a2, a3, a4):
     return (a1 + a2 + a3 + a4) / 4.
 
 
+def aggregate_ndarray_nanmean(a1, a2, a3, a4):
+    """Mean of the four arrays ignoring NaN values. Results are NaN only where all four values are NaN."""
+    a = np.stack((a1, a2, a3, a4))
+    valid = ~np.isnan(a)
+    count = valid.sum(axis=0)
+    total = np.where(valid, a, 0).sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, total / count, np.nan)
+
+
 def downsample_ndarray(a, aggregator=aggregate_ndarray_mean):
     if aggregator is aggregate_ndarray_first:
         # Optimization
@@ -62,6 +78,132 @@ def downsample_ndarray(a, aggregator=aggregate_ndarray_mean):
         return aggregator(a1, a2, a3, a4)
 
 
+#: The methods of :py:func:`downsample_ndarray_2x2`
+DOWNSAMPLING_METHODS = ('first', 'min', 'max', 'sum', 'mean')
+
+
+def downsample_ndarray_2x2(a, method: str = 'mean', out: np.ndarray = None, out_mask: np.ndarray = None):
+    """
+    Downsample the last two dimensions of an array by aggregating blocks of 2x2 values.
+    Masked and NaN values are ignored. Where all 4 values of a block are invalid, the result is masked, if *a*
+    is a masked array, and NaN, if it is of floating point type.
+
+    The result is written into *out*, e.g. a quadrant of a target tile, so that tiles can be stitched from
+    4 source tiles without allocating an aggregated copy of each one.
+
+    :param a: a numpy array, possibly masked. If the size of one of its last two dimensions is odd,
+           the last row or column is ignored.
+    :param method: the aggregation method, one of ``'first'`` (the first valid value in row-major order),
+           ``'min'``, ``'max'``, ``'sum'``, ``'mean'``
+    :param out: optional output array, e.g. a view into a larger array. Defaults to a new array
+           of *a*'s data type, or of type float64 for the mean of integers.
+    :param out_mask: optional boolean output array for the mask of the result
+    :return: *out*, or, if *a* is a masked array, a masked array of *out* whose mask is *out_mask*
+    """
+    if method not in DOWNSAMPLING_METHODS:
+        raise ValueError('unknown downsampling method "%s", must be one of %s'
+                         % (method, ', '.join('"%s"' % m for m in DOWNSAMPLING_METHODS)))
+    mask = np.ma.getmask(a)
+    quarters = _get_quarters(np.ma.getdata(a))
+    mask_quarters = _get_quarters(mask) if mask is not np.ma.nomask else None
+    shape = quarters[0].shape
+    is_float = np.issubdtype(quarters[0].dtype, np.floating)
+    if out is None:
+        dtype = quarters[0].dtype if method != 'mean' or is_float else np.float64
+        out = np.empty(shape, dtype=dtype)
+    elif out.shape != shape:
+        raise ValueError('out must have shape %s, but has shape %s' % (shape, out.shape))
+
+    if mask_quarters is None and (not is_float or method in ('min', 'max')):
+        # All values are valid, or NaN is ignored by np.fmin() and np.fmax()
+        _downsample_valid(quarters, method, out)
+        if out_mask is not None:
+            out_mask[...] = False
+        return out
+
+    valid = np.empty(shape, dtype=np.bool_)
+    count = np.zeros(shape, dtype=np.uint8)
+    out_is_float = np.issubdtype(out.dtype, np.floating)
+    if method == 'mean' and not out_is_float:
+        accumulator = np.empty(shape, dtype=np.float64)
+    elif out.flags.c_contiguous:
+        accumulator = out
+    else:
+        # Masked operations on strided views, e.g. quadrants of tiles, are slow
+        accumulator = np.empty(shape, dtype=out.dtype)
+    accumulator_is_float = np.issubdtype(accumulator.dtype, np.floating)
+    if method in ('sum', 'mean'):
+        accumulator[...] = 0
+    elif method == 'min':
+        accumulator[...] = np.inf if accumulator_is_float else np.iinfo(accumulator.dtype).max
+    elif method == 'max':
+        accumulator[...] = -np.inf if accumulator_is_float else np.iinfo(accumulator.dtype).min
+
+    # For 'first', later quarters are overwritten by earlier ones
+    indices = range(3, -1, -1) if method == 'first' else range(4)
+    for i in indices:
+        quarter = quarters[i]
+        if is_float:
+            # NaN is the only value not equal to itself
+            np.equal(quarter, quarter, out=valid)
+            if mask_quarters is not None:
+                # valid and not masked
+                np.greater(valid, mask_quarters[i], out=valid)
+        else:
+            np.logical_not(mask_quarters[i], out=valid)
+        np.add(count, valid, out=count, casting='unsafe')
+        if method == 'first':
+            np.copyto(accumulator, quarter, where=valid, casting='unsafe')
+        elif method == 'min':
+            np.minimum(accumulator, quarter, out=accumulator, where=valid, casting='unsafe')
+        elif method == 'max':
+            np.maximum(accumulator, quarter, out=accumulator, where=valid, casting='unsafe')
+        else:
+            np.add(accumulator, quarter, out=accumulator, where=valid, casting='unsafe')
+
+    if method == 'mean':
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # 0 / 0 is NaN
+            np.divide(accumulator, count, out=accumulator)
+    invalid = np.equal(count, 0, out=valid)
+    if accumulator_is_float and method != 'mean':
+        np.copyto(accumulator, np.nan, where=invalid)
+    if accumulator is not out:
+        np.copyto(out, accumulator, casting='unsafe')
+    if not out_is_float:
+        # E.g. the fill value of masked integers
+        np.copyto(out, quarters[0], where=invalid, casting='unsafe')
+    if out_mask is not None:
+        out_mask[...] = invalid
+    if mask_quarters is not None:
+        return np.ma.MaskedArray(out, mask=out_mask if out_mask is not None else invalid.copy())
+    return out
+
+
+def _get_quarters(a: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """The upper left, upper right, lower left and lower right values of all 2x2 blocks, as views of *a*."""
+    h, w = a.shape[-2] // 2, a.shape[-1] // 2
+    a = a[..., 0:2 * h, 0:2 * w]
+    return a[..., 0::2, 0::2], a[..., 0::2, 1::2], a[..., 1::2, 0::2], a[..., 1::2, 1::2]
+
+
+def _downsample_valid(quarters, method: str, out: np.ndarray):
+    if method == 'first':
+        np.copyto(out, quarters[0], casting='unsafe')
+        return
+    if method == 'min':
+        ufunc = np.fmin
+    elif method == 'max':
+        ufunc = np.fmax
+    else:
+        ufunc = np.add
+    ufunc(quarters[0], quarters[1], out=out, casting='unsafe')
+    ufunc(out, quarters[2], out=out, casting='unsafe')
+    ufunc(out, quarters[3], out=out, casting='unsafe')
+    if method == 'mean':
+        np.multiply(out, 0.25, out=out, casting='unsafe')
+
+
 def get_chunk_size(array):
     chunk_size = None
     try:
@@ -78,3 +220,52 @@ def get_chunk_size(array):
         except Exception:
             pass
     return chunk_size
+
+
+def encode_ndarray(array, dtype: str = 'float32', compression: str = None) -> Tuple[bytes, Dict[str, Any]]:
+    """
+    Encode a 2D, possibly masked array as compact binary data, e.g. to let clients color-map image tiles.
+    The data are the array's values in row-major, little-endian order.
+
+    * ``'float32'`` and ``'float16'``: masked and invalid values are NaN.
+    * ``'uint16'``: values are quantised linearly between the array's minimum and maximum, so that
+      ``value = scale * data + offset``. Masked and invalid values are ``UINT16_NO_DATA``.
+
+    :param array: the array
+    :param dtype: the data type of the encoded values, one of ``'float32'``, ``'float16'``, ``'uint16'``
+    :param compression: optional compression of the encoded values, either None or ``'zlib'``
+    :return: a pair comprising the encoded data and a dictionary with the keys *width*, *height*, *dtype*,
+             *compression*, and for ``'uint16'`` also *scale*, *offset* and *no_data*
+    """
+    if compression not in (None, 'zlib'):
+        raise ValueError('unknown compression "%s", must be "zlib" or None' % compression)
+    if not isinstance(array, np.ndarray):
+        # E.g. xarray.DataArray
+        array = np.asarray(array)
+    array = np.ma.masked_invalid(array, copy=False)
+    mask = np.ma.getmaskarray(array)
+    values = np.ma.getdata(array)
+    height, width = values.shape[-2:]
+    info = dict(width=width, height=height, dtype=dtype, compression=compression)
+    if dtype in ('float32', 'float16'):
+        encoded = values.astype('<f4' if dtype == 'float32' else '<f2')
+        encoded[mask] = np.nan
+    elif dtype == 'uint16':
+        if mask.all():
+            value_min, value_max = 0.0, 0.0
+        else:
+            value_min, value_max = float(np.min(values[~mask])), float(np.max(values[~mask]))
+        scale = (value_max - value_min) / (UINT16_NO_DATA - 1) if value_max > value_min else 1.0
+        encoded = np.empty(values.shape, dtype=np.float64)
+        np.subtract(values, value_min, out=encoded)
+        encoded *= 1.0 / scale
+        np.rint(encoded, out=encoded)
+        encoded[mask] = UINT16_NO_DATA
+        encoded = encoded.astype('<u2')
+        info.update(scale=scale, offset=value_min, no_data=UINT16_NO_DATA)
+    else:
+        raise ValueError('unknown dtype "%s", must be one of "float32", "float16", "uint16"' % dtype)
+    data = encoded.tobytes()
+    if compression == 'zlib':
+        data = zlib.compress(data, 1)
+    return data, info
@@ -23,6 +23,10 @@ __author__ = "Norman Fomferra (Brockmann Consult GmbH), " \
              "Marco Zühlke (Brockmann Consult GmbH)"
 
 import argparse
+import calendar
+import concurrent.futures
+import email.utils
+import hashlib
 import os.path
 import signal
 import subprocess
@@ -32,7 +36,7 @@ import time
 import traceback
 import urllib.request
 from datetime import datetime
-from typing import List, Callable, Optional, Tuple
+from typing import Any, List, Callable, Optional, Tuple
 
 from tornado.ioloop import IOLoop
 from tornado.log import enable_pretty_logging
@@ -418,6 +422,73 @@ def check_for_auto_stop(application: Application, condition: bool,
         webapi.check_for_auto_stop(condition, interval)
 
 
+class BoundedRequestExecutor:
+    """
+    Executes request computations on a dedicated thread pool and sheds load if there are too many pending ones.
+
+    :py:meth:`submit` returns None if *max_queue_size* computations are already waiting for a free worker,
+    so that request handlers can respond with "503 Service Unavailable" instead of queuing up requests
+    nobody waits for anymore. Queued computations may also be dropped when they are about to start,
+    e.g. because the client has closed the connection meanwhile.
+
+    :param max_workers: the number of worker threads
+    :param max_queue_size: the maximum number of computations waiting for a free worker
+    """
+
+    def __init__(self, max_workers: int, max_queue_size: int):
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        self._max_pending = max_workers + max_queue_size
+        self._num_pending = 0
+        self._lock = threading.Lock()
+        self.reject_count = 0
+        self.drop_count = 0
+
+    @property
+    def num_pending(self) -> int:
+        """The number of computations either running or waiting for a free worker."""
+        return self._num_pending
+
+    def submit(self, fn: Callable, *args, is_stale: Callable[[], bool] = None,
+               **kwargs) -> Optional[concurrent.futures.Future]:
+        """
+        Submit a computation.
+
+        :param fn: the computation
+        :param args: the computation's positional arguments
+        :param is_stale: optional function called before the computation starts. If it returns True,
+               the computation is dropped and the returned future raises a ``concurrent.futures.CancelledError``.
+        :param kwargs: the computation's keyword arguments
+        :return: a future for the computation's result, or None if the queue is full
+        """
+        with self._lock:
+            if self._num_pending >= self._max_pending:
+                self.reject_count += 1
+                return None
+            self._num_pending += 1
+        try:
+            return self._executor.submit(self._run, fn, args, kwargs, is_stale)
+        except BaseException:
+            self._finished()
+            raise
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, fn: Callable, args, kwargs, is_stale: Optional[Callable[[], bool]]) -> Any:
+        try:
+            if is_stale is not None and is_stale():
+                with self._lock:
+                    self.drop_count += 1
+                raise concurrent.futures.CancelledError()
+            return fn(*args, **kwargs)
+        finally:
+            self._finished()
+
+    def _finished(self):
+        with self._lock:
+            self._num_pending -= 1
+
+
 # noinspection PyAbstractClass
 class WebAPIRequestHandler(RequestHandler):
     """
@@ -521,6 +592,43 @@ class WebAPIRequestHandler(RequestHandler):
         value = self.get_query_argument(name, default=None)
         return self.to_float(name, value) if value is not None else default
 
+    def set_cache_headers(self, etag: str, cache_control: str = 'no-cache', last_modified: datetime = None) -> bool:
+        """
+        Set the validators and the caching directives of the response, and check the request's
+        "If-None-Match" or, if not given, "If-Modified-Since" header against them.
+        If the client's representation is still valid, the status is set to "304 Not Modified" and
+        True is returned. The caller must then finish the request without writing a body.
+
+        :param etag: the entity tag, see :py:func:`make_etag`
+        :param cache_control: the value of the "Cache-Control" header
+        :param last_modified: optional time of the last modification in UTC
+        :return: True, if the response is not modified
+        """
+        self.set_header('Etag', etag)
+        self.set_header('Cache-Control', cache_control)
+        if last_modified is not None:
+            self.set_header('Last-Modified', last_modified)
+        if self.request.headers.get('If-None-Match') is not None:
+            not_modified = self.check_etag_header()
+        elif last_modified is not None:
+            not_modified = self._is_not_modified_since(last_modified)
+        else:
+            not_modified = False
+        if not_modified:
+            self.set_status(304)
+        return not_modified
+
+    def _is_not_modified_since(self, last_modified: datetime) -> bool:
+        if_modified_since = self.request.headers.get('If-Modified-Since')
+        if not if_modified_since:
+            return False
+        try:
+            if_modified_since = email.utils.parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        # HTTP dates have a resolution of one second
+        return int(if_modified_since.timestamp()) >= calendar.timegm(last_modified.utctimetuple())
+
     def on_finish(self):
         """
         Store time of last activity so we can measure time of inactivity and then optionally auto-exit.
@@ -531,6 +639,10 @@ class WebAPIRequestHandler(RequestHandler):
         self.write(dict(status='ok', content=content))
 
     def write_status_error(self, exception: Exception = None, type_name: str = None, message: str = None):
+        # Errors must not be cached or validated by the client
+        self.clear_header('Etag')
+        self.clear_header('Last-Modified')
+        self.set_header('Cache-Control', 'no-store')
         if message is not None:
             print("ERROR: %s" % message)
         if exception is not None:
@@ -594,6 +706,17 @@ class WebAPIRequestError(WebAPIError):
     """
 
 
+def make_etag(*parts: Any) -> str:
+    """
+    Make a strong entity tag for the "ETag" header of a response from the string representations of *parts*,
+    which must identify the response's content.
+
+    :param parts: the parts
+    :return: the quoted entity tag
+    """
+    return '"%s"' % hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
 def url_pattern(pattern: str):
     """
     Convert a string *pattern* where any occurrences of ``{{NAME}}`` are replaced by an equivalent
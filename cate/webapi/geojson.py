@@ -38,15 +38,18 @@ Type Name         | Coordinates
 
 """
 
-import heapq
+import itertools
 import json
-from typing import Tuple, List, Callable, Union, Dict, Iterable
+import threading
+from typing import Tuple, List, Callable, Union, Dict, Iterable, Optional, Sequence
 
 import fiona
 import numba
 import numpy as np
 import pyproj
 
+from . import minheap
+
 __author__ = "Norman Fomferra (Brockmann Consult GmbH)"
 
 Point = Tuple[float, float]
@@ -63,108 +66,288 @@ GeometryPointCounter = Callable[[Geometry], int]
 Feature = Dict
 
 
+#: The number of features transformed at once by :py:func:`write_feature_collection`
+_FEATURE_BATCH_SIZE = 1000
+
+_WGS84_CRS = dict(init='epsg:4326')
+
+# Thread-local cache of pyproj.Proj objects, see _get_proj()
+_PROJ_CACHE = threading.local()
+
+
+def _get_proj(crs) -> pyproj.Proj:
+    """
+    Get a cached projection for the given *crs*, which is either a dictionary of PROJ.4 parameters
+    or a PROJ.4 string. Projections are cached per thread, because PROJ.4 projections must not be shared
+    between threads.
+    """
+    projs = getattr(_PROJ_CACHE, 'projs', None)
+    if projs is None:
+        projs = _PROJ_CACHE.projs = dict()
+    key = repr(sorted(crs.items())) if isinstance(crs, dict) else repr(crs)
+    proj = projs.get(key)
+    if proj is None:
+        proj = projs[key] = pyproj.Proj(crs)
+    return proj
+
+
+def transform_geometries(source_prj: Optional[pyproj.Proj], target_prj: Optional[pyproj.Proj],
+                         geometries: Sequence[Tuple[str, Geometry, float]]) -> List[Optional[Geometry]]:
+    """
+    Transform multiple geometries at once.
+
+    The points of all rings (and line-strings) of the *geometries* are flattened into a single coordinate
+    buffer. The rings are then simplified and the buffer is reprojected from *source_prj* to *target_prj*
+    in a single call. Finally, the transformed geometries are rebuilt using the ring offsets into the buffer.
+
+    :param source_prj: The source projection or ``None``, if the geometries shall not be reprojected.
+    :param target_prj: The target projection.
+    :param geometries: Sequence of tuples (*type_name*, *coordinates*, *conservation_ratio*), where
+           *conservation_ratio* is the ratio of coordinates to be conserved, 0 <= *conservation_ratio* <= 1.
+           A geometry with *conservation_ratio* zero is converted into a Point, its mass center.
+    :return: The list of transformed geometry coordinates. Geometries which could not be transformed
+             are ``None``.
+    """
+    must_reproject = source_prj is not None
+    transformed_geometries = [None] * len(geometries)
+
+    indices = []
+    conservation_ratios = []
+    for index, (type_name, coordinates, conservation_ratio) in enumerate(geometries):
+        must_simplify = 0.0 <= conservation_ratio < 1.0 and type_name != 'Point'
+        if not must_reproject and not must_simplify:
+            transformed_geometries[index] = coordinates
+            continue
+        indices.append(index)
+        conservation_ratios.append(conservation_ratio if must_simplify else 1.0)
+
+    if not indices:
+        return transformed_geometries
+
+    x, y, ring_offsets, entries = _flatten_geometries([geometries[index][0:2] for index in indices])
+    # Entries are (geometry index, type name, first ring index, number of rings, polygon sizes, conservation ratio)
+    entries = [(indices[i], type_name, first_ring, num_rings, polygon_sizes, conservation_ratios[i])
+               for i, type_name, first_ring, num_rings, polygon_sizes in entries]
+
+    # noinspection PyBroadException
+    try:
+        if any(entry[5] < 1.0 for entry in entries):
+            x, y, ring_offsets, entries = _simplify_rings(x, y, ring_offsets, entries)
+        if must_reproject and x.size > 0:
+            x, y = pyproj.transform(source_prj, target_prj, x, y)
+    except Exception as e:
+        print('ERROR TRANSFORMING GEOMETRIES: ', e)
+        return transformed_geometries
+
+    # Converting whole buffers is a lot faster than converting every single coordinate
+    x = x.tolist()
+    y = y.tolist()
+    for index, type_name, first_ring, num_rings, polygon_sizes, conservation_ratio in entries:
+        if conservation_ratio == 0.0:
+            i = ring_offsets[first_ring]
+            transformed_geometries[index] = x[i], y[i]
+        else:
+            rings = _unflatten_rings(x, y, ring_offsets, first_ring, num_rings)
+            transformed_geometries[index] = _unflatten_geometry(type_name, rings, polygon_sizes)
+
+    return transformed_geometries
+
+
+def _flatten_geometries(geometries: Sequence[Tuple[str, Geometry]]) \
+        -> Tuple[np.ndarray, np.ndarray, List[int], List[Tuple]]:
+    """
+    Flatten the rings of the given (*type_name*, *coordinates*) pairs into a single coordinate buffer.
+
+    :return: A tuple (x, y, ring_offsets, entries). The points of ring *i* are at
+             ``ring_offsets[i]:ring_offsets[i + 1]`` in *x* and *y*. Entries are tuples
+             (geometry index, type name, first ring index, number of rings, polygon sizes), geometries
+             with invalid coordinates have no entry.
+    """
+    points = []
+    ring_offsets = [0]
+    entries = []
+    for index, (type_name, coordinates) in enumerate(geometries):
+        # noinspection PyBroadException
+        try:
+            rings, polygon_sizes = _flatten_geometry(type_name, coordinates)
+        except Exception as e:
+            print('ERROR TRANSFORMING GEOMETRY: ', type_name, e)
+            continue
+        first_ring = len(ring_offsets) - 1
+        for ring in rings:
+            points.extend(ring)
+            ring_offsets.append(len(points))
+        entries.append((index, type_name, first_ring, len(rings), polygon_sizes))
+
+    # noinspection PyBroadException
+    try:
+        x, y = _points_to_arrays(points)
+        return x, y, ring_offsets, entries
+    except Exception:
+        pass
+
+    # Find the geometries with invalid coordinates by converting the geometries one by one
+    x_parts = []
+    y_parts = []
+    valid_ring_offsets = [0]
+    valid_entries = []
+    for index, type_name, first_ring, num_rings, polygon_sizes in entries:
+        # noinspection PyBroadException
+        try:
+            geometry_x, geometry_y = _points_to_arrays(points[ring_offsets[first_ring]:
+                                                              ring_offsets[first_ring + num_rings]])
+        except Exception as e:
+            print('ERROR TRANSFORMING GEOMETRY: ', type_name, e)
+            continue
+        valid_entries.append((index, type_name, len(valid_ring_offsets) - 1, num_rings, polygon_sizes))
+        for ring_index in range(first_ring, first_ring + num_rings):
+            valid_ring_offsets.append(valid_ring_offsets[-1] + ring_offsets[ring_index + 1] - ring_offsets[ring_index])
+        x_parts.append(geometry_x)
+        y_parts.append(geometry_y)
+    if not x_parts:
+        return np.zeros(0, dtype=np.float64), np.zeros(0, dtype=np.float64), valid_ring_offsets, valid_entries
+    return np.concatenate(x_parts), np.concatenate(y_parts), valid_ring_offsets, valid_entries
+
+
+def _flatten_geometry(type_name: str, coordinates: Geometry) -> Tuple[List[Ring], Optional[List[int]]]:
+    """Return the rings of a geometry and, for multi-polygons, the number of rings of each polygon."""
+    if type_name == 'Point':
+        return [[coordinates]], None
+    if type_name == 'LineString' or type_name == 'MultiPoint':
+        return [coordinates], None
+    if type_name == 'Polygon' or type_name == 'MultiLineString':
+        return coordinates, None
+    if type_name == 'MultiPolygon':
+        return [ring for polygon in coordinates for ring in polygon], [len(polygon) for polygon in coordinates]
+    raise ValueError('unsupported geometry type "%s"' % type_name)
+
+
+def _unflatten_rings(x: List[float], y: List[float], ring_offsets: Sequence[int],
+                     first_ring: int, num_rings: int) -> List[Ring]:
+    rings = []
+    for ring_index in range(first_ring, first_ring + num_rings):
+        i1 = ring_offsets[ring_index]
+        i2 = ring_offsets[ring_index + 1]
+        rings.append(list(zip(x[i1:i2], y[i1:i2])))
+    return rings
+
+
+def _unflatten_geometry(type_name: str, rings: List[Ring], polygon_sizes: Optional[List[int]]) -> Geometry:
+    """Inverse of _flatten_geometry()."""
+    if type_name == 'Point':
+        return rings[0][0]
+    if type_name == 'LineString' or type_name == 'MultiPoint':
+        return rings[0]
+    if type_name == 'Polygon' or type_name == 'MultiLineString':
+        return rings
+    multi_polygon = []
+    i = 0
+    for polygon_size in polygon_sizes:
+        multi_polygon.append(rings[i:i + polygon_size])
+        i += polygon_size
+    return multi_polygon
+
+
+def _points_to_arrays(points: List[Point]) -> Tuple[np.ndarray, np.ndarray]:
+    if not points:
+        return np.zeros(0, dtype=np.float64), np.zeros(0, dtype=np.float64)
+    try:
+        xy = np.array(points, dtype=np.float64)
+    except ValueError:
+        # Mixed 2D and 3D points
+        xy = np.array([(point[0], point[1]) for point in points], dtype=np.float64)
+    if xy.ndim != 2 or xy.shape[1] < 2:
+        raise ValueError('invalid geometry coordinates')
+    return np.ascontiguousarray(xy[:, 0]), np.ascontiguousarray(xy[:, 1])
+
+
+def _simplify_rings(x: np.ndarray, y: np.ndarray, ring_offsets: List[int], entries: List[Tuple]):
+    """Simplify and pointify the rings of the given geometry entries, see transform_geometries()."""
+    x_parts = []
+    y_parts = []
+    new_ring_offsets = [0]
+    new_entries = []
+    for entry in entries:
+        index, type_name, first_ring, num_rings, polygon_sizes, conservation_ratio = entry
+        # noinspection PyBroadException
+        try:
+            if conservation_ratio == 0.0:
+                i1 = ring_offsets[first_ring]
+                i2 = ring_offsets[first_ring + num_rings]
+                if i1 == i2:
+                    raise ValueError('empty geometry')
+                px, py = np.zeros(1, dtype=x.dtype), np.zeros(1, dtype=y.dtype)
+                pointify_geometry(x[i1:i2], y[i1:i2], px, py)
+                rings = [(px, py)]
+            elif conservation_ratio < 1.0:
+                rings = []
+                for ring_index in range(first_ring, first_ring + num_rings):
+                    i1 = ring_offsets[ring_index]
+                    i2 = ring_offsets[ring_index + 1]
+                    rings.append(simplify_geometry(x[i1:i2], y[i1:i2], conservation_ratio))
+            else:
+                rings = []
+                for ring_index in range(first_ring, first_ring + num_rings):
+                    i1 = ring_offsets[ring_index]
+                    i2 = ring_offsets[ring_index + 1]
+                    rings.append((x[i1:i2], y[i1:i2]))
+        except Exception as e:
+            print('ERROR TRANSFORMING GEOMETRY: ', type_name, e)
+            continue
+        new_entries.append((index, type_name, len(new_ring_offsets) - 1, len(rings), polygon_sizes,
+                            conservation_ratio))
+        for ring_x, ring_y in rings:
+            x_parts.append(ring_x)
+            y_parts.append(ring_y)
+            new_ring_offsets.append(new_ring_offsets[-1] + ring_x.size)
+    if not x_parts:
+        return x[0:0], y[0:0], new_ring_offsets, new_entries
+    return np.concatenate(x_parts), np.concatenate(y_parts), new_ring_offsets, new_entries
+
+
+def _transform_geometry(type_name: str, source_prj: pyproj.Proj, target_prj: pyproj.Proj,
+                        conservation_ratio: float, coordinates: Geometry) -> Geometry:
+    transformed_coordinates = transform_geometries(source_prj, target_prj,
+                                                   [(type_name, coordinates, conservation_ratio)])[0]
+    if transformed_coordinates is None:
+        raise ValueError('failed to transform geometry of type "%s"' % type_name)
+    return transformed_coordinates
+
+
 # noinspection PyUnusedLocal conservation_ratio
 def _transform_point(source_prj: pyproj.Proj, target_prj: pyproj.Proj,
                      conservation_ratio: float, point: Point) -> Point:
-    must_reproject = source_prj is not None
-    if must_reproject:
-        return pyproj.transform(source_prj, target_prj, point[0], point[1])
-    return point
+    return _transform_geometry('Point', source_prj, target_prj, conservation_ratio, point)
 
 
 def _transform_line_string(source_prj: pyproj.Proj, target_prj: pyproj.Proj,
                            conservation_ratio: float, line_string: LineString) \
         -> Union[Point, LineString]:
-    must_reproject = source_prj is not None
-    must_pointify = conservation_ratio == 0.0
-    must_simplify = 0.0 <= conservation_ratio < 1.0
-    if not must_reproject and not must_simplify:
-        return line_string
-    x = np.array([coord[0] for coord in line_string])
-    y = np.array([coord[1] for coord in line_string])
-    if must_pointify:
-        px, py = np.zeros(1, dtype=x.dtype), np.zeros(1, dtype=y.dtype)
-        pointify_geometry(x, y, px, py)
-        if must_reproject:
-            px, py = pyproj.transform(source_prj, target_prj, px, py)
-        return float(px[0]), float(py[0])
-    else:
-        x, y = simplify_geometry(x, y, conservation_ratio)
-        if must_reproject:
-            x, y = pyproj.transform(source_prj, target_prj, x, y)
-        return [(float(x), float(y)) for x, y in zip(x, y)]
+    return _transform_geometry('LineString', source_prj, target_prj, conservation_ratio, line_string)
 
 
 def _transform_polygon(source_prj: pyproj.Proj, target_prj: pyproj.Proj,
-                       conservation_ratio: float, polygon: Union[Polygon, MultiLineString]) \
-        -> Union[Point, Polygon, MultiLineString]:
-    must_reproject = source_prj is not None
-    must_pointify = conservation_ratio == 0.0
-    must_simplify = 0.0 <= conservation_ratio < 1.0
-    if not must_reproject and not must_simplify:
-        return polygon
-    if must_pointify:
-        ring_coords = []
-        for ring in polygon:
-            ring_coords.extend(ring)
-        x = np.array([coord[0] for coord in ring_coords])
-        y = np.array([coord[1] for coord in ring_coords])
-        px, py = np.zeros(1, dtype=x.dtype), np.zeros(1, dtype=y.dtype)
-        pointify_geometry(x, y, px, py)
-        if must_reproject:
-            px, py = pyproj.transform(source_prj, target_prj, px, py)
-        return float(px[0]), float(py[0])
-    else:
-        transformed_polygon = []
-        for ring in polygon:
-            x = np.array([coord[0] for coord in ring])
-            y = np.array([coord[1] for coord in ring])
-            if must_simplify:
-                x, y = simplify_geometry(x, y, conservation_ratio)
-            if must_reproject:
-                x, y = pyproj.transform(source_prj, target_prj, x, y)
-            transformed_polygon.append([(float(x), float(y)) for x, y in zip(x, y)])
-        return transformed_polygon
+                       conservation_ratio: float, polygon: Polygon) \
+        -> Union[Point, Polygon]:
+    return _transform_geometry('Polygon', source_prj, target_prj, conservation_ratio, polygon)
 
 
 def _transform_multi_point(source_prj: pyproj.Proj, target_prj: pyproj.Proj,
                            conservation_ratio: float, multi_point: MultiPoint) \
         -> Union[Point, MultiPoint]:
-    return _transform_line_string(source_prj, target_prj, conservation_ratio, multi_point)
+    return _transform_geometry('MultiPoint', source_prj, target_prj, conservation_ratio, multi_point)
 
 
 def _transform_multi_line_string(source_prj: pyproj.Proj, target_prj: pyproj.Proj,
                                  conservation_ratio: float, multi_line_string: MultiLineString) \
         -> Union[Point, MultiLineString]:
-    return _transform_polygon(source_prj, target_prj, conservation_ratio, multi_line_string)
+    return _transform_geometry('MultiLineString', source_prj, target_prj, conservation_ratio, multi_line_string)
 
 
 def _transform_multi_polygon(source_prj: pyproj.Proj, target_prj: pyproj.Proj,
                              conservation_ratio: float, multi_polygon: MultiPolygon) \
         -> Union[Point, MultiPolygon]:
-    must_reproject = source_prj is not None
-    must_simplify = 0.0 <= conservation_ratio < 1.0
-    must_pointify = conservation_ratio == 0.0
-    if must_reproject or must_simplify:
-        if must_pointify:
-            ring_coords = []
-            for polygon in multi_polygon:
-                for ring in polygon:
-                    ring_coords.extend(ring)
-            x = np.array([coord[0] for coord in ring_coords])
-            y = np.array([coord[1] for coord in ring_coords])
-            px, py = np.zeros(1, dtype=x.dtype), np.zeros(1, dtype=y.dtype)
-            pointify_geometry(x, y, px, py)
-            if must_reproject:
-                px, py = pyproj.transform(source_prj, target_prj, px, py)
-            return float(px[0]), float(py[0])
-        else:
-            transformed_multi_polygon = []
-            for polygon in multi_polygon:
-                transformed_polygon = _transform_polygon(source_prj, target_prj, conservation_ratio, polygon)
-                transformed_multi_polygon.append(transformed_polygon)
-            return transformed_multi_polygon
-    return multi_polygon
+    return _transform_geometry('MultiPolygon', source_prj, target_prj, conservation_ratio, multi_polygon)
 
 
 _GEOMETRY_TRANSFORMS = dict(Point=_transform_point,
@@ -241,7 +424,8 @@ def write_feature_collection(feature_collection: Union[fiona.Collection, Iterabl
                              num_features: int = None,
                              max_num_display_geometries: int = -1,
                              max_num_display_geometry_points: int = -1,
-                             conservation_ratio: float = 1.0):
+                             conservation_ratio: float = 1.0,
+                             feature_geometries: 'FeatureGeometries' = None):
     if crs is None and hasattr(feature_collection, "crs"):
         crs = feature_collection.crs
 
@@ -256,27 +440,35 @@ def write_feature_collection(feature_collection: Union[fiona.Collection, Iterabl
 
     source_prj = target_prj = None
     if crs:
-        source_prj = pyproj.Proj(crs)
-        target_prj = pyproj.Proj(init='epsg:4326')
+        source_prj = _get_proj(crs)
+        target_prj = _get_proj(_WGS84_CRS)
 
     io.write('{"type": "FeatureCollection", "features": [\n')
     io.flush()
 
     num_features_written = 0
-    for feature in feature_collection:
-        feature_ok = _transform_feature(feature,
-                                        max_num_display_geometry_points,
-                                        conservation_ratio,
-                                        source_prj, target_prj)
-        if feature_ok:
-            if num_features_written > 0:
-                io.write(',\n')
-                io.flush()
-            if res_id is not None:
-                feature['_resId'] = res_id
-            # Note: io.write(json.dumps(feature)) is 3x faster than json.dump(feature, fp=io)
-            io.write(json.dumps(feature))
-            num_features_written += 1
+    feature_iterator = iter(feature_collection)
+    for batch_index in itertools.count():
+        features = list(itertools.islice(feature_iterator, _FEATURE_BATCH_SIZE))
+        if not features:
+            break
+        # Geometries prepared by feature_geometries are reprojected from its own CRS
+        geometry_batch = feature_geometries.get_batch(batch_index, features) if feature_geometries else None
+        features_ok = _transform_features(features,
+                                          max_num_display_geometry_points,
+                                          conservation_ratio,
+                                          source_prj, target_prj,
+                                          geometry_batch=geometry_batch)
+        for feature, feature_ok in zip(features, features_ok):
+            if feature_ok:
+                if num_features_written > 0:
+                    io.write(',\n')
+                if res_id is not None:
+                    feature['_resId'] = res_id
+                # Note: io.write(json.dumps(feature)) is 3x faster than json.dump(feature, fp=io)
+                io.write(json.dumps(feature))
+                num_features_written += 1
+        io.flush()
 
     io.write('\n]}\n')
     io.flush()
@@ -293,13 +485,13 @@ def write_feature(feature: Feature,
 
     source_prj = target_prj = None
     if crs:
-        source_prj = pyproj.Proj(crs)
-        target_prj = pyproj.Proj(init='epsg:4326')
+        source_prj = _get_proj(crs)
+        target_prj = _get_proj(_WGS84_CRS)
 
-    feature_ok = _transform_feature(feature,
-                                    max_num_display_geometry_points,
-                                    conservation_ratio,
-                                    source_prj, target_prj)
+    feature_ok = _transform_features([feature],
+                                     max_num_display_geometry_points,
+                                     conservation_ratio,
+                                     source_prj, target_prj)[0]
     if feature_ok:
         if res_id is not None:
             feature['_resId'] = res_id
@@ -308,43 +500,303 @@ def write_feature(feature: Feature,
         io.flush()
 
 
-def _transform_feature(feature: Feature,
-                       max_num_display_geometry_points: int,
-                       conservation_ratio: float,
-                       source_prj, target_prj):
-    feature_ok = True
-    if 'geometry' in feature:
+def _transform_features(features: List[Feature],
+                        max_num_display_geometry_points: int,
+                        conservation_ratio: float,
+                        source_prj, target_prj,
+                        geometry_batch: 'GeometryBatch' = None) -> List[bool]:
+    features_ok = [True] * len(features)
+    geometries = []
+    geometry_feature_indices = []
+    for index, feature in enumerate(features):
+        if 'geometry' in feature:
+            geometry = feature['geometry']
+            if get_geometry_transform(geometry['type']) is not None:
+                # noinspection PyBroadException
+                try:
+                    geometry_conservation_ratio = conservation_ratio
+                    if conservation_ratio > 0.0:
+                        num_geometry_points = get_geometry_point_counter(geometry['type'])(geometry)
+                        if 0 <= max_num_display_geometry_points < num_geometry_points:
+                            geometry_conservation_ratio = 0.0
+                except Exception as e:
+                    print('ERROR TRANSFORMING FEATURE: ', geometry['type'], e)
+                    features_ok[index] = False
+                    continue
+                geometries.append((geometry['type'], geometry['coordinates'], geometry_conservation_ratio))
+                geometry_feature_indices.append(index)
+
+    if geometry_batch is not None:
+        transformed_geometries = geometry_batch.transform_geometries(geometry_feature_indices, geometries)
+    else:
+        transformed_geometries = transform_geometries(source_prj, target_prj, geometries)
+
+    for index, (_, _, geometry_conservation_ratio), coordinates in zip(geometry_feature_indices,
+                                                                        geometries,
+                                                                        transformed_geometries):
+        if coordinates is None:
+            features_ok[index] = False
+            continue
+        feature = features[index]
         geometry = feature['geometry']
-        geometry_transform = get_geometry_transform(geometry['type'])
-        if geometry_transform is not None:
-            # print('transforming feature: ', feature)
-            coordinates = geometry['coordinates']
-            # noinspection PyBroadException
-            try:
-                geometry_conservation_ratio = conservation_ratio
-                if conservation_ratio > 0.0:
-                    num_geometry_points = get_geometry_point_counter(geometry['type'])(geometry)
-                    if 0 <= max_num_display_geometry_points < num_geometry_points:
-                        geometry_conservation_ratio = 0.0
-
-                coordinates = geometry_transform(source_prj, target_prj,
-                                                 geometry_conservation_ratio,
-                                                 coordinates)
-                geometry['coordinates'] = coordinates
-                if geometry_conservation_ratio == 0.0:
-                    geometry['type'] = 'Point'
-                if geometry_conservation_ratio < 1.0:
-                    # We may mask other simplifications,
-                    # for time being (simp & 0x01) != 0 means, geometry is simplified
-                    feature['_simp'] = 0x01
-            except Exception as e:
-                print('ERROR TRANSFORMING FEATURE: ', geometry['type'], e)
-                feature_ok = False
-                pass
-    return feature_ok
-
-
-@numba.jit(nopython=True)
+        geometry['coordinates'] = coordinates
+        if geometry_conservation_ratio == 0.0:
+            geometry['type'] = 'Point'
+        if geometry_conservation_ratio < 1.0:
+            # We may mask other simplifications,
+            # for time being (simp & 0x01) != 0 means, geometry is simplified
+            feature['_simp'] = 0x01
+
+    return features_ok
+
+
+class GeometryBatch:
+    """
+    The geometries of a batch of features, prepared so that they can be simplified to any level by just
+    selecting points. The points of all rings are reprojected once. The importance of a point is given by
+    its rank within its ring, see :py:func:`compute_point_ranks`, simplifying a ring to *n* points
+    selects the points whose rank is less than *n*.
+
+    Ranking is the expensive part, so points are ranked only when a geometry is first simplified,
+    not if geometries are only written at full resolution or as points. Until then, a reprojected batch
+    also keeps the points in their source coordinates, which are the ones ranked.
+
+    Instances are created by :py:meth:`compute`.
+    """
+
+    def __init__(self,
+                 num_features: int,
+                 is_reprojected: bool,
+                 entries: List[Optional[Tuple]],
+                 x: np.ndarray,
+                 y: np.ndarray,
+                 ring_offsets: np.ndarray,
+                 min_point_counts: np.ndarray,
+                 center_x: np.ndarray,
+                 center_y: np.ndarray,
+                 source_x: np.ndarray,
+                 source_y: np.ndarray):
+        self._num_features = num_features
+        self._is_reprojected = is_reprojected
+        self._entries = entries
+        self._x = x
+        self._y = y
+        self._ring_offsets = ring_offsets
+        self._min_point_counts = min_point_counts
+        self._center_x = center_x
+        self._center_y = center_y
+        self._source_x = source_x
+        self._source_y = source_y
+        self._ranks = None
+        self._ranks_lock = threading.Lock()
+
+    @property
+    def num_features(self) -> int:
+        return self._num_features
+
+    @property
+    def is_reprojected(self) -> bool:
+        return self._is_reprojected
+
+    @property
+    def num_points(self) -> int:
+        return self._x.size
+
+    @property
+    def is_ranked(self) -> bool:
+        return self._ranks is not None
+
+    @classmethod
+    def compute(cls, features: Sequence[Feature], source_prj: Optional[pyproj.Proj],
+                target_prj: Optional[pyproj.Proj]) -> 'GeometryBatch':
+        """
+        Compute the centers of the geometries of the given *features* and reproject their points and centers
+        from *source_prj* to *target_prj*. The points are ranked later, see :py:class:`GeometryBatch`.
+
+        :param features: The features.
+        :param source_prj: The source projection or ``None``, if the geometries shall not be reprojected.
+        :param target_prj: The target projection.
+        :return: A new geometry batch.
+        """
+        geometries = []
+        feature_indices = []
+        for index, feature in enumerate(features):
+            if 'geometry' in feature:
+                geometry = feature['geometry']
+                if get_geometry_transform(geometry['type']) is not None:
+                    geometries.append((geometry['type'], geometry['coordinates']))
+                    feature_indices.append(index)
+
+        x, y, ring_offsets, flat_entries = _flatten_geometries(geometries)
+        ring_offsets = np.array(ring_offsets, dtype=np.int64)
+
+        # Rings keep at least 4 points, line-strings at least 2, see simplify_geometry()
+        ring_sizes = np.diff(ring_offsets)
+        first_indices = ring_offsets[:-1][ring_sizes > 0]
+        last_indices = ring_offsets[1:][ring_sizes > 0] - 1
+        min_point_counts = np.full(ring_sizes.size, 2, dtype=np.int64)
+        min_point_counts[ring_sizes > 0] += 2 * ((x[first_indices] == x[last_indices]) &
+                                                 (y[first_indices] == y[last_indices]))
+
+        starts = np.array([ring_offsets[entry[2]] for entry in flat_entries], dtype=np.int64)
+        ends = np.array([ring_offsets[entry[2] + entry[3]] for entry in flat_entries], dtype=np.int64)
+        center_x = np.zeros(len(flat_entries), dtype=np.float64)
+        center_y = np.zeros(len(flat_entries), dtype=np.float64)
+        compute_centers(x, y, starts, ends, center_x, center_y)
+
+        source_x, source_y = x, y
+        if source_prj is not None and x.size > 0:
+            # Reproject points and centers in a single call
+            all_x, all_y = pyproj.transform(source_prj, target_prj,
+                                            np.concatenate((x, center_x)), np.concatenate((y, center_y)))
+            x, center_x = all_x[:x.size], all_x[x.size:]
+            y, center_y = all_y[:y.size], all_y[y.size:]
+
+        # Entries are (type name, first ring index, number of rings, polygon sizes, center index),
+        # empty geometries have no center
+        entries = [None] * len(features)
+        for center_index, flat_entry in enumerate(flat_entries):
+            geometry_index, type_name, first_ring, num_rings, polygon_sizes = flat_entry
+            if starts[center_index] == ends[center_index]:
+                center_index = -1
+            entries[feature_indices[geometry_index]] = type_name, first_ring, num_rings, polygon_sizes, center_index
+
+        return cls(len(features), source_prj is not None, entries,
+                   x, y, ring_offsets, min_point_counts, center_x, center_y, source_x, source_y)
+
+    def _get_ranks(self) -> np.ndarray:
+        with self._ranks_lock:
+            if self._ranks is None:
+                ranks = np.empty(self._source_x.size, dtype=np.int64)
+                compute_point_ranks(self._source_x, self._source_y, self._ring_offsets, ranks)
+                self._ranks = ranks
+                # The source coordinates are only needed for ranking
+                self._source_x = self._source_y = None
+            return self._ranks
+
+    def transform_geometries(self, feature_indices: Sequence[int],
+                             geometries: Sequence[Tuple[str, Geometry, float]]) -> List[Optional[Geometry]]:
+        """
+        Transform the geometries of the features at the given indices into this batch,
+        like :py:func:`transform_geometries` does.
+
+        :param feature_indices: The feature indices.
+        :param geometries: Sequence of tuples (*type_name*, *coordinates*, *conservation_ratio*), one for each
+               feature index, see :py:func:`transform_geometries`.
+        :return: The list of transformed geometry coordinates. Geometries which could not be transformed
+                 are ``None``.
+        """
+        conservation_ratios = []
+        for type_name, _, conservation_ratio in geometries:
+            if type_name == 'Point' or not 0.0 <= conservation_ratio < 1.0:
+                conservation_ratio = 1.0
+            conservation_ratios.append(conservation_ratio)
+
+        ring_offsets = self._ring_offsets
+        ring_sizes = np.diff(ring_offsets)
+        ring_conservation_ratios = np.ones(ring_sizes.size, dtype=np.float64)
+        must_unflatten = False
+        for feature_index, conservation_ratio in zip(feature_indices, conservation_ratios):
+            entry = self._entries[feature_index]
+            if entry is not None and conservation_ratio > 0.0 and (self._is_reprojected or conservation_ratio < 1.0):
+                must_unflatten = True
+                first_ring, num_rings = entry[1], entry[2]
+                ring_conservation_ratios[first_ring:first_ring + num_rings] = conservation_ratio
+
+        x = y = None
+        if must_unflatten:
+            point_counts = (ring_conservation_ratios * ring_sizes + 0.5).astype(np.int64)
+            point_counts = np.minimum(np.maximum(point_counts, self._min_point_counts), ring_sizes)
+            if np.array_equal(point_counts, ring_sizes):
+                x, y = self._x, self._y
+            else:
+                # This is where the precomputation pays off: simplification is a single comparison
+                selected = self._get_ranks() < np.repeat(point_counts, ring_sizes)
+                x, y = self._x[selected], self._y[selected]
+                ring_offsets = np.zeros(ring_sizes.size + 1, dtype=np.int64)
+                np.cumsum(point_counts, out=ring_offsets[1:])
+            # Converting whole buffers is a lot faster than converting every single coordinate
+            x = x.tolist()
+            y = y.tolist()
+            ring_offsets = ring_offsets.tolist()
+
+        transformed_geometries = []
+        for feature_index, (_, coordinates, _), conservation_ratio in zip(feature_indices, geometries,
+                                                                          conservation_ratios):
+            entry = self._entries[feature_index]
+            if not self._is_reprojected and conservation_ratio == 1.0:
+                transformed_geometries.append(coordinates)
+            elif entry is None:
+                transformed_geometries.append(None)
+            elif conservation_ratio == 0.0:
+                center_index = entry[4]
+                if center_index < 0:
+                    print('ERROR TRANSFORMING GEOMETRY: ', entry[0], 'empty geometry')
+                    transformed_geometries.append(None)
+                else:
+                    transformed_geometries.append((float(self._center_x[center_index]),
+                                                   float(self._center_y[center_index])))
+            else:
+                type_name, first_ring, num_rings, polygon_sizes, _ = entry
+                rings = _unflatten_rings(x, y, ring_offsets, first_ring, num_rings)
+                transformed_geometries.append(_unflatten_geometry(type_name, rings, polygon_sizes))
+        return transformed_geometries
+
+
+class FeatureGeometries:
+    """
+    The geometries of a feature collection prepared for simplification to any level, see :py:class:`GeometryBatch`.
+    The geometries of a batch of features are computed when :py:func:`write_feature_collection` first
+    writes that batch, so the feature collection must always be iterated in the same order.
+
+    :param crs: The coordinate reference system of the features or ``None``, if they are not reprojected.
+    """
+
+    def __init__(self, crs=None):
+        self._crs = crs
+        self._batches = []
+        self._lock = threading.Lock()
+
+    @property
+    def num_batches(self) -> int:
+        return len(self._batches)
+
+    def get_batch(self, batch_index: int, features: Sequence[Feature]) -> GeometryBatch:
+        """
+        Get the geometry batch at *batch_index*, compute it from the given *features* if it does not exist yet.
+
+        :param batch_index: The batch index, at most the current number of batches.
+        :param features: The features of the batch.
+        :return: The geometry batch.
+        """
+        batch = self._find_batch(batch_index, features)
+        if batch is not None:
+            return batch
+        source_prj = target_prj = None
+        if self._crs:
+            source_prj = _get_proj(self._crs)
+            target_prj = _get_proj(_WGS84_CRS)
+        # Computed without holding the lock, so that requests for existing batches are not blocked
+        batch = GeometryBatch.compute(features, source_prj, target_prj)
+        with self._lock:
+            if batch_index == len(self._batches):
+                self._batches.append(batch)
+        # Another thread may have added its batch in the meantime
+        return self._find_batch(batch_index, features)
+
+    def _find_batch(self, batch_index: int, features: Sequence[Feature]) -> Optional[GeometryBatch]:
+        with self._lock:
+            if batch_index < len(self._batches):
+                batch = self._batches[batch_index]
+                if batch.num_features != len(features):
+                    raise ValueError('feature collection has changed')
+                return batch
+            if batch_index != len(self._batches):
+                raise IndexError('batch_index out of range')
+            return None
+
+
+@numba.jit(nopython=True, cache=True)
 def pointify_geometry(x_data: np.ndarray, y_data: np.ndarray, px: np.ndarray, py: np.ndarray) -> None:
     """
     Convert a ring or line-string given by its coordinates *x_data* and *y_data* from *x_data.size* points to
@@ -366,7 +818,7 @@ def pointify_geometry(x_data: np.ndarray, y_data: np.ndarray, px: np.ndarray, py
         py[0] = y_data.mean()
 
 
-@numba.jit(nopython=True)
+@numba.jit(nopython=True, cache=True)
 def triangle_area(x_data: np.ndarray, y_data: np.ndarray, i0: int, i1: int, i2: int) -> float:
     """
     Compute area of triangle given by 3 points given by their coordinates *x_data* and *y_data*, and their
@@ -381,7 +833,6 @@ def triangle_area(x_data: np.ndarray, y_data: np.ndarray, i0: int, i1: int, i2:
     return 0.5 * abs(dx1 * dy2 - dy1 * dx2)
 
 
-@numba.jit(forceobj=True)
 def simplify_geometry(x_data: np.ndarray, y_data: np.ndarray, conservation_ratio: float) \
         -> Tuple[np.ndarray, np.ndarray]:
     """
@@ -404,113 +855,157 @@ def simplify_geometry(x_data: np.ndarray, y_data: np.ndarray, conservation_ratio
     if old_point_count <= new_point_count:
         return x_data, y_data
 
-    point_heap = PointHeap(x_data, y_data)
-    while point_heap.size > new_point_count:
-        point_heap.pop()
+    areas = np.empty(old_point_count, dtype=np.float64)
+    compute_effective_areas(x_data, y_data, areas)
+    indices = get_most_important_points(areas, new_point_count)
+    return x_data[indices], y_data[indices]
 
-    new_x_data = np.zeros(new_point_count, dtype=x_data.dtype)
-    new_y_data = np.zeros(new_point_count, dtype=y_data.dtype)
-    point = point_heap.first_point
-    i = 0
-    while point is not None:
-        index = point[1]
-        new_x_data[i] = x_data[index]
-        new_y_data[i] = y_data[index]
-        point = point[3]
-        i += 1
-
-    return new_x_data, new_y_data
-
-
-# TODO (forman): Optimize me!
-# This is an non-optimised version of PointHeap for testing only.
-# It uses the pure Python heapq implementation of a min-heap.
-# We should ASAP replace heapq by the jit-compiled cate.webapi.minheap implementation
-# so that we can compile the PointHeap class using @numba.jitclass().
-# See http://numba.pydata.org/numba-doc/dev/user/jitclass.html
-
-# PointHeapSpec = [
-#     ('_x_data', np.float64[:]),
-#     ('_y_data', np.float64[:]),
-#     ('_point_heap', np.int64[:]),
-#     ('_size', np.int64),
-# ]
-# @numba.jitclass(PointHeapSpec)
-class PointHeap:
-    def __init__(self, x_data: np.ndarray, y_data: np.ndarray):
-        size = x_data.size
-        if size < 2:
-            raise ValueError('x_data.size must be greater than 2')
-        if size != y_data.size:
-            raise ValueError('x_data.size must be equal to y_data.size')
-        self._x_data = x_data
-        self._y_data = y_data
-        self._point_heap = []
-        self._size = size
-
-        first_point = None
-        prev_point = None
-        for i in range(size):
-            curr_point = [-1.0, i, prev_point, None]
-            if prev_point is None:
-                first_point = curr_point
-            else:
-                prev_point[3] = curr_point
-            if 0 < i < size - 1:
-                curr_point[0] = triangle_area(x_data, y_data, i, i - 1, i + 1)
-                self._push(curr_point)
-            prev_point = curr_point
 
-        # Must store _first_point, so we can later loop through connected points
-        self._first_point = first_point
-        # _counter is used to generate unique indexes, which don't occur in valid points
-        self._counter = size
+def get_most_important_points(areas: np.ndarray, point_count: int) -> np.ndarray:
+    """
+    Get the indices of the *point_count* points with the largest effective *areas*,
+    see :py:func:`compute_effective_areas`. Of points with equal areas, the ones with larger indices are
+    preferred, which are the ones removed last by the Visvalingam–Whyatt algorithm.
 
-    @property
-    def size(self):
-        return self._size
+    :param areas: The effective areas of the points of a ring or line-string.
+    :param point_count: The number of points to be selected.
+    :return: The sorted point indices.
+    """
+    # Sorting is stable, so the reversed order is by decreasing area and then by decreasing index
+    order = np.argsort(areas, kind='mergesort')[::-1]
+    return np.sort(order[:point_count])
 
-    @property
-    def first_point(self):
-        return self._first_point
-
-    def pop(self):
-        """Remove and return the smallest-area point. Raise KeyError if empty."""
-        while self._point_heap:
-            point = heapq.heappop(self._point_heap)
-            prev_point = point[2]
-            next_point = point[3]
-            has_prev_point = prev_point is not None
-            has_next_point = next_point is not None
-            if has_prev_point or has_next_point:  # Not yet removed?
-                if has_prev_point:
-                    prev_point = self._update_point(prev_point)
-                if has_next_point:
-                    next_point = self._update_point(next_point)
-                if has_prev_point and has_next_point:
-                    prev_point[3] = next_point
-                    next_point[2] = prev_point
-                self._size -= 1
-                return point
-        raise KeyError('pop from an empty priority queue')
-
-    def _push(self, point):
-        heapq.heappush(self._point_heap, point)
-
-    def _update_point(self, point):
-        prev_point = point[2]
-        next_point = point[3]
-        if prev_point is not None and next_point is not None:
-            index = point[1]
-            self._counter += 1  # Generate a unique, invalid index
-            point[1] = self._counter
-            point[2] = point[3] = None  # Mark point as removed / invalid
-            area = triangle_area(self._x_data, self._y_data, index, prev_point[1], next_point[1])
-            new_point = [area, index, prev_point, next_point]
-            if prev_point is not None:
-                prev_point[3] = new_point
-            if next_point is not None:
-                next_point[2] = new_point
-            self._push(new_point)
-            return new_point
-        return point
+
+@numba.jit(nopython=True, cache=True)
+def compute_effective_areas(x_data: np.ndarray, y_data: np.ndarray, areas: np.ndarray) -> None:
+    """
+    Compute the effective areas of the points of a ring or line-string given by its coordinates *x_data* and
+    *y_data* using the Visvalingam–Whyatt algorithm.
+
+    The effective area of a point is the area of the triangle formed with its neighbours at the time the
+    point is removed, points are removed in order of increasing effective area. As the effective area of a
+    point is never less than the ones of the points removed before, simplifying a geometry to
+    any level only requires to select the points with the largest effective areas, or with effective areas
+    above some threshold. The first and last points have an infinite effective area.
+
+    See https://bost.ocks.org/mike/simplify/
+
+    :param x_data: The x coordinates.
+    :param y_data: The y coordinates.
+    :param areas: The resulting effective areas, must have *x_data.size* elements.
+    """
+    size = x_data.size
+    if size == 0:
+        return
+    areas[0] = np.inf
+    areas[size - 1] = np.inf
+    if size < 3:
+        return
+
+    # Points whose area changes are pushed again, outdated heap entries are skipped when popped.
+    # Every removed point pushes at most two points, so the heap never exceeds 3 * size entries.
+    heap_keys = np.empty(3 * size, dtype=np.float64)
+    heap_values = np.empty(3 * size, dtype=np.int64)
+    heap_size = size - 2
+    for i in range(1, size - 1):
+        area = triangle_area(x_data, y_data, i, i - 1, i + 1)
+        areas[i] = area
+        heap_keys[i - 1] = area
+        heap_values[i - 1] = i
+    minheap.build(heap_keys, heap_values, heap_size)
+
+    # A doubly linked list of the remaining points, -1 marks the ends, removed points are marked by -2
+    prev_indices = np.arange(-1, size - 1)
+    next_indices = np.arange(1, size + 1)
+    next_indices[size - 1] = -1
+    max_area = 0.0
+    while heap_size > 0:
+        area = heap_keys[0]
+        index = heap_values[0]
+        heap_size = minheap.remove_min(heap_keys, heap_values, heap_size, -np.inf)
+        if prev_indices[index] == -2 or area != areas[index]:
+            continue
+        if area > max_area:
+            max_area = area
+        areas[index] = max_area
+        prev_index = prev_indices[index]
+        next_index = next_indices[index]
+        next_indices[prev_index] = next_index
+        prev_indices[next_index] = prev_index
+        prev_indices[index] = -2
+        next_indices[index] = -2
+        for neighbour_index in (prev_index, next_index):
+            neighbour_prev_index = prev_indices[neighbour_index]
+            neighbour_next_index = next_indices[neighbour_index]
+            if neighbour_prev_index >= 0 and neighbour_next_index >= 0:
+                area = triangle_area(x_data, y_data, neighbour_index, neighbour_prev_index, neighbour_next_index)
+                if area < max_area:
+                    area = max_area
+                areas[neighbour_index] = area
+                heap_size = minheap.add(heap_keys, heap_values, heap_size, np.inf, area, neighbour_index)
+
+
+@numba.jit(nopython=True, cache=True)
+def compute_point_ranks(x_data: np.ndarray, y_data: np.ndarray, ring_offsets: np.ndarray, ranks: np.ndarray) -> None:
+    """
+    Compute the rank of each point of multiple rings or line-strings, whose coordinates *x_data* and *y_data*
+    are given at ``ring_offsets[i]:ring_offsets[i + 1]`` for ring *i*. The rank of a point is its position
+    within its ring when ordered by decreasing effective area, see :py:func:`compute_effective_areas`.
+    Simplifying a ring to *n* points therefore selects the points whose rank is less than *n*, which are
+    the points also selected by :py:func:`get_most_important_points`.
+
+    :param x_data: The x coordinates.
+    :param y_data: The y coordinates.
+    :param ring_offsets: The ring offsets into *x_data* and *y_data*.
+    :param ranks: The resulting ranks, must have *x_data.size* elements.
+    """
+    areas = np.empty(x_data.size, dtype=np.float64)
+    for ring_index in range(ring_offsets.size - 1):
+        i1 = ring_offsets[ring_index]
+        i2 = ring_offsets[ring_index + 1]
+        compute_effective_areas(x_data[i1:i2], y_data[i1:i2], areas[i1:i2])
+        order = np.argsort(areas[i1:i2], kind='mergesort')
+        size = i2 - i1
+        for rank in range(size):
+            ranks[i1 + order[size - 1 - rank]] = rank
+
+
+@numba.jit(nopython=True, cache=True)
+def compute_centers(x_data: np.ndarray, y_data: np.ndarray, starts: np.ndarray, ends: np.ndarray,
+                    center_x: np.ndarray, center_y: np.ndarray) -> None:
+    """
+    Compute the mass centers of multiple geometries, see :py:func:`pointify_geometry`. The coordinates of
+    geometry *i* are given by *x_data* and *y_data* at ``starts[i]:ends[i]``. Single points are their own center,
+    empty geometries get a zero center.
+
+    :param x_data: The x coordinates.
+    :param y_data: The y coordinates.
+    :param starts: The start indices of the geometries.
+    :param ends: The end indices of the geometries.
+    :param center_x: The resulting center x coordinates, must have *starts.size* elements.
+    :param center_y: The resulting center y coordinates, must have *starts.size* elements.
+    """
+    for i in range(starts.size):
+        i1 = starts[i]
+        i2 = ends[i]
+        if i2 - i1 == 1:
+            center_x[i] = x_data[i1]
+            center_y[i] = y_data[i1]
+        elif i2 > i1:
+            pointify_geometry(x_data[i1:i2], y_data[i1:i2], center_x[i:i + 1], center_y[i:i + 1])
+        else:
+            center_x[i] = 0.0
+            center_y[i] = 0.0
+
+
+def compile_kernels() -> None:
+    """
+    Compile the numba kernels used to simplify geometries, or load them from numba's cache,
+    so that this is not done by the first request that simplifies geometries.
+    """
+    x = np.array([0.0, 1.0, 1.0, 0.0, 0.0])
+    y = np.array([0.0, 0.0, 1.0, 1.0, 0.0])
+    compute_effective_areas(x, y, np.empty(x.size, dtype=np.float64))
+    compute_point_ranks(x, y, np.array([0, x.size], dtype=np.int64), np.empty(x.size, dtype=np.int64))
+    compute_centers(x, y, np.array([0], dtype=np.int64), np.array([x.size], dtype=np.int64),
+                    np.zeros(1, dtype=np.float64), np.zeros(1, dtype=np.float64))
@@ -0,0 +1,363 @@
+# The MIT License (MIT)
+# Copyright (c) 2016, 2017 by the ESA CCI Toolbox development team and contributors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is furnished to do
+# so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Description
+===========
+
+Image pyramids and tile caches of the workspaces served by the Web API.
+
+Every workspace has its own :py:class:`WorkspaceImagery` which is kept in the workspace's ``user_data``,
+so that the tiles of one workspace do not evict the tiles of another one. The number of pyramids per workspace
+is bounded, least recently used pyramids are disposed first, see :py:class:`PyramidRegistry`. The capacity of the in-memory
+tile caches is a global budget which is divided equally among all workspaces with open imagery.
+The imagery is closed together with its workspace, see :py:meth:`cate.core.workspace.Workspace.close`.
+
+Components
+==========
+"""
+
+import atexit
+import os.path
+from collections import OrderedDict
+from threading import RLock
+from typing import Any, Callable, Dict, List, Optional
+
+from PIL import features
+
+from ..conf import get_config
+from ..conf.defaults import \
+    WORKSPACE_CACHE_DIR_NAME, \
+    WEBAPI_TILE_FORMAT, \
+    WEBAPI_TILE_OVERVIEW_MODE, \
+    WEBAPI_TILE_PNG_COMPRESS_LEVEL, \
+    WEBAPI_TILE_PNG_PALETTE, \
+    WEBAPI_TILE_PREFETCH_NUM_WORKERS, \
+    WEBAPI_TILE_WEBP_QUALITY, \
+    WEBAPI_USE_WORKSPACE_IMAGERY_CACHE, \
+    WEBAPI_WORKSPACE_FILE_TILE_CACHE_CAPACITY, \
+    WEBAPI_WORKSPACE_FILE_TILE_CACHE_STORE, \
+    WEBAPI_WORKSPACE_MAX_NUM_PYRAMIDS, \
+    WEBAPI_WORKSPACE_MEM_TILE_CACHE_CAPACITY
+from ..core.workspace import Workspace
+from ..util.cache import Cache, ShardedCache, MemoryCacheStore, IndexedFileCacheStore, SegmentedFileCacheStore, \
+    POLICY_TINY_LFU
+from ..util.im import ImagePyramid, TilePrefetcher
+from ..version import __version__
+
+__author__ = "Norman Fomferra (Brockmann Consult GmbH)"
+
+#: The key of a workspace's imagery in its ``user_data``
+WORKSPACE_IMAGERY_KEY = 'imagery'
+
+USE_WORKSPACE_IMAGERY_CACHE = get_config().get('use_workspace_imagery_cache', WEBAPI_USE_WORKSPACE_IMAGERY_CACHE)
+
+WORKSPACE_IMAGERY_CACHE_STORE = get_config().get('workspace_imagery_cache_store',
+                                                 WEBAPI_WORKSPACE_FILE_TILE_CACHE_STORE)
+
+TILE_OVERVIEW_MODE = get_config().get('tile_overview_mode', WEBAPI_TILE_OVERVIEW_MODE)
+
+TILE_PREFETCH_NUM_WORKERS = get_config().get('tile_prefetch_num_workers', WEBAPI_TILE_PREFETCH_NUM_WORKERS)
+
+_TILE_MIME_TYPES = {'PNG': 'image/png', 'WEBP': 'image/webp'}
+
+_OPEN_IMAGERIES = []
+_OPEN_IMAGERIES_LOCK = RLock()
+
+
+class PyramidRegistry:
+    """
+    A registry of image pyramids bounded by a maximum number of pyramids.
+    If the maximum number is exceeded, the least recently used pyramids are removed and disposed,
+    see :py:meth:`cate.util.im.ImagePyramid.dispose`.
+
+    :param max_num_pyramids: the maximum number of pyramids
+    :param on_remove: optional function called with the ID of a pyramid before it is removed and disposed
+    """
+
+    def __init__(self,
+                 max_num_pyramids: int = WEBAPI_WORKSPACE_MAX_NUM_PYRAMIDS,
+                 on_remove: Callable[[str], None] = None):
+        self._max_num_pyramids = max_num_pyramids
+        self._on_remove = on_remove
+        self._pyramids = OrderedDict()
+        self._lock = RLock()
+
+    def __len__(self):
+        return len(self._pyramids)
+
+    def __contains__(self, pyramid_id: str):
+        return pyramid_id in self._pyramids
+
+    def get(self, pyramid_id: str) -> Optional[ImagePyramid]:
+        """
+        :param pyramid_id: the pyramid ID
+        :return: the pyramid with the given ID or None, if there is none
+        """
+        with self._lock:
+            pyramid = self._pyramids.get(pyramid_id)
+            if pyramid is not None:
+                self._pyramids.move_to_end(pyramid_id)
+            return pyramid
+
+    def add(self, pyramid_id: str, pyramid: ImagePyramid) -> ImagePyramid:
+        """
+        Add a pyramid unless there is already one with the given ID, e.g. because
+        another request created it concurrently.
+
+        :param pyramid_id: the pyramid ID
+        :param pyramid: the pyramid
+        :return: the pyramid with the given ID
+        """
+        evicted_pyramids = []
+        with self._lock:
+            pyramid = self._pyramids.setdefault(pyramid_id, pyramid)
+            self._pyramids.move_to_end(pyramid_id)
+            while len(self._pyramids) > self._max_num_pyramids:
+                evicted_pyramids.append(self._pyramids.popitem(last=False))
+        # Dispose without holding the lock, this may take some time
+        self._dispose(evicted_pyramids)
+        return pyramid
+
+    def clear(self):
+        """
+        Remove and dispose all pyramids.
+        """
+        with self._lock:
+            pyramids = list(self._pyramids.items())
+            self._pyramids.clear()
+        self._dispose(pyramids)
+
+    def _dispose(self, pyramids):
+        for pyramid_id, pyramid in pyramids:
+            if self._on_remove is not None:
+                self._on_remove(pyramid_id)
+            pyramid.dispose()
+
+
+class WorkspaceImagery:
+    """
+    The image pyramids and tile caches of a workspace.
+
+    There are two kinds of pyramids: *array pyramids* provide the transformed tiles of a data array,
+    while *image pyramids* provide color mapped RGB tiles computed from an array pyramid.
+    Image pyramids that differ only in their color mapping should share the same array pyramid.
+
+    :param base_dir: the workspace's base directory
+    :param mem_tile_cache_capacity: the capacity in bytes of the in-memory tile cache
+    :param file_tile_cache_store: if given, the kind of store of a file tile cache for encoded RGB tiles
+           in the workspace's cache directory, either ``'segments'`` or ``'files'``
+    :param file_tile_cache_capacity: the capacity in bytes of the file tile cache
+    :param tile_encoding: the encoding of the tiles in the file tile cache, see :py:func:`get_tile_encoding`,
+           defaults to the configured encoding
+    :param max_num_pyramids: the maximum number of pyramids of either kind
+    :param prefetch_num_workers: the number of threads prefetching tiles, if 0, there is no prefetcher
+    """
+
+    def __init__(self,
+                 base_dir: str,
+                 mem_tile_cache_capacity: int = WEBAPI_WORKSPACE_MEM_TILE_CACHE_CAPACITY,
+                 file_tile_cache_store: Optional[str] = None,
+                 file_tile_cache_capacity: int = WEBAPI_WORKSPACE_FILE_TILE_CACHE_CAPACITY,
+                 tile_encoding: Dict[str, Any] = None,
+                 max_num_pyramids: int = WEBAPI_WORKSPACE_MAX_NUM_PYRAMIDS,
+                 prefetch_num_workers: int = WEBAPI_TILE_PREFETCH_NUM_WORKERS):
+        self._base_dir = base_dir
+        self._mem_tile_cache = ShardedCache(MemoryCacheStore(),
+                                            capacity=mem_tile_cache_capacity,
+                                            threshold=0.75,
+                                            policy=POLICY_TINY_LFU)
+        self._file_tile_cache = None
+        if file_tile_cache_store:
+            self._file_tile_cache = _new_file_tile_cache(base_dir,
+                                                         file_tile_cache_store,
+                                                         file_tile_cache_capacity,
+                                                         tile_encoding or get_tile_encoding())
+        self._prefetcher = TilePrefetcher(num_workers=prefetch_num_workers) if prefetch_num_workers > 0 else None
+        on_remove = self._prefetcher.cancel if self._prefetcher else None
+        self._array_pyramids = PyramidRegistry(max_num_pyramids, on_remove=on_remove)
+        self._pyramids = PyramidRegistry(max_num_pyramids, on_remove=on_remove)
+        self._is_closed = False
+        self._lock = RLock()
+
+    @property
+    def base_dir(self) -> str:
+        return self._base_dir
+
+    @property
+    def mem_tile_cache(self) -> ShardedCache:
+        """The in-memory cache for the tiles of intermediate images, e.g. of transformed data arrays."""
+        return self._mem_tile_cache
+
+    @property
+    def file_tile_cache(self) -> Optional[Cache]:
+        """The file cache for encoded RGB tiles, or None if there is none."""
+        return self._file_tile_cache
+
+    @property
+    def prefetcher(self) -> Optional[TilePrefetcher]:
+        """The prefetcher for tiles of the image pyramids, or None if prefetching is disabled."""
+        return self._prefetcher
+
+    @property
+    def is_closed(self) -> bool:
+        return self._is_closed
+
+    @property
+    def array_pyramids(self) -> PyramidRegistry:
+        """The registry of array pyramids."""
+        return self._array_pyramids
+
+    @property
+    def pyramids(self) -> PyramidRegistry:
+        """The registry of image pyramids."""
+        return self._pyramids
+
+    def close(self):
+        """
+        Dispose all pyramids and clear the in-memory tile cache.
+        The file tile cache's store is closed, its tiles are kept.
+        """
+        with self._lock:
+            if self._is_closed:
+                return
+            self._is_closed = True
+            if self._prefetcher is not None:
+                self._prefetcher.close()
+            self._pyramids.clear()
+            self._array_pyramids.clear()
+            self._mem_tile_cache.clear()
+            if self._file_tile_cache is not None:
+                self._file_tile_cache.store.close()
+        _unregister_imagery(self)
+
+
+def get_tile_encoding(config: Dict[str, Any] = None) -> Dict[str, Any]:
+    """
+    Get the encoding of color mapped tiles from the configuration.
+
+    :param config: optional configuration, defaults to Cate's configuration
+    :return: keyword arguments for :py:class:`cate.util.im.ColorMappedRgbaImage`, namely
+             *format*, *palette*, *compress_level* and *quality*
+    """
+    if config is None:
+        config = get_config()
+    tile_format = config.get('tile_format', WEBAPI_TILE_FORMAT).upper()
+    if tile_format not in _TILE_MIME_TYPES:
+        raise ValueError('unknown tile format "%s", must be one of "PNG", "WEBP"' % tile_format)
+    if tile_format == 'WEBP' and not features.check('webp'):
+        print('warning: Pillow has no WEBP support, using PNG tiles instead')
+        tile_format = 'PNG'
+    return dict(format=tile_format,
+                palette=config.get('tile_png_palette', WEBAPI_TILE_PNG_PALETTE),
+                compress_level=config.get('tile_png_compress_level', WEBAPI_TILE_PNG_COMPRESS_LEVEL),
+                quality=config.get('tile_webp_quality', WEBAPI_TILE_WEBP_QUALITY))
+
+
+def get_tile_encoding_id(tile_encoding: Dict[str, Any]) -> str:
+    """
+    :param tile_encoding: a tile encoding, see :py:func:`get_tile_encoding`
+    :return: an identifier for the encoding, so that tiles in persistent caches do not outlive encoding changes
+    """
+    return '%s-%s-%s-%s' % (tile_encoding['format'].lower(),
+                            'p' if tile_encoding['palette'] else 'rgba',
+                            tile_encoding['compress_level'],
+                            tile_encoding['quality'])
+
+
+def get_tile_mime_type(tile_encoding: Dict[str, Any]) -> str:
+    """
+    :param tile_encoding: a tile encoding, see :py:func:`get_tile_encoding`
+    :return: the MIME type of the encoded tiles
+    """
+    return _TILE_MIME_TYPES[tile_encoding['format']]
+
+
+def get_tile_file_extension(tile_encoding: Dict[str, Any]) -> str:
+    """
+    :param tile_encoding: a tile encoding, see :py:func:`get_tile_encoding`
+    :return: the file name extension of the encoded tiles, e.g. ``'.png'``
+    """
+    return '.' + tile_encoding['format'].lower()
+
+
+def get_workspace_imagery(workspace: Workspace) -> WorkspaceImagery:
+    """
+    Get the imagery of the given workspace. If it has none yet, it is created and the
+    global in-memory tile cache budget is divided anew among all workspaces.
+
+    :param workspace: the workspace
+    :return: the workspace's imagery
+    """
+    with _OPEN_IMAGERIES_LOCK:
+        imagery = workspace.user_data.get(WORKSPACE_IMAGERY_KEY)
+        if imagery is None or imagery.is_closed:
+            file_tile_cache_store = WORKSPACE_IMAGERY_CACHE_STORE if USE_WORKSPACE_IMAGERY_CACHE else None
+            imagery = WorkspaceImagery(workspace.base_dir,
+                                       mem_tile_cache_capacity=_get_mem_tile_cache_capacity(len(_OPEN_IMAGERIES) + 1),
+                                       file_tile_cache_store=file_tile_cache_store,
+                                       prefetch_num_workers=TILE_PREFETCH_NUM_WORKERS)
+            workspace.user_data[WORKSPACE_IMAGERY_KEY] = imagery
+            _OPEN_IMAGERIES.append(imagery)
+            _divide_mem_tile_cache_budget()
+        return imagery
+
+
+def get_open_workspace_imageries() -> List[WorkspaceImagery]:
+    """
+    :return: the imagery of all workspaces, which has not been closed yet
+    """
+    with _OPEN_IMAGERIES_LOCK:
+        return list(_OPEN_IMAGERIES)
+
+
+@atexit.register
+def _close_open_imageries():
+    for imagery in get_open_workspace_imageries():
+        imagery.close()
+
+
+def _unregister_imagery(imagery: WorkspaceImagery):
+    with _OPEN_IMAGERIES_LOCK:
+        if imagery in _OPEN_IMAGERIES:
+            _OPEN_IMAGERIES.remove(imagery)
+            _divide_mem_tile_cache_budget()
+
+
+def _divide_mem_tile_cache_budget():
+    capacity = _get_mem_tile_cache_capacity(len(_OPEN_IMAGERIES))
+    for imagery in _OPEN_IMAGERIES:
+        imagery.mem_tile_cache.capacity = capacity
+
+
+def _get_mem_tile_cache_capacity(num_imageries: int) -> float:
+    return WEBAPI_WORKSPACE_MEM_TILE_CACHE_CAPACITY / max(1, num_imageries)
+
+
+def _new_file_tile_cache(base_dir: str, store: str, capacity: int, tile_encoding: Dict[str, Any]) -> Cache:
+    cache_dir = os.path.join(base_dir, WORKSPACE_CACHE_DIR_NAME, 'v%s' % __version__)
+    if store == 'files':
+        store = IndexedFileCacheStore(os.path.join(cache_dir, 'tiles'), get_tile_file_extension(tile_encoding))
+    elif store == 'segments':
+        store = SegmentedFileCacheStore(os.path.join(cache_dir, 'tile-segments'))
+    else:
+        raise ValueError('unknown tile cache store "%s", must be one of "segments", "files"' % store)
+    return Cache(store, capacity=capacity, threshold=0.75, policy=POLICY_TINY_LFU)
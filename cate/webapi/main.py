@@ -59,8 +59,9 @@ from cate.core.wsmanag import FSWorkspaceManager
 from cate.util.web import JsonRpcWebSocketHandler
 from cate.util.web.webapi import run_main, url_pattern, WebAPIRequestHandler, WebAPIExitHandler
 from cate.version import __version__
-from cate.webapi.rest import ResourcePlotHandler, CountriesGeoJSONHandler, ResVarTileHandler, \
-    ResFeatureCollectionHandler, ResFeatureHandler, ResVarCsvHandler, NE2Handler
+from cate.webapi.geojson import compile_kernels
+from cate.webapi.rest import THREAD_POOL, ResourcePlotHandler, CountriesGeoJSONHandler, ResVarTileHandler, \
+    ResVarDataTileHandler, ResFeatureCollectionHandler, ResFeatureHandler, ResVarCsvHandler, NE2Handler, CacheStatsHandler
 from cate.webapi.mpl import MplJavaScriptHandler, MplDownloadHandler, MplWebSocketHandler
 from cate.webapi.websocket import WebSocketService
 
@@ -109,11 +110,15 @@ def create_application():
         (url_pattern('/ws/res/geojson/{{base_dir}}/{{res_id}}/{{feature_index}}'), ResFeatureHandler),
         (url_pattern('/ws/res/csv/{{base_dir}}/{{res_id}}'), ResVarCsvHandler),
         (url_pattern('/ws/res/tile/{{base_dir}}/{{res_id}}/{{z}}/{{y}}/{{x}}.png'), ResVarTileHandler),
+        (url_pattern('/ws/res/data_tile/{{base_dir}}/{{res_id}}/{{z}}/{{y}}/{{x}}.bin'), ResVarDataTileHandler),
         (url_pattern('/ws/ne2/tile/{{z}}/{{y}}/{{x}}.jpg'), NE2Handler),
         (url_pattern('/ws/countries'), CountriesGeoJSONHandler),
+        (url_pattern('/ws/caches'), CacheStatsHandler),
 
     ])
     application.workspace_manager = FSWorkspaceManager()
+    # Compile the geometry simplification kernels in the background rather than on the first GeoJSON request
+    THREAD_POOL.submit(compile_kernels)
     return application
 
 
@@ -40,7 +40,7 @@ KeyArray = np.ndarray
 ValueArray = np.ndarray
 
 
-@numba.jit(nopython=True)
+@numba.jit(nopython=True, cache=True)
 def build(keys: KeyArray, values: ValueArray, size: int) -> None:
     """
     Turn the given array into a min-heap.
@@ -53,7 +53,7 @@ def build(keys: KeyArray, values: ValueArray, size: int) -> None:
             _heapify(keys, values, size, index)
 
 
-@numba.jit(nopython=True)
+@numba.jit(nopython=True, cache=True)
 def add(keys: KeyArray, values: ValueArray, size: int,
         max_key: KeyType, new_key: KeyType, new_value: ValueType) -> int:
     """
@@ -75,7 +75,7 @@ def add(keys: KeyArray, values: ValueArray, size: int,
     return size
 
 
-@numba.jit(nopython=True)
+@numba.jit(nopython=True, cache=True)
 def remove(keys: KeyArray, values: ValueArray, size: int,
            min_key: KeyType, index: int) -> int:
     """
@@ -103,7 +103,7 @@ def remove(keys: KeyArray, values: ValueArray, size: int,
     return size
 
 
-@numba.jit(nopython=True)
+@numba.jit(nopython=True, cache=True)
 def remove_min(keys: KeyArray, values: ValueArray, size: int,
                min_key: KeyType) -> int:
     """
@@ -118,7 +118,7 @@ def remove_min(keys: KeyArray, values: ValueArray, size: int,
     return remove(keys, values, size, min_key, 0)
 
 
-@numba.jit(nopython=True)
+@numba.jit(nopython=True, cache=True)
 def _heapify(keys: KeyArray, values: ValueArray, size: int, index: int) -> None:
     """
     :param keys: The heap's keys, ``0 <= size <= keys.size``.
@@ -143,7 +143,7 @@ def _heapify(keys: KeyArray, values: ValueArray, size: int, index: int) -> None:
         i = min_i
 
 
-@numba.jit(nopython=True)
+@numba.jit(nopython=True, cache=True)
 def _decrease(keys: KeyArray, values: ValueArray, size: int, index: int,
               new_key: KeyType, new_value: ValueType):
     """
@@ -168,7 +168,7 @@ def _decrease(keys: KeyArray, values: ValueArray, size: int, index: int,
         index = parent_i
 
 
-@numba.jit(nopython=True)
+@numba.jit(nopython=True, cache=True)
 def _swap(keys: KeyArray, values: ValueArray, index1: int, index2: int) -> None:
     key1 = keys[index1]
     keys[index1] = keys[index2]
@@ -178,17 +178,17 @@ def _swap(keys: KeyArray, values: ValueArray, index1: int, index2: int) -> None:
     values[index2] = value1
 
 
-@numba.jit(nopython=True)
+@numba.jit(nopython=True, cache=True)
 def _parent(index: int) -> int:
     return (index - 1) >> 1
 
 
-@numba.jit(nopython=True)
+@numba.jit(nopython=True, cache=True)
 def _left(index: int) -> int:
     return (index << 1) + 1
 
 
-@numba.jit(nopython=True)
+@numba.jit(nopython=True, cache=True)
 def _right(index: int) -> int:
     return (index << 1) + 2
 
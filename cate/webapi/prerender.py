@@ -0,0 +1,213 @@
+# The MIT License (MIT)
+# Copyright (c) 2016, 2017 by the ESA CCI Toolbox development team and contributors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is furnished to do
+# so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Description
+===========
+
+Offline rendering of the color mapped tiles of a workspace resource's variable, see ``cate res tiles``.
+
+The tiles are rendered by a pool of worker processes, each of which opens the workspace and computes the
+resource on its own. The encoded tiles are written by the calling process into the workspace's file tile cache,
+under the same IDs the Web API uses, so that the Web API serves them from disk when they are first viewed.
+The workspace should not be open in a running Web API service meanwhile, because the service does not see
+tiles added to its file tile cache by other processes.
+
+Components
+==========
+"""
+
+import multiprocessing
+from typing import List, Sequence, Tuple
+
+from .imagery import WorkspaceImagery, WORKSPACE_IMAGERY_CACHE_STORE
+from .rest import ResVarTileHandler
+from ..core.cdm import get_tiling_scheme
+from ..core.workspace import Workspace, WorkspaceError
+from ..util.im import TilingScheme
+from ..util.monitor import Monitor
+
+__author__ = "Norman Fomferra (Brockmann Consult GmbH)"
+
+#: A block of tiles given as (level, x1, y1, x2, y2), x2 and y2 are exclusive
+TileBlock = Tuple[int, int, int, int, int]
+
+# The workspace, imagery and image pyramid of a worker process, see _init_worker()
+_WORKER_STATE = None
+
+
+def render_tiles(base_dir: str,
+                 res_name: str,
+                 var_name: str,
+                 var_index: Sequence[int] = (),
+                 cmap_name: str = 'jet',
+                 cmap_min: float = float('nan'),
+                 cmap_max: float = float('nan'),
+                 max_level: int = None,
+                 block_size: int = 4,
+                 num_workers: int = None,
+                 monitor: Monitor = Monitor.NONE) -> int:
+    """
+    Render the color mapped tiles of a variable of a workspace resource up to the given level into the
+    workspace's file tile cache.
+
+    The variable and color mapping are given as in the Web API's tile requests. If *cmap_min* or *cmap_max*
+    are NaN, the tiles are those of a request without "min" or "max" argument.
+
+    :param base_dir: the workspace's base directory
+    :param res_name: the name of a dataset resource
+    :param var_name: the variable name
+    :param var_index: the indices into the variable's leading (non-spatial) dimensions
+    :param cmap_name: the color map name
+    :param cmap_min: the value mapped to the lowest color, NaN for the variable's minimum
+    :param cmap_max: the value mapped to the highest color, NaN for the variable's maximum
+    :param max_level: the highest pyramid level to be rendered, defaults to the highest level
+    :param block_size: the number of tiles in x and y direction rendered by a worker at once
+    :param num_workers: the number of worker processes, defaults to the number of CPUs.
+           If 0, tiles are rendered by the calling process.
+    :param monitor: a progress monitor
+    :return: the number of rendered tiles
+    """
+    var_index = tuple(var_index)
+    with monitor.starting('Rendering tiles', 100):
+        tiling_scheme, value_range = _get_tiling_scheme_and_value_range(base_dir, res_name, var_name, var_index,
+                                                                        cmap_min, cmap_max,
+                                                                        monitor.child(10))
+        if max_level is None or max_level >= tiling_scheme.num_levels:
+            max_level = tiling_scheme.num_levels - 1
+        blocks = get_tile_blocks(tiling_scheme, max_level, block_size)
+
+        init_args = (base_dir, res_name, var_name, var_index, cmap_name, cmap_min, cmap_max, value_range)
+        imagery = WorkspaceImagery(base_dir,
+                                   file_tile_cache_store=WORKSPACE_IMAGERY_CACHE_STORE,
+                                   prefetch_num_workers=0)
+        num_tiles = 0
+        try:
+            tile_cache = imagery.file_tile_cache
+            render_monitor = monitor.child(90)
+            with render_monitor.starting('Rendering %d tile blocks' % len(blocks), len(blocks)):
+                if num_workers == 0:
+                    _init_worker(*init_args)
+                    results = map(_render_tile_block, blocks)
+                    pool = None
+                else:
+                    pool = multiprocessing.Pool(num_workers, initializer=_init_worker, initargs=init_args)
+                    results = pool.imap_unordered(_render_tile_block, blocks)
+                try:
+                    for tiles in results:
+                        for tile_id, tile in tiles:
+                            tile_cache.put_value(tile_id, tile)
+                        num_tiles += len(tiles)
+                        render_monitor.progress(work=1)
+                        render_monitor.check_for_cancellation()
+                finally:
+                    if pool is not None:
+                        pool.terminate()
+                        pool.join()
+        finally:
+            # Persists the file tile cache's index
+            imagery.close()
+            _dispose_worker()
+    return num_tiles
+
+
+def get_tile_blocks(tiling_scheme: TilingScheme, max_level: int, block_size: int) -> List[TileBlock]:
+    """
+    Divide the tiles of the levels 0 to *max_level* into blocks of at most *block_size* x *block_size* tiles.
+    Blocks of higher levels come last, so that low resolution levels are rendered first.
+
+    :param tiling_scheme: the tiling scheme
+    :param max_level: the highest level
+    :param block_size: the maximum number of tiles of a block in x and y direction
+    :return: the list of tile blocks
+    """
+    if block_size < 1:
+        raise ValueError('block_size must be greater than zero')
+    blocks = []
+    for level in range(max_level + 1):
+        num_tiles_x, num_tiles_y = tiling_scheme.num_tiles(level)
+        for y1 in range(0, num_tiles_y, block_size):
+            for x1 in range(0, num_tiles_x, block_size):
+                blocks.append((level, x1, y1, min(x1 + block_size, num_tiles_x), min(y1 + block_size, num_tiles_y)))
+    return blocks
+
+
+def _get_tiling_scheme_and_value_range(base_dir: str, res_name: str, var_name: str, var_index: Tuple[int, ...],
+                                       cmap_min: float, cmap_max: float,
+                                       monitor: Monitor) -> Tuple[TilingScheme, Tuple[float, float]]:
+    workspace = _open_workspace(base_dir, res_name, monitor)
+    try:
+        dataset = workspace.resource_cache[res_name]
+        variable, _, array_index = ResVarTileHandler.get_var_array(dataset, res_name, var_name, var_index)
+        tiling_scheme = get_tiling_scheme(variable)
+        if tiling_scheme is None:
+            raise WorkspaceError('Variable "%s" of resource "%s" is not a spatial image' % (var_name, res_name))
+        # Computed once here, so that the workers do not compute the statistics again
+        value_range = ResVarTileHandler.get_value_range(workspace, res_name, var_name, array_index,
+                                                        cmap_min, cmap_max)
+        return tiling_scheme, value_range
+    finally:
+        workspace.close()
+
+
+def _open_workspace(base_dir: str, res_name: str, monitor: Monitor = Monitor.NONE) -> Workspace:
+    workspace = Workspace.open(base_dir)
+    try:
+        workspace.execute_workflow(res_name, monitor=monitor)
+    except BaseException:
+        workspace.close()
+        raise
+    return workspace
+
+
+def _init_worker(base_dir: str, res_name: str, var_name: str, var_index: Tuple[int, ...],
+                 cmap_name: str, cmap_min: float, cmap_max: float, value_range: Tuple[float, float]):
+    global _WORKER_STATE
+    workspace = _open_workspace(base_dir, res_name)
+    dataset = workspace.resource_cache[res_name]
+    variable, array, _ = ResVarTileHandler.get_var_array(dataset, res_name, var_name, var_index)
+    # Without a file tile cache, tiles are put into the file tile cache by the calling process only
+    imagery = WorkspaceImagery(base_dir, prefetch_num_workers=0)
+    array_id = ResVarTileHandler.get_array_id(res_name, var_name, var_index)
+    image_id = ResVarTileHandler.get_image_id(array_id, cmap_name, cmap_min, cmap_max)
+    array_pyramid = ResVarTileHandler.get_array_pyramid(imagery, array_id, variable, array)
+    pyramid = ResVarTileHandler.new_image_pyramid(array_pyramid, image_id, cmap_name, value_range, None)
+    _WORKER_STATE = workspace, imagery, pyramid
+
+
+def _dispose_worker():
+    global _WORKER_STATE
+    if _WORKER_STATE is not None:
+        workspace, imagery, _ = _WORKER_STATE
+        _WORKER_STATE = None
+        imagery.close()
+        workspace.close()
+
+
+def _render_tile_block(block: TileBlock) -> List[Tuple[str, bytes]]:
+    _, _, pyramid = _WORKER_STATE
+    level, x1, y1, x2, y2 = block
+    level_image = pyramid.get_level_image(level)
+    tiles = []
+    for y in range(y1, y2):
+        for x in range(x1, x2):
+            tiles.append((level_image.get_tile_id(x, y), level_image.get_tile(x, y)))
+    return tiles
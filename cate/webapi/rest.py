@@ -26,47 +26,55 @@ import concurrent.futures
 import datetime
 import os.path
 import time
+import uuid
 
 import fiona
 import geopandas as gpd
 import numpy as np
+import tornado.concurrent
+import tornado.ioloop
 import tornado.web
 import xarray as xr
 
 from .geojson import write_feature_collection, write_feature
+from .imagery import get_workspace_imagery, get_open_workspace_imageries, get_tile_encoding, \
+    get_tile_encoding_id, get_tile_mime_type, TILE_OVERVIEW_MODE
+from .simplification import get_resource_feature_geometries, get_file_feature_geometries
+from .statistics import get_variable_statistics
 from ..conf import get_config
-from ..conf.defaults import \
-    WORKSPACE_CACHE_DIR_NAME, \
-    WEBAPI_WORKSPACE_FILE_TILE_CACHE_CAPACITY, \
-    WEBAPI_WORKSPACE_MEM_TILE_CACHE_CAPACITY, \
-    WEBAPI_ON_ALL_CLOSED_AUTO_STOP_AFTER, \
-    WEBAPI_USE_WORKSPACE_IMAGERY_CACHE
+from ..conf.defaults import WEBAPI_ON_ALL_CLOSED_AUTO_STOP_AFTER, \
+    WEBAPI_TILE_COMPUTATION_MAX_QUEUE_SIZE, WEBAPI_TILE_COMPUTATION_NUM_WORKERS, WEBAPI_NE2_PRELOAD_TILES
 from ..core.cdm import get_tiling_scheme
 from ..core.types import GeoDataFrame
-from ..util.cache import Cache, MemoryCacheStore, FileCacheStore
-from ..util.im import ImagePyramid, TransformArrayImage, ColorMappedRgbaImage
+from ..util.im import ImagePyramid, TransformArrayImage, ColorMappedRgbaImage, get_default_tile_cache, encode_ndarray
 from ..util.im.ds import NaturalEarth2Image
 from ..util.misc import cwd
 from ..util.monitor import Monitor, ConsoleMonitor
-from ..util.web.webapi import WebAPIRequestHandler, check_for_auto_stop
+from ..util.web.webapi import WebAPIRequestHandler, WebAPIRequestError, BoundedRequestExecutor, check_for_auto_stop, \
+    make_etag
 from ..version import __version__
 
-# TODO (forman): We must keep a MemoryCacheStore Cache for each workspace.
-#                We can use the Workspace.user_data dict for this purpose.
-#                However, a global cache is fine as long as we have just one workspace open at a time.
-#
-MEM_TILE_CACHE = Cache(MemoryCacheStore(),
-                       capacity=WEBAPI_WORKSPACE_MEM_TILE_CACHE_CAPACITY,
-                       threshold=0.75)
-
-USE_WORKSPACE_IMAGERY_CACHE = get_config().get('use_workspace_imagery_cache', WEBAPI_USE_WORKSPACE_IMAGERY_CACHE)
-
 TRACE_TILE_PERF = False
 
 THREAD_POOL = concurrent.futures.ThreadPoolExecutor()
 
+#: Dedicated executor for tile computations, so that tiles do not compete with GeoJSON streaming
+TILE_EXECUTOR = BoundedRequestExecutor(
+    max_workers=get_config().get('tile_computation_num_workers', WEBAPI_TILE_COMPUTATION_NUM_WORKERS),
+    max_queue_size=get_config().get('tile_computation_max_queue_size', WEBAPI_TILE_COMPUTATION_MAX_QUEUE_SIZE))
+
+TILE_ENCODING = get_tile_encoding()
+TILE_ENCODING_ID = get_tile_encoding_id(TILE_ENCODING)
+TILE_MIME_TYPE = get_tile_mime_type(TILE_ENCODING)
+
 _NUM_GEOM_SIMP_LEVELS = 8
 
+#: Part of all entity tags of workspace resources, because resource update counts start from zero in every process
+_RESOURCE_ETAG_SALT = uuid.uuid4().hex
+
+#: Natural Earth tiles never change for a given Cate version
+_NE2_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
 # Explicitly load Cate-internal plugins.
 __import__('cate.ds')
 __import__('cate.ops')
@@ -74,10 +82,12 @@ __import__('cate.ops')
 
 # noinspection PyAbstractClass
 class NE2Handler(WebAPIRequestHandler):
-    PYRAMID = NaturalEarth2Image.get_pyramid()
+    PYRAMID = NaturalEarth2Image.get_pyramid(preload=get_config().get('ne2_preload_tiles', WEBAPI_NE2_PRELOAD_TILES))
 
     def get(self, z, y, x):
         # print('NE2Handler.get(%s, %s, %s)' % (z, y, x))
+        if self.set_cache_headers(make_etag('ne2', __version__), cache_control=_NE2_CACHE_CONTROL):
+            return
         self.set_header('Content-Type', 'image/jpg')
         self.write(NE2Handler.PYRAMID.get_tile(int(x), int(y), int(z)))
 
@@ -93,129 +103,359 @@ class WorkspaceResourceHandler(WebAPIRequestHandler):
         resource = workspace.resource_cache[res_name]
         return workspace, res_id, res_name, resource
 
+    @classmethod
+    def get_resource_etag(cls, workspace, res_name: str, *parts) -> str:
+        """
+        Make an entity tag for a representation of a workspace resource, which changes whenever the resource
+        is updated or replaced.
+
+        :param workspace: the workspace
+        :param res_name: the resource name
+        :param parts: the parameters of the representation, e.g. the variable and its color mapping
+        :return: the quoted entity tag
+        """
+        resource_cache = workspace.resource_cache
+        return make_etag(_RESOURCE_ETAG_SALT,
+                         workspace.base_dir,
+                         res_name,
+                         resource_cache.get_id(res_name),
+                         resource_cache.get_update_count(res_name),
+                         *parts)
+
 
 # noinspection PyAbstractClass
-class ResVarTileHandler(WorkspaceResourceHandler):
-    PYRAMIDS = None
+class ResTileHandler(WorkspaceResourceHandler):
+    """
+    Base class for handlers of tile requests, which compute tiles off the IOLoop on the TILE_EXECUTOR.
+    """
 
-    def get(self, base_dir, res_id, z, y, x):
-        try:
-            workspace, res_id, res_name, dataset = self.get_workspace_resource(base_dir, res_id)
+    def __init__(self, application, request, **kwargs):
+        super().__init__(application, request, **kwargs)
+        self._is_connection_closed = False
+
+    def on_connection_close(self):
+        self._is_connection_closed = True
+
+    def submit_tile_computation(self, fn, *args):
+        """
+        Submit a tile computation to the TILE_EXECUTOR. If there are too many pending tile computations,
+        "503 Service Unavailable" is written and None is returned.
+        The computation is dropped if the client closes the connection before it starts.
+
+        :param fn: the computation
+        :param args: the computation's arguments
+        :return: a future for the computation's result, or None
+        """
+        future = TILE_EXECUTOR.submit(fn, *args, is_stale=lambda: self._is_connection_closed)
+        if future is None:
+            self.set_status(503)
+            self.set_header('Retry-After', '1')
+            self.write_status_error(message='Too many pending tile requests')
+        return future
+
+    @classmethod
+    def get_array_id(cls, res_name: str, var_name: str, var_index) -> str:
+        """
+        :return: the ID of the array pyramid of a variable's 2D image array
+        """
+        return '%s-%s-%s' % (res_name,
+                             var_name,
+                             ','.join(map(str, var_index)))
+
+    @classmethod
+    def get_var_array(cls, dataset, res_name: str, var_name: str, var_index):
+        """
+        Get the 2D image array of a variable.
+
+        :return: a triple comprising the variable, the 2D image array, and the indices into
+                 the variable's leading dimensions used to select the array
+        """
+        if not isinstance(dataset, xr.Dataset):
+            raise WebAPIRequestError('Resource "%s" must be a Dataset' % res_name)
+
+        variable = dataset[var_name]
+
+        # Make sure we work with 2D image arrays only
+        if variable.ndim == 2:
+            array = variable
+            var_index = ()
+        elif variable.ndim > 2:
+            if not var_index or len(var_index) != variable.ndim - 2:
+                var_index = (0,) * (variable.ndim - 2)
+
+            print('var_index =', var_index)
+            # noinspection PyTypeChecker
+            array = variable[tuple(var_index) + (slice(None), slice(None),)]
+        else:
+            raise WebAPIRequestError('Variable must be an N-D Dataset with N >= 2, '
+                                     'but "%s" is only %d-D' % (var_name, variable.ndim))
+        return variable, array, tuple(var_index)
+
+    @classmethod
+    def get_array_pyramid(cls, imagery, array_id: str, variable, array) -> ImagePyramid:
+        """
+        Get the pyramid of transformed (masked and y-flipped) array tiles, create it if it does not exist yet.
+        """
+        array_pyramid = imagery.array_pyramids.get(array_id)
+        if array_pyramid is None:
+            def array_image_id_factory(level):
+                return 'arr-%s/%s' % (array_id, level)
+
+            tiling_scheme = get_tiling_scheme(variable)
+            if tiling_scheme is None:
+                raise WebAPIRequestError('Internal error: failed to compute tiling scheme for array_id="%s"'
+                                         % array_id)
+
+            no_data_value = variable.attrs.get('_FillValue')
+            mem_tile_cache = imagery.mem_tile_cache
+
+            print('tiling_scheme =', repr(tiling_scheme))
+            array_pyramid = ImagePyramid.create_from_array(array, tiling_scheme,
+                                                           level_image_id_factory=array_image_id_factory,
+                                                           overview_mode=TILE_OVERVIEW_MODE,
+                                                           overview_no_data_value=no_data_value)
+            array_pyramid = array_pyramid.apply(lambda image, level:
+                                                TransformArrayImage(image,
+                                                                    image_id='tra-%s/%d' % (array_id, level),
+                                                                    no_data_value=no_data_value,
+                                                                    force_masked=True,
+                                                                    flip_y=tiling_scheme.geo_extent.inv_y,
+                                                                    tile_cache=mem_tile_cache))
+            array_pyramid = imagery.array_pyramids.add(array_id, array_pyramid)
+        return array_pyramid
+
+    @classmethod
+    def get_pyramid_tile(cls, imagery, pyramid: ImagePyramid, pyramid_id: str, x: int, y: int, z: int,
+                         prefetch: bool = True):
+        """
+        Get a tile of the given pyramid and, if *prefetch* is True, prefetch its neighbours and children.
+        """
+        if TRACE_TILE_PERF:
+            print('PERF: >>> Tile:', pyramid_id, z, y, x)
+
+        prefetcher = imagery.prefetcher
+        t1 = time.perf_counter()
+        if prefetcher is not None:
+            with prefetcher.foreground():
+                tile = pyramid.get_tile(x, y, z)
+        else:
+            tile = pyramid.get_tile(x, y, z)
+        t2 = time.perf_counter()
+
+        if TRACE_TILE_PERF:
+            print('PERF: <<< Tile:', pyramid_id, z, y, x, 'took', t2 - t1, 'seconds')
+
+        if prefetch:
+            cls.prefetch_pyramid_tiles(imagery, pyramid, pyramid_id, x, y, z)
+
+        return tile
+
+    @classmethod
+    def prefetch_pyramid_tiles(cls, imagery, pyramid: ImagePyramid, pyramid_id: str, x: int, y: int, z: int):
+        """
+        Prefetch the neighbours and children of a tile of the given pyramid, if the imagery has a prefetcher.
+        """
+        prefetcher = imagery.prefetcher
+        if prefetcher is not None:
+            # Warm the caches for panning and zooming in
+            prefetcher.prefetch(pyramid, x, y, z, group_id=pyramid_id)
 
-            # GLOBAL_LOCK.acquire()
 
-            if not isinstance(dataset, xr.Dataset):
-                self.write_status_error(message='Resource "%s" must be a Dataset' % res_name)
-                return
+# noinspection PyAbstractClass
+class ResVarTileHandler(ResTileHandler):
 
+    @tornado.web.asynchronous
+    @tornado.gen.coroutine
+    def get(self, base_dir, res_id, z, y, x):
+        try:
             var_name = self.get_query_argument('var')
             var_index = self.get_query_argument_int_tuple('index', ())
             cmap_name = self.get_query_argument('cmap', default='jet')
             cmap_min = self.get_query_argument_float('min', default=float('nan'))
             cmap_max = self.get_query_argument_float('max', default=float('nan'))
 
-            if ResVarTileHandler.PYRAMIDS is None:
-                ResVarTileHandler.PYRAMIDS = dict()
+            workspace, _, res_name, _ = self.get_workspace_resource(base_dir, res_id)
+            etag = self.get_resource_etag(workspace, res_name, 'tile', int(z), int(y), int(x),
+                                          var_name, var_index, cmap_name, cmap_min, cmap_max, TILE_ENCODING_ID)
+            if self.set_cache_headers(etag):
+                # The client's tile is still valid, so the pyramid is not touched at all
+                self.finish()
+                return
 
-            array_id = '%s-%s-%s' % (res_name,
-                                     var_name,
-                                     ','.join(map(str, var_index)))
-            image_id = '%s-%s-%s-%s' % (array_id,
-                                        cmap_name,
-                                        cmap_min,
-                                        cmap_max)
+            # Compute tiles off the IOLoop, so that slow reads and encodings do not stall other requests
+            future = self.submit_tile_computation(self._get_tile, base_dir, res_id, int(z), int(y), int(x),
+                                                  var_name, var_index, cmap_name, cmap_min, cmap_max)
+            if future is not None:
+                tile = yield future
+                self.set_header('Content-Type', TILE_MIME_TYPE)
+                # Tiles restored from a SegmentedFileCacheStore are memoryviews, but Tornado only writes bytes
+                self.write(bytes(tile) if isinstance(tile, memoryview) else tile)
+        except concurrent.futures.CancelledError:
+            # The client has closed the connection before the tile computation started
+            return
+        except WebAPIRequestError as e:
+            self.write_status_error(message=str(e))
+        except Exception as e:
+            self.write_status_error(exception=e)
+        self.finish()
 
-            pyramid_id = '%s-%s' % (base_dir, image_id)
+    def _get_tile(self, base_dir, res_id, z: int, y: int, x: int,
+                  var_name: str, var_index, cmap_name: str, cmap_min: float, cmap_max: float):
+        workspace, res_id, res_name, dataset = self.get_workspace_resource(base_dir, res_id)
 
-            if pyramid_id in ResVarTileHandler.PYRAMIDS:
-                pyramid = ResVarTileHandler.PYRAMIDS[pyramid_id]
-            else:
-                variable = dataset[var_name]
-                no_data_value = variable.attrs.get('_FillValue')
-
-                # Make sure we work with 2D image arrays only
-                if variable.ndim == 2:
-                    array = variable
-                elif variable.ndim > 2:
-                    if not var_index or len(var_index) != variable.ndim - 2:
-                        var_index = (0,) * (variable.ndim - 2)
-
-                    # noinspection PyTypeChecker
-                    var_index += (slice(None), slice(None),)
-
-                    print('var_index =', var_index)
-                    array = variable[var_index]
-                else:
-                    self.write_status_error(message='Variable must be an N-D Dataset with N >= 2, '
-                                                    'but "%s" is only %d-D' % (var_name, variable.ndim))
-                    return
+        array_id = self.get_array_id(res_name, var_name, var_index)
+        image_id = self.get_image_id(array_id, cmap_name, cmap_min, cmap_max)
 
-                cmap_min = np.nanmin(array.values) if np.isnan(cmap_min) else cmap_min
-                cmap_max = np.nanmax(array.values) if np.isnan(cmap_max) else cmap_max
-                print('cmap_min =', cmap_min)
-                print('cmap_max =', cmap_max)
-
-                if USE_WORKSPACE_IMAGERY_CACHE:
-                    mem_tile_cache = MEM_TILE_CACHE
-                    rgb_tile_cache_dir = os.path.join(base_dir, WORKSPACE_CACHE_DIR_NAME, 'v%s' % __version__, 'tiles')
-                    rgb_tile_cache = Cache(FileCacheStore(rgb_tile_cache_dir, ".png"),
-                                           capacity=WEBAPI_WORKSPACE_FILE_TILE_CACHE_CAPACITY,
-                                           threshold=0.75)
-                else:
-                    mem_tile_cache = MEM_TILE_CACHE
-                    rgb_tile_cache = None
-
-                def array_image_id_factory(level):
-                    return 'arr-%s/%s' % (array_id, level)
-
-                tiling_scheme = get_tiling_scheme(variable)
-                if tiling_scheme is None:
-                    self.write_status_error(
-                        message='Internal error: failed to compute tiling scheme for array_id="%s"' % array_id)
-                    return
+        imagery = get_workspace_imagery(workspace)
+        pyramid_id = image_id
+        pyramid = imagery.pyramids.get(pyramid_id)
+        if pyramid is None:
+            variable, array, array_index = self.get_var_array(dataset, res_name, var_name, var_index)
 
-                print('tiling_scheme =', repr(tiling_scheme))
-                pyramid = ImagePyramid.create_from_array(array, tiling_scheme,
-                                                         level_image_id_factory=array_image_id_factory)
-                pyramid = pyramid.apply(lambda image, level:
-                                        TransformArrayImage(image,
-                                                            image_id='tra-%s/%d' % (array_id, level),
-                                                            no_data_value=no_data_value,
-                                                            force_masked=True,
-                                                            flip_y=tiling_scheme.geo_extent.inv_y,
-                                                            tile_cache=mem_tile_cache))
-                pyramid = pyramid.apply(lambda image, level:
-                                        ColorMappedRgbaImage(image,
-                                                             image_id='rgb-%s/%d' % (image_id, level),
-                                                             value_range=(cmap_min, cmap_max),
-                                                             cmap_name=cmap_name,
-                                                             encode=True,
-                                                             format='PNG',
-                                                             tile_cache=rgb_tile_cache))
-                ResVarTileHandler.PYRAMIDS[pyramid_id] = pyramid
-                if TRACE_TILE_PERF:
-                    print('Created pyramid "%s":' % pyramid_id)
-                    print('  tile_size:', pyramid.tile_size)
-                    print('  num_level_zero_tiles:', pyramid.num_level_zero_tiles)
-                    print('  num_levels:', pyramid.num_levels)
+            value_range = self.get_value_range(workspace, res_name, var_name, array_index, cmap_min, cmap_max)
+            print('cmap_min =', value_range[0])
+            print('cmap_max =', value_range[1])
 
+            # Pyramids that differ only in their color mapping share the same array pyramid
+            array_pyramid = self.get_array_pyramid(imagery, array_id, variable, array)
+
+            pyramid = self.new_image_pyramid(array_pyramid, image_id, cmap_name, value_range,
+                                             imagery.file_tile_cache)
+            pyramid = imagery.pyramids.add(pyramid_id, pyramid)
             if TRACE_TILE_PERF:
-                print('PERF: >>> Tile:', image_id, z, y, x)
+                print('Created pyramid "%s":' % pyramid_id)
+                print('  tile_size:', pyramid.tile_size)
+                print('  num_level_zero_tiles:', pyramid.num_level_zero_tiles)
+                print('  num_levels:', pyramid.num_levels)
+
+        tile = self.get_pyramid_tile(imagery, pyramid, pyramid_id, x, y, z, prefetch=False)
+
+        if pyramid.get_level_image(z).tile_cache is not None:
+            self.prefetch_pyramid_tiles(imagery, pyramid, pyramid_id, x, y, z)
+        else:
+            # Without a tile cache, prefetched RGB tiles would be color mapped and encoded in vain,
+            # so only the tiles of the shared array pyramid are prefetched
+            array_pyramid = imagery.array_pyramids.get(array_id)
+            if array_pyramid is not None:
+                self.prefetch_pyramid_tiles(imagery, array_pyramid, array_id, x, y, z)
+
+        return tile
+
+    @classmethod
+    def get_image_id(cls, array_id: str, cmap_name: str, cmap_min: float, cmap_max: float) -> str:
+        """
+        :return: the ID of a color mapped image pyramid, *cmap_min* and *cmap_max* are the requested values,
+                 which may be NaN
+        """
+        return '%s-%s-%s-%s' % (array_id,
+                                cmap_name,
+                                cmap_min,
+                                cmap_max)
+
+    @classmethod
+    def get_value_range(cls, workspace, res_name: str, var_name: str, array_index,
+                        cmap_min: float, cmap_max: float):
+        """
+        Get the display value range, replacing a NaN *cmap_min* or *cmap_max* by the
+        minimum or maximum of the variable's 2D image array.
+        """
+        if np.isnan(cmap_min) or np.isnan(cmap_max):
+            # Computed in a single pass and cached until the resource changes
+            statistics = get_variable_statistics(workspace, res_name, var_name, array_index)
+            if statistics['count']:
+                cmap_min = statistics['min'] if np.isnan(cmap_min) else cmap_min
+                cmap_max = statistics['max'] if np.isnan(cmap_max) else cmap_max
+        return cmap_min, cmap_max
+
+    @classmethod
+    def new_image_pyramid(cls, array_pyramid: ImagePyramid, image_id: str, cmap_name: str, value_range,
+                          rgb_tile_cache) -> ImagePyramid:
+        """
+        Create a pyramid of color mapped and encoded RGB tiles from an array pyramid.
+        The IDs of its level images include the tile encoding, so that tiles in persistent
+        tile caches never outlive an encoding change.
+        """
+        return array_pyramid.apply(lambda image, level:
+                                   ColorMappedRgbaImage(image,
+                                                        image_id='rgb-%s-%s/%d' % (image_id,
+                                                                                   TILE_ENCODING_ID,
+                                                                                   level),
+                                                        value_range=value_range,
+                                                        cmap_name=cmap_name,
+                                                        encode=True,
+                                                        tile_cache=rgb_tile_cache,
+                                                        **TILE_ENCODING))
 
-            t1 = time.clock()
-            tile = pyramid.get_tile(int(x), int(y), int(z))
-            t2 = time.clock()
 
-            self.set_header('Content-Type', 'image/png')
-            self.write(tile)
+# noinspection PyAbstractClass
+class ResVarDataTileHandler(ResTileHandler):
+    """
+    Provides the data of a variable's image tiles as binary data, so that clients can color-map tiles themselves.
+    Unlike color mapped tiles, data tiles do not depend on the color map and value range.
 
-            if TRACE_TILE_PERF:
-                print('PERF: <<< Tile:', image_id, z, y, x, 'took', t2 - t1, 'seconds')
+    Query arguments are *var* and *index* as for color mapped tiles, and *dtype*, the data type of the
+    values, one of "float32" (default), "float16", "uint16", and *compression*, which may be "zlib".
+    The layout of the data is described by response headers, see :py:func:`cate.util.im.encode_ndarray`.
+    """
 
-            # GLOBAL_LOCK.release()
+    @tornado.web.asynchronous
+    @tornado.gen.coroutine
+    def get(self, base_dir, res_id, z, y, x):
+        try:
+            var_name = self.get_query_argument('var')
+            var_index = self.get_query_argument_int_tuple('index', ())
+            dtype = self.get_query_argument('dtype', default='float32')
+            compression = self.get_query_argument('compression', default=None)
+            if dtype not in ('float32', 'float16', 'uint16'):
+                raise WebAPIRequestError('dtype must be one of "float32", "float16", "uint16", but was "%s"' % dtype)
+            if compression not in (None, 'zlib'):
+                raise WebAPIRequestError('compression must be "zlib", but was "%s"' % compression)
+
+            workspace, _, res_name, _ = self.get_workspace_resource(base_dir, res_id)
+            etag = self.get_resource_etag(workspace, res_name, 'data_tile', int(z), int(y), int(x),
+                                          var_name, var_index, dtype, compression)
+            if self.set_cache_headers(etag):
+                self.finish()
+                return
 
+            future = self.submit_tile_computation(self._get_data_tile, base_dir, res_id, int(z), int(y), int(x),
+                                                  var_name, var_index, dtype, compression)
+            if future is not None:
+                data, info = yield future
+                self.set_header('Content-Type', 'application/octet-stream')
+                self.set_header('X-Tile-Width', str(info['width']))
+                self.set_header('X-Tile-Height', str(info['height']))
+                self.set_header('X-Tile-Dtype', info['dtype'])
+                if info['compression']:
+                    self.set_header('X-Tile-Compression', info['compression'])
+                if 'scale' in info:
+                    self.set_header('X-Tile-Scale', repr(info['scale']))
+                    self.set_header('X-Tile-Offset', repr(info['offset']))
+                    self.set_header('X-Tile-No-Data', str(info['no_data']))
+                self.write(data)
+        except concurrent.futures.CancelledError:
+            # The client has closed the connection before the tile computation started
+            return
+        except WebAPIRequestError as e:
+            self.write_status_error(message=str(e))
         except Exception as e:
             self.write_status_error(exception=e)
+        self.finish()
+
+    def _get_data_tile(self, base_dir, res_id, z: int, y: int, x: int,
+                       var_name: str, var_index, dtype: str, compression: str):
+        workspace, res_id, res_name, dataset = self.get_workspace_resource(base_dir, res_id)
+
+        array_id = self.get_array_id(res_name, var_name, var_index)
+
+        imagery = get_workspace_imagery(workspace)
+        array_pyramid = imagery.array_pyramids.get(array_id)
+        if array_pyramid is None:
+            variable, array, _ = self.get_var_array(dataset, res_name, var_name, var_index)
+            array_pyramid = self.get_array_pyramid(imagery, array_id, variable, array)
+
+        tile = self.get_pyramid_tile(imagery, array_pyramid, array_id, x, y, z)
+        return encode_ndarray(tile, dtype=dtype, compression=compression)
 
 
 # noinspection PyAbstractClass
@@ -234,6 +474,40 @@ class ResourcePlotHandler(WorkspaceResourceHandler):
             self.write_status_error(exception=e)
 
 
+class _HandlerWriter:
+    """
+    A file-like object that lets a worker thread stream text to a request handler.
+
+    Text written since the last ``flush()`` is passed as one chunk to the handler on the thread of the
+    handler's IOLoop, where it is written and flushed. ``flush()`` blocks until the chunk has been sent,
+    so that a slow client holds back the worker instead of queueing the whole response in memory.
+    """
+
+    def __init__(self, handler: tornado.web.RequestHandler):
+        self._handler = handler
+        self._io_loop = tornado.ioloop.IOLoop.current()
+        self._chunks = []
+
+    def write(self, text: str):
+        self._chunks.append(text)
+
+    def flush(self):
+        if not self._chunks:
+            return
+        chunk = ''.join(self._chunks)
+        self._chunks = []
+        future = concurrent.futures.Future()
+        self._io_loop.add_callback(self._write_chunk, chunk, future)
+        future.result()
+
+    def _write_chunk(self, chunk: str, future: concurrent.futures.Future):
+        try:
+            self._handler.write(chunk)
+            tornado.concurrent.chain_future(self._handler.flush(), future)
+        except Exception as e:
+            future.set_exception(e)
+
+
 # noinspection PyAbstractClass
 class GeoJSONHandler(WebAPIRequestHandler):
     def __init__(self, application, request, shapefile_path, **kwargs):
@@ -246,11 +520,20 @@ class GeoJSONHandler(WebAPIRequestHandler):
     def get(self):
         try:
             level = int(self.get_query_argument('level', default=str(_NUM_GEOM_SIMP_LEVELS)))
-            collection = fiona.open(self._shapefile_path)
-            self.set_header('Content-Type', 'application/json')
-            yield [THREAD_POOL.submit(write_feature_collection, collection, self,
-                                      num_features=len(collection),
-                                      conservation_ratio=_level_to_conservation_ratio(level, _NUM_GEOM_SIMP_LEVELS))]
+            stat = os.stat(self._shapefile_path)
+            etag = make_etag(__version__, self._shapefile_path, stat.st_mtime, stat.st_size, level)
+            last_modified = datetime.datetime.utcfromtimestamp(stat.st_mtime)
+            if not self.set_cache_headers(etag, last_modified=last_modified):
+                collection = fiona.open(self._shapefile_path)
+                feature_geometries = get_file_feature_geometries(self._shapefile_path, collection.crs)
+                self.set_header('Content-Type', 'application/json')
+                # The handler must only be written on the IOLoop's thread, so the writer passes each batch to it
+                body = _HandlerWriter(self)
+                yield [THREAD_POOL.submit(write_feature_collection, collection, body,
+                                          num_features=len(collection),
+                                          conservation_ratio=_level_to_conservation_ratio(level,
+                                                                                          _NUM_GEOM_SIMP_LEVELS),
+                                          feature_geometries=feature_geometries)]
         except Exception as e:
             self.write_status_error(exception=e)
         self.finish()
@@ -274,9 +557,13 @@ class ResFeatureCollectionHandler(WorkspaceResourceHandler):
     @tornado.gen.coroutine
     def get(self, base_dir, res_id):
         try:
-            _, res_id, res_name, resource = self.get_workspace_resource(base_dir, res_id)
+            workspace, res_id, res_name, resource = self.get_workspace_resource(base_dir, res_id)
             level = self.get_query_argument_int('level', default=_NUM_GEOM_SIMP_LEVELS)
 
+            if self.set_cache_headers(self.get_resource_etag(workspace, res_name, 'features', level)):
+                self.finish()
+                return
+
             if isinstance(resource, fiona.Collection):
                 features = resource
                 crs = features.crs
@@ -298,15 +585,19 @@ class ResFeatureCollectionHandler(WorkspaceResourceHandler):
             if features is not None:
                 print('ResFeatureCollectionHandler: features CRS:', crs)
                 print('ResFeatureCollectionHandler: streaming started at ', datetime.datetime.now())
+                feature_geometries = get_resource_feature_geometries(workspace, res_name, crs)
                 self.set_header('Content-Type', 'application/json')
-                yield [THREAD_POOL.submit(write_feature_collection, features, self,
+                # The handler must only be written on the IOLoop's thread, so the writer passes each batch to it
+                body = _HandlerWriter(self)
+                yield [THREAD_POOL.submit(write_feature_collection, features, body,
                                           crs=crs,
                                           res_id=res_id,
                                           num_features=num_features,
                                           max_num_display_geometries=1000,
                                           max_num_display_geometry_points=100,
                                           conservation_ratio=_level_to_conservation_ratio(level,
-                                                                                          _NUM_GEOM_SIMP_LEVELS))]
+                                                                                          _NUM_GEOM_SIMP_LEVELS),
+                                          feature_geometries=feature_geometries)]
                 print('ResFeatureCollectionHandler: streaming done at ', datetime.datetime.now())
         except Exception as e:
             self.write_status_error(exception=e)
@@ -320,10 +611,14 @@ class ResFeatureHandler(WorkspaceResourceHandler):
     @tornado.gen.coroutine
     def get(self, base_dir, res_id, feature_index):
         try:
-            _, res_id, res_name, resource = self.get_workspace_resource(base_dir, res_id)
+            workspace, res_id, res_name, resource = self.get_workspace_resource(base_dir, res_id)
             feature_index = self.to_int('feature_index', feature_index)
             level = self.get_query_argument_int('level', default=_NUM_GEOM_SIMP_LEVELS)
 
+            if self.set_cache_headers(self.get_resource_etag(workspace, res_name, 'feature', feature_index, level)):
+                self.finish()
+                return
+
             if isinstance(resource, fiona.Collection):
                 if not self._check_feature_index(feature_index, len(resource)):
                     return
@@ -361,7 +656,9 @@ class ResFeatureHandler(WorkspaceResourceHandler):
                 print('ResFeatureHandler: feature CRS:', crs)
                 print('ResFeatureHandler: streaming started at ', datetime.datetime.now())
                 self.set_header('Content-Type', 'application/json')
-                yield [THREAD_POOL.submit(write_feature, feature, self,
+                # The handler must only be written on the IOLoop's thread, so the writer passes each batch to it
+                body = _HandlerWriter(self)
+                yield [THREAD_POOL.submit(write_feature, feature, body,
                                           crs=crs,
                                           res_id=res_id,
                                           conservation_ratio=_level_to_conservation_ratio(level,
@@ -426,6 +723,46 @@ class ResVarCsvHandler(WorkspaceResourceHandler):
         self.finish()
 
 
+# noinspection PyAbstractClass
+class CacheStatsHandler(WebAPIRequestHandler):
+    """
+    Provides the size and counters of the Web API's tile caches, see :py:class:`cate.util.cache.CacheStats`.
+    If the query argument "reset" is 1, all counters are reset after writing the response.
+    """
+
+    def get(self):
+        try:
+            caches = self._get_caches()
+            self.write_status_ok(content={name: _get_cache_info(cache) for name, cache in caches.items()})
+            if self.get_query_argument_int('reset', default=0):
+                for cache in caches.values():
+                    cache.reset_stats()
+        except Exception as e:
+            self.write_status_error(exception=e)
+
+    @staticmethod
+    def _get_caches():
+        caches = dict()
+        default_tile_cache = get_default_tile_cache()
+        if default_tile_cache is not None:
+            caches['default_tile_cache'] = default_tile_cache
+        for imagery in get_open_workspace_imageries():
+            caches['mem_tile_cache:' + imagery.base_dir] = imagery.mem_tile_cache
+            if imagery.file_tile_cache is not None:
+                caches['file_tile_cache:' + imagery.base_dir] = imagery.file_tile_cache
+        return caches
+
+
+def _get_cache_info(cache) -> dict:
+    policy = cache.policy
+    return dict(store=type(cache.store).__name__,
+                policy=getattr(policy, '__name__', type(policy).__name__),
+                capacity=cache.capacity,
+                max_size=cache.max_size,
+                size=cache.size,
+                stats=cache.stats.to_dict())
+
+
 def _new_monitor() -> Monitor:
     return ConsoleMonitor(stay_in_line=True, progress_bar_size=30)
 
@@ -0,0 +1,172 @@
+# The MIT License (MIT)
+# Copyright (c) 2016, 2017 by the ESA CCI Toolbox development team and contributors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is furnished to do
+# so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Description
+===========
+
+Precomputed simplification of the geometries of feature collections, i.e. workspace resources and
+GeoJSON files, for all simplification levels.
+
+The points of the geometries of a feature collection are reprojected and ranked by importance once,
+see :py:class:`cate.webapi.geojson.FeatureGeometries`, so that serving any level only selects the points
+of a given rank. Feature geometries of resources are cached per workspace in its ``user_data``.
+They are invalid as soon as the resource is updated, i.e. when its update count in the workspace's
+resource cache changes. Feature geometries of files are invalid as soon as the file is modified.
+
+Components
+==========
+"""
+
+import os
+from collections import OrderedDict
+from threading import RLock
+from typing import Hashable, Optional
+
+from .geojson import FeatureGeometries
+from ..conf import get_config
+from ..conf.defaults import WEBAPI_FEATURE_GEOMETRIES_CACHE_NUM_ENTRIES
+from ..core.workspace import Workspace
+
+__author__ = "Norman Fomferra (Brockmann Consult GmbH)"
+
+#: The key of a workspace's feature geometries cache in its ``user_data``
+WORKSPACE_FEATURE_GEOMETRIES_KEY = 'feature_geometries'
+
+FEATURE_GEOMETRIES_CACHE_NUM_ENTRIES = get_config().get('feature_geometries_cache_num_entries',
+                                                        WEBAPI_FEATURE_GEOMETRIES_CACHE_NUM_ENTRIES)
+
+_LOCK = RLock()
+
+
+class FeatureGeometriesCache:
+    """
+    A cache for feature geometries whose entries are valid only for a given version of their feature collection,
+    e.g. the update count of a resource.
+
+    The size of an entry grows as its batches are computed. Finally, it keeps 16 bytes per point for the
+    coordinates and 8 bytes per point for the ranks. Until its points are ranked, an entry of reprojected
+    features also keeps the 16 bytes per point of their source coordinates.
+
+    :param max_num_entries: the maximum number of entries, least recently used entries are removed first
+    """
+
+    def __init__(self, max_num_entries: int = WEBAPI_FEATURE_GEOMETRIES_CACHE_NUM_ENTRIES):
+        self._max_num_entries = max_num_entries
+        self._entries = OrderedDict()
+        self._lock = RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Hashable, version: Hashable) -> Optional[FeatureGeometries]:
+        """
+        :param key: the key
+        :param version: the current version of the feature collection
+        :return: the feature geometries or None, if there are none or if they are outdated
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != version:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: Hashable, version: Hashable, feature_geometries: FeatureGeometries):
+        """
+        :param key: the key
+        :param version: the version of the feature collection the feature geometries are computed for
+        :param feature_geometries: the feature geometries
+        """
+        with self._lock:
+            self._entries[key] = version, feature_geometries
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_num_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def close(self):
+        self.clear()
+
+
+#: Feature geometries of files, e.g. the countries GeoJSON
+_FILE_FEATURE_GEOMETRIES_CACHE = FeatureGeometriesCache(FEATURE_GEOMETRIES_CACHE_NUM_ENTRIES)
+
+
+def get_resource_feature_geometries(workspace: Workspace, res_name: str, crs=None) -> FeatureGeometries:
+    """
+    Get the feature geometries of a workspace resource. New feature geometries are created if there are none
+    yet for the current version of the resource.
+
+    :param workspace: the workspace
+    :param res_name: the name of a resource which is a feature collection
+    :param crs: the coordinate reference system of the resource's features
+    :return: the feature geometries
+    """
+    resource_cache = workspace.resource_cache
+    if res_name not in resource_cache:
+        raise ValueError('Unknown resource "%s"' % res_name)
+
+    # Resource IDs change if a resource is deleted and created again under the same name
+    key = resource_cache.get_id(res_name)
+    update_count = resource_cache.get_update_count(res_name)
+    return _get_feature_geometries(_get_feature_geometries_cache(workspace), key, update_count, crs)
+
+
+def get_file_feature_geometries(file_path: str, crs=None) -> FeatureGeometries:
+    """
+    Get the feature geometries of a GeoJSON file or shapefile. New feature geometries are created if there
+    are none yet for the current modification time and size of the file.
+
+    :param file_path: the file path
+    :param crs: the coordinate reference system of the file's features
+    :return: the feature geometries
+    """
+    file_path = os.path.abspath(file_path)
+    stat = os.stat(file_path)
+    return _get_feature_geometries(_FILE_FEATURE_GEOMETRIES_CACHE, file_path, (stat.st_mtime, stat.st_size), crs)
+
+
+def _get_feature_geometries(cache: FeatureGeometriesCache, key: Hashable, version: Hashable,
+                            crs) -> FeatureGeometries:
+    with _LOCK:
+        feature_geometries = cache.get(key, version)
+        if feature_geometries is None:
+            # Batches are computed by the first request for the features, see write_feature_collection()
+            feature_geometries = FeatureGeometries(crs)
+            cache.put(key, version, feature_geometries)
+        return feature_geometries
+
+
+def _get_feature_geometries_cache(workspace: Workspace) -> FeatureGeometriesCache:
+    with _LOCK:
+        cache = workspace.user_data.get(WORKSPACE_FEATURE_GEOMETRIES_KEY)
+        if cache is None:
+            cache = FeatureGeometriesCache(FEATURE_GEOMETRIES_CACHE_NUM_ENTRIES)
+            workspace.user_data[WORKSPACE_FEATURE_GEOMETRIES_KEY] = cache
+        return cache
@@ -0,0 +1,156 @@
+# The MIT License (MIT)
+# Copyright (c) 2016, 2017 by the ESA CCI Toolbox development team and contributors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is furnished to do
+# so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Description
+===========
+
+Statistics of the variables of workspace resources, e.g. to determine default display ranges.
+
+Statistics are computed by :py:func:`cate.util.im.compute_array_statistics` and cached per workspace
+in its ``user_data``. Cached statistics of a resource are invalid as soon as the resource is updated,
+i.e. when its update count in the workspace's resource cache changes.
+
+Components
+==========
+"""
+
+from collections import OrderedDict
+from threading import RLock
+from typing import Any, Dict, Hashable, Optional, Sequence
+
+import xarray as xr
+
+from ..core.workspace import Workspace
+from ..util.im import compute_array_statistics
+from ..util.monitor import Monitor
+
+__author__ = "Norman Fomferra (Brockmann Consult GmbH)"
+
+#: The key of a workspace's statistics cache in its ``user_data``
+WORKSPACE_STATISTICS_KEY = 'statistics'
+
+_LOCK = RLock()
+
+
+class StatisticsCache:
+    """
+    A cache for statistics whose entries are valid only for a given update count of their resource.
+
+    :param max_num_entries: the maximum number of entries, least recently used entries are removed first
+    """
+
+    def __init__(self, max_num_entries: int = 256):
+        self._max_num_entries = max_num_entries
+        self._entries = OrderedDict()
+        self._lock = RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Hashable, update_count: int) -> Optional[Dict[str, Any]]:
+        """
+        :param key: the key
+        :param update_count: the current update count of the resource
+        :return: the statistics or None, if there are none or if they are outdated
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != update_count:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: Hashable, update_count: int, statistics: Dict[str, Any]):
+        """
+        :param key: the key
+        :param update_count: the update count of the resource the statistics have been computed for
+        :param statistics: the statistics
+        """
+        with self._lock:
+            self._entries[key] = update_count, statistics
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_num_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def close(self):
+        self.clear()
+
+
+def get_variable_statistics(workspace: Workspace,
+                            res_name: str,
+                            var_name: str,
+                            var_index: Sequence[int] = None,
+                            stride: int = 1,
+                            monitor: Monitor = Monitor.NONE) -> Dict[str, Any]:
+    """
+    Get the statistics of a variable of a workspace resource, see :py:func:`cate.util.im.compute_array_statistics`.
+    Statistics are computed only if there are none yet for the current version of the resource.
+
+    :param workspace: the workspace
+    :param res_name: the name of a resource of type ``xarray.Dataset``
+    :param var_name: the variable name
+    :param var_index: optional indices into the variable's leading dimensions
+    :param stride: if greater than one, only every *stride*-th value in each dimension is considered
+    :param monitor: a progress monitor
+    :return: the statistics
+    """
+    resource_cache = workspace.resource_cache
+    if res_name not in resource_cache:
+        raise ValueError('Unknown resource "%s"' % res_name)
+
+    dataset = resource_cache[res_name]
+    if not isinstance(dataset, xr.Dataset):
+        raise ValueError('Resource "%s" must be a Dataset' % res_name)
+
+    if var_name not in dataset:
+        raise ValueError('Variable "%s" not found in "%s"' % (var_name, res_name))
+
+    var_index = tuple(var_index) if var_index else ()
+    # Resource IDs change if a resource is deleted and created again under the same name
+    key = resource_cache.get_id(res_name), var_name, var_index, stride
+    update_count = resource_cache.get_update_count(res_name)
+
+    cache = _get_statistics_cache(workspace)
+    statistics = cache.get(key, update_count)
+    if statistics is None:
+        variable = dataset[var_name]
+        if var_index:
+            variable = variable[var_index]
+        statistics = compute_array_statistics(variable, stride=stride, monitor=monitor)
+        cache.put(key, update_count, statistics)
+    return statistics
+
+
+def _get_statistics_cache(workspace: Workspace) -> StatisticsCache:
+    with _LOCK:
+        cache = workspace.user_data.get(WORKSPACE_STATISTICS_KEY)
+        if cache is None:
+            cache = StatisticsCache()
+            workspace.user_data[WORKSPACE_STATISTICS_KEY] = cache
+        return cache
@@ -22,8 +22,6 @@
 from collections import OrderedDict
 from typing import List, Sequence, Optional
 
-import xarray as xr
-
 from cate.conf import conf
 from cate.conf.defaults import VERSION_CONF_FILE
 from cate.core.ds import DATA_STORE_REGISTRY
@@ -32,6 +30,7 @@ from cate.core.workspace import OpKwArgs
 from cate.core.wsmanag import WorkspaceManager
 from cate.util.monitor import Monitor
 from cate.util.misc import cwd, filter_fileset
+from cate.webapi.statistics import get_variable_statistics
 
 __author__ = "Norman Fomferra (Brockmann Consult GmbH), " \
              "Marco Zühlke (Brockmann Consult GmbH)"
@@ -317,24 +316,5 @@ class WebSocketService:
                                           monitor=Monitor.NONE):
         workspace_manager = self.workspace_manager
         workspace = workspace_manager.get_workspace(base_dir)
-        if res_name not in workspace.resource_cache:
-            raise ValueError('Unknown resource "%s"' % res_name)
-
-        dataset = workspace.resource_cache[res_name]
-        if not isinstance(dataset, xr.Dataset):
-            raise ValueError('Resource "%s" must be a Dataset' % res_name)
-
-        if var_name not in dataset:
-            raise ValueError('Variable "%s" not found in "%s"' % (var_name, res_name))
-
-        variable = dataset[var_name]
-        if var_index:
-            variable = variable[tuple(var_index)]
-
-        with monitor.starting('Computing min/max', total_work=100.):
-            with monitor.child(work=50.).observing('Computing min'):
-                actual_min = variable.min(skipna=True)
-            with monitor.child(work=50.).observing('Computing max'):
-                actual_max = variable.max(skipna=True)
-
-        return dict(min=float(actual_min), max=float(actual_max))
+        # Computed in a single pass and cached until the resource changes
+        return get_variable_statistics(workspace, res_name, var_name, var_index, monitor=monitor)
@@ -1,7 +1,16 @@
 import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
 from unittest import TestCase
 
-from cate.core.cdm import Schema
+import numpy as np
+import xarray as xr
+
+from cate.core.cdm import Schema, get_tiling_scheme
+from cate.util.im import ImagePyramid, TilingScheme
 
 
 class SchemaTest(TestCase):
@@ -41,3 +50,74 @@ class SchemaTest(TestCase):
 
         self.maxDiff = None
         self.assertEqual(json_text_1, json_text_2)
+
+
+def _new_global_dataset(width: int, height: int) -> xr.Dataset:
+    lon = np.linspace(-180. + 180. / width, 180. - 180. / width, width)
+    lat = np.linspace(90. - 90. / height, -90. + 90. / height, height)
+    y, x = np.mgrid[0:height, 0:width]
+    sst = (np.sin(x / 50.) + np.cos(y / 70.)).astype(np.float32)
+    return xr.Dataset(dict(sst=(['lat', 'lon'], sst)), coords=dict(lat=lat, lon=lon))
+
+
+class GetTilingSchemeTest(TestCase):
+    def test_unchunked(self):
+        dataset = _new_global_dataset(3600, 1800)
+        tiling_scheme = get_tiling_scheme(dataset.sst)
+        self.assertEqual(tiling_scheme.tile_size, (450, 450))
+        self.assertEqual(tiling_scheme.num_tiles(0), (2, 1))
+
+    def test_dask_chunks(self):
+        dataset = _new_global_dataset(3600, 1800).chunk(dict(lat=300, lon=300))
+        tiling_scheme = get_tiling_scheme(dataset.sst)
+        self.assertEqual(tiling_scheme.tile_size, (300, 300))
+        self.assertEqual(tiling_scheme.max_width, 3600)
+        self.assertEqual(tiling_scheme.max_height, 1800)
+
+    def test_netcdf_chunks(self):
+        dataset = _new_global_dataset(3600, 1800)
+        dataset.sst.encoding['chunksizes'] = (900, 1200)
+        tiling_scheme = get_tiling_scheme(dataset.sst)
+        self.assertEqual(tiling_scheme.tile_size, (300, 450))
+        self.assertEqual(tiling_scheme.max_width, 3600)
+        self.assertEqual(tiling_scheme.max_height, 1800)
+
+
+@unittest.skipUnless(condition=os.environ.get('CATE_BENCHMARK_TESTS', None),
+                     reason="skipped unless CATE_BENCHMARK_TESTS=1")
+class GetTilingSchemeBenchmarkTest(TestCase):
+    def test_tile_time_aligned_vs_unaligned(self):
+        import netCDF4
+        temp_dir = tempfile.mkdtemp()
+        try:
+            file_path = os.path.join(temp_dir, 'sst.nc')
+            _new_global_dataset(3600, 1800).to_netcdf(file_path,
+                                                      engine='netcdf4',
+                                                      encoding=dict(sst=dict(zlib=True, chunksizes=(300, 300))))
+            with xr.open_dataset(file_path, engine='netcdf4') as dataset:
+                aligned_tiling_scheme = get_tiling_scheme(dataset.sst)
+            unaligned_tiling_scheme = TilingScheme.create(3600, 1800, 360, 360, aligned_tiling_scheme.geo_extent)
+            for name, tiling_scheme in (('aligned', aligned_tiling_scheme), ('unaligned', unaligned_tiling_scheme)):
+                for chunk_cache in ('warm', 'cold'):
+                    with netCDF4.Dataset(file_path) as dataset:
+                        variable = dataset.variables['sst']
+                        if chunk_cache == 'cold':
+                            # Every chunk is decompressed as often as it is read
+                            variable.set_var_chunk_cache(size=0)
+                        pyramid = ImagePyramid.create_from_array(variable, tiling_scheme)
+                        z = tiling_scheme.num_levels - 1
+                        num_tiles_x, num_tiles_y = pyramid.get_level_image(z).num_tiles
+                        tile_indices = [(x, y) for y in range(num_tiles_y) for x in range(num_tiles_x)]
+                        # Clients do not request tiles in storage order
+                        np.random.RandomState(0).shuffle(tile_indices)
+                        t0 = time.perf_counter()
+                        for x, y in tile_indices:
+                            pyramid.get_tile(x, y, z)
+                        t1 = time.perf_counter()
+                    num_tiles = len(tile_indices)
+                    num_pixels = num_tiles * tiling_scheme.tile_size[0] * tiling_scheme.tile_size[1]
+                    print('%s tiles %s on 300x300 chunks, %s chunk cache: %.2f ms per tile, %.2f ms per megapixel'
+                          % (name, tiling_scheme.tile_size, chunk_cache,
+                             1000 * (t1 - t0) / num_tiles, 1000 * (t1 - t0) / (num_pixels / 1e6)))
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
@@ -304,6 +304,22 @@ class WorkspaceTest(unittest.TestCase):
         expected_res_names = {'res_%s' % (i + 1) for i in range(num_res)}
         self.assertEqual(actual_res_names, expected_res_names)
 
+    def test_close_closes_user_data(self):
+        class Closeable:
+            def __init__(self):
+                self.closed = False
+
+            def close(self):
+                self.closed = True
+
+        ws = Workspace('/path', Workflow(OpMetaInfo('workspace_workflow', header=dict(description='Test!'))))
+        closeable = Closeable()
+        ws.user_data['closeable'] = closeable
+        ws.user_data['other'] = dict()
+        ws.close()
+        self.assertTrue(closeable.closed)
+        self.assertEqual(ws.user_data, {})
+
     def test_validate_res_name(self):
         Workspace._validate_res_name("a")
         Workspace._validate_res_name("A")
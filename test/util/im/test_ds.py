@@ -1,3 +1,6 @@
+import os
+import time
+import unittest
 from unittest import TestCase
 
 import cate.util.im.ds as ds
@@ -15,6 +18,47 @@ class NaturalEarth2Test(TestCase):
         self.assertIsNotNone(tile)
         self.assertEqual(9032, len(tile))
 
+    def test_natural_earth_2_pyramid_preloaded(self):
+        pyramid = ds.NaturalEarth2Image.get_pyramid()
+        preloaded_pyramid = ds.NaturalEarth2Image.get_pyramid(preload=True)
+        for z in range(pyramid.num_levels):
+            num_tiles_x, num_tiles_y = pyramid.tiling_scheme.num_tiles(z)
+            for y in range(num_tiles_y):
+                for x in range(num_tiles_x):
+                    tile = preloaded_pyramid.get_tile(x, y, z)
+                    self.assertIsInstance(tile, bytes)
+                    self.assertEqual(tile, pyramid.get_tile(x, y, z))
+        self.assertIs(preloaded_pyramid.get_tile(7, 3, 2), preloaded_pyramid.get_tile(7, 3, 2))
+        with self.assertRaises(IndexError):
+            preloaded_pyramid.get_tile(8, 0, 2)
+
+
+@unittest.skipUnless(condition=os.environ.get('CATE_BENCHMARK_TESTS', None),
+                     reason="skipped unless CATE_BENCHMARK_TESTS=1")
+class NaturalEarth2BenchmarkTest(TestCase):
+    def test_preload_cost_and_time_per_tile(self):
+        t0 = time.perf_counter()
+        pyramid = ds.NaturalEarth2Image.get_pyramid()
+        t1 = time.perf_counter()
+        preloaded_pyramid = ds.NaturalEarth2Image.get_pyramid(preload=True)
+        t2 = time.perf_counter()
+        tile_indices = [(x, y, z)
+                        for z in range(pyramid.num_levels)
+                        for y in range(pyramid.tiling_scheme.num_tiles_y(z))
+                        for x in range(pyramid.tiling_scheme.num_tiles_x(z))]
+        num_bytes = sum(len(preloaded_pyramid.get_tile(x, y, z)) for x, y, z in tile_indices)
+        print('NE2 pyramid: %.2f ms, preloaded: %.2f ms, %d tiles, %d bytes'
+              % (1000 * (t1 - t0), 1000 * (t2 - t1), len(tile_indices), num_bytes))
+
+        num_rounds = 100
+        for name, p in (('files', pyramid), ('preloaded', preloaded_pyramid)):
+            t0 = time.perf_counter()
+            for _ in range(num_rounds):
+                for x, y, z in tile_indices:
+                    p.get_tile(x, y, z)
+            t1 = time.perf_counter()
+            print('NE2 tile from %s: %.2f us' % (name, 1e6 * (t1 - t0) / (num_rounds * len(tile_indices))))
+
 # import time
 # import h5py
 # from cate.util.im.image import ColorMappedRgbaImage, ImagePyramid
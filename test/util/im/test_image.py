@@ -1,17 +1,29 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
 from unittest import TestCase
 
+import matplotlib.cm as cm
 import numpy as np
 
+from PIL import Image
+
 from cate.util.im import TilingScheme, GeoExtent
 from cate.util.im.image import ImagePyramid, OpImage, create_ndarray_downsampling_image, \
-    TransformArrayImage, FastNdarrayDownsamplingImage
-from cate.util.im.utils import aggregate_ndarray_mean
+    TransformArrayImage, FastNdarrayDownsamplingImage, OverviewArrays, ColorMappedRgbaImage, get_cmap_lut, \
+    NdarrayDownsamplingImage
+from cate.util.im.utils import aggregate_ndarray_mean, aggregate_ndarray_nanmean
+from cate.util.cache import Cache, MemoryCacheStore
 
 
 class MyTiledImage(OpImage):
-    def __init__(self, size, tile_size):
+    def __init__(self, size, tile_size, tile_cache=None):
         super().__init__(size, tile_size, (size[0] // tile_size[0], size[1] // tile_size[1]),
-                         mode='int32', format='ndarray')
+                         mode='int32', format='ndarray', tile_cache=tile_cache)
 
     def compute_tile(self, tile_x, tile_y, rectangle):
         w, h = self.size
@@ -20,6 +32,336 @@ class MyTiledImage(OpImage):
         return np.full((th, tw), fill_value, np.float32)
 
 
+class SlowTiledImage(OpImage):
+    def __init__(self, tile_cache=None, error=None):
+        super().__init__((4, 4), (2, 2), (2, 2), mode='int32', format='ndarray', tile_cache=tile_cache)
+        self.error = error
+        self.num_computations = 0
+
+    def compute_tile(self, tile_x, tile_y, rectangle):
+        self.num_computations += 1
+        time.sleep(0.1)
+        if self.error is not None:
+            raise self.error
+        return np.full((2, 2), tile_x + 2 * tile_y, np.int32)
+
+
+class CountingCache(Cache):
+    def __init__(self):
+        super().__init__(MemoryCacheStore(), capacity=1000000)
+        self.num_puts = 0
+
+    def put_value(self, key, value):
+        self.num_puts += 1
+        super().put_value(key, value)
+
+
+class OpImageTest(TestCase):
+    @staticmethod
+    def _get_tile_concurrently(image, num_threads=8):
+        results = [None] * num_threads
+
+        def run(index):
+            try:
+                results[index] = image.get_tile(1, 1)
+            except Exception as e:
+                results[index] = e
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(num_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_misses_compute_tile_once(self):
+        cache = CountingCache()
+        image = SlowTiledImage(tile_cache=cache)
+        results = self._get_tile_concurrently(image)
+        self.assertEqual(image.num_computations, 1)
+        self.assertEqual(cache.num_puts, 1)
+        for result in results:
+            self.assertEqual(result.tolist(), [[3, 3], [3, 3]])
+        image.get_tile(1, 1)
+        self.assertEqual(image.num_computations, 1)
+
+    def test_concurrent_misses_without_cache(self):
+        image = SlowTiledImage()
+        results = self._get_tile_concurrently(image)
+        self.assertEqual(image.num_computations, 1)
+        for result in results:
+            self.assertEqual(result.tolist(), [[3, 3], [3, 3]])
+
+    def test_exception_is_propagated_to_all_waiters(self):
+        cache = CountingCache()
+        error = ValueError('failed to read tile')
+        image = SlowTiledImage(tile_cache=cache, error=error)
+        results = self._get_tile_concurrently(image)
+        self.assertEqual(image.num_computations, 1)
+        self.assertEqual(cache.num_puts, 0)
+        for result in results:
+            self.assertIs(result, error)
+        # Failed computations are not remembered
+        image.error = None
+        self.assertEqual(image.get_tile(1, 1).tolist(), [[3, 3], [3, 3]])
+        self.assertEqual(image.num_computations, 2)
+
+    def test_dispose_removes_computed_tiles_from_cache(self):
+        cache = CountingCache()
+        cache.put_value('other', np.zeros((2, 2)))
+        image = SlowTiledImage(tile_cache=cache)
+        image.get_tile(0, 0)
+        image.get_tile(1, 1)
+        self.assertIsNotNone(cache.get_value(image.get_tile_id(0, 0)))
+        image.dispose()
+        self.assertIsNone(cache.get_value(image.get_tile_id(0, 0)))
+        self.assertIsNone(cache.get_value(image.get_tile_id(1, 1)))
+        self.assertIsNotNone(cache.get_value('other'))
+
+    def test_dispose_skips_evicted_tiles(self):
+        cache = CountingCache()
+        removed_ids = []
+        cache.remove_value = lambda key: removed_ids.append(key)
+        image = SlowTiledImage(tile_cache=cache)
+        image.get_tile(0, 0)
+        image.get_tile(1, 1)
+        cache.clear()
+        cache.put_value(image.get_tile_id(1, 1), np.zeros((2, 2)))
+        image.dispose()
+        self.assertEqual(removed_ids, [image.get_tile_id(1, 1)])
+
+    def test_dispose_while_computing_tiles(self):
+        image = MyTiledImage((1024, 1024), (8, 8), tile_cache=Cache(MemoryCacheStore(), capacity=1000000000))
+        errors = []
+
+        def run():
+            try:
+                for tile_y in range(32):
+                    for tile_x in range(128):
+                        image.get_tile(tile_x, tile_y)
+            except Exception as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        for _ in range(100):
+            image.dispose()
+        thread.join()
+        image.dispose()
+        self.assertEqual(errors, [])
+        self.assertEqual(image.tile_cache.size, 0)
+
+
+def _color_map_with_matplotlib(tile, value_range, cmap_name, no_data_value=None):
+    """
+    The former implementation of ColorMappedRgbaImage's color mapping, except that NaN values are always
+    considered bad. Matplotlib maps NaN values of masked arrays to the lowest color otherwise.
+    """
+    value_min, value_max = value_range
+    cmap = cm.get_cmap(cmap_name, 256)
+    cmap.set_bad('k', 0)
+    if np.ma.is_masked(tile):
+        array = np.ma.masked_where(np.isnan(tile.data), tile)
+        array = array.clip(value_min, value_max)
+    elif no_data_value is not None:
+        array = np.ma.masked_where(np.isnan(tile) | (tile == no_data_value), tile)
+        array = array.clip(value_min, value_max, out=array)
+    else:
+        array = np.ma.masked_invalid(tile)
+        array = array.clip(value_min, value_max, out=array)
+    array -= value_min
+    array *= 1.0 / (value_max - value_min)
+    return cmap(array, bytes=True)
+
+
+class NdarrayTiledImage(OpImage):
+    def __init__(self, array, tile_size):
+        height, width = array.shape[-2:]
+        super().__init__((width, height), tile_size, (width // tile_size[0], height // tile_size[1]),
+                         mode=str(array.dtype), format='ndarray')
+        self._array = array
+
+    def compute_tile(self, tile_x, tile_y, rectangle):
+        x, y, w, h = rectangle
+        return self._array[..., y:y + h, x:x + w]
+
+
+class ColorMappedRgbaImageTest(TestCase):
+    def setUp(self):
+        rnd = np.random.RandomState(0)
+        self.array = (rnd.random_sample((64, 64)) * 300.0 - 10.0).astype(np.float32)
+        self.array[3, 0:10] = np.nan
+        self.array[4, 0:10] = -999.
+        self.array[5, 0:10] = np.inf
+
+    def assert_same_colors(self, source_tile, no_data_value=None, value_range=(0., 255.), cmap_name='jet'):
+        source_image = NdarrayTiledImage(self.array, (64, 64))
+        image = ColorMappedRgbaImage(source_image, value_range=value_range, cmap_name=cmap_name,
+                                     no_data_value=no_data_value)
+        actual = np.array(image.compute_tile_from_source_tile(0, 0, (0, 0, 64, 64), source_tile))
+        expected = _color_map_with_matplotlib(source_tile, value_range, cmap_name, no_data_value=no_data_value)
+        np.testing.assert_equal(actual, expected)
+
+    def test_same_colors_as_matplotlib(self):
+        self.assert_same_colors(self.array)
+        self.assert_same_colors(self.array, value_range=(-5.5, 100.25), cmap_name='viridis')
+        self.assert_same_colors(self.array.astype(np.float64), value_range=(0.1, 0.2))
+
+    def test_same_colors_as_matplotlib_with_no_data_value(self):
+        self.assert_same_colors(self.array, no_data_value=-999.)
+
+    def test_same_colors_as_matplotlib_with_masked_tile(self):
+        self.assert_same_colors(np.ma.masked_less(self.array, 20.))
+
+    def test_masked_pixels_are_transparent(self):
+        source_image = NdarrayTiledImage(self.array, (64, 64))
+        image = ColorMappedRgbaImage(source_image, value_range=(0., 255.), no_data_value=-999.)
+        tile = np.array(image.get_tile(0, 0))
+        self.assertEqual(tile.shape, (64, 64, 4))
+        self.assertEqual(tile.dtype, np.uint8)
+        np.testing.assert_equal(tile[3, 0:10], 0)
+        np.testing.assert_equal(tile[4, 0:10], 0)
+        np.testing.assert_equal(tile[5, 0:10, 3], 255)
+
+    def test_palette_png(self):
+        source_image = NdarrayTiledImage(self.array, (64, 64))
+        image = ColorMappedRgbaImage(source_image, value_range=(0., 255.), no_data_value=-999.,
+                                     encode=True, format='PNG', palette=True, compress_level=1)
+        encoded_tile = image.get_tile(0, 0)
+        self.assertIsInstance(encoded_tile, bytes)
+        decoded_image = Image.open(io.BytesIO(encoded_tile))
+        self.assertEqual(decoded_image.format, 'PNG')
+        self.assertEqual(decoded_image.mode, 'P')
+        self.assertIn('transparency', decoded_image.info)
+
+        # Same colors as RGBA tiles with 255 colors
+        rgba_image = ColorMappedRgbaImage(source_image, value_range=(0., 255.), no_data_value=-999., num_colors=255)
+        np.testing.assert_equal(np.array(decoded_image.convert('RGBA')), np.array(rgba_image.get_tile(0, 0)))
+
+    def test_webp(self):
+        source_image = NdarrayTiledImage(self.array, (64, 64))
+        image = ColorMappedRgbaImage(source_image, value_range=(0., 255.), encode=True, format='WEBP')
+        decoded_image = Image.open(io.BytesIO(image.get_tile(0, 0)))
+        self.assertEqual(decoded_image.format, 'WEBP')
+        # Lossless by default
+        rgba_image = ColorMappedRgbaImage(source_image, value_range=(0., 255.))
+        expected = np.array(rgba_image.get_tile(0, 0))
+        actual = np.array(decoded_image.convert('RGBA'))
+        # Color values of fully transparent pixels are not preserved
+        np.testing.assert_equal(actual[..., 3], expected[..., 3])
+        opaque = expected[..., 3] == 255
+        np.testing.assert_equal(actual[opaque], expected[opaque])
+
+    def test_get_cmap_lut(self):
+        lut = get_cmap_lut('jet', 16)
+        self.assertEqual(lut.shape, (17, 4))
+        self.assertEqual(lut.dtype, np.uint8)
+        self.assertIs(lut, get_cmap_lut('jet', 16))
+        np.testing.assert_equal(lut[:16], cm.get_cmap('jet', 16)(np.arange(16), bytes=True))
+        np.testing.assert_equal(lut[16], [0, 0, 0, 0])
+        self.assertFalse(lut.flags.writeable)
+
+
+@unittest.skipUnless(condition=os.environ.get('CATE_BENCHMARK_TESTS', None),
+                     reason="skipped unless CATE_BENCHMARK_TESTS=1")
+class ColorMappedRgbaImageBenchmarkTest(TestCase):
+    def test_color_mapping_time_per_tile(self):
+        rnd = np.random.RandomState(0)
+        num_tiles = 50
+        for dtype in (np.float32, np.float64):
+            tile = rnd.random_sample((512, 512)).astype(dtype)
+            tile[rnd.random_sample((512, 512)) < 0.1] = np.nan
+            image = ColorMappedRgbaImage(NdarrayTiledImage(tile, (512, 512)), value_range=(0.2, 0.8))
+
+            t0 = time.perf_counter()
+            for _ in range(num_tiles):
+                _color_map_with_matplotlib(tile, (0.2, 0.8), 'jet')
+            t1 = time.perf_counter()
+            for _ in range(num_tiles):
+                image.compute_tile_from_source_tile(0, 0, (0, 0, 512, 512), tile)
+            t2 = time.perf_counter()
+            print('512x512 %s tile: matplotlib colormap %.2f ms, LUT %.2f ms (incl. PIL image)'
+                  % (np.dtype(dtype).name, 1000 * (t1 - t0) / num_tiles, 1000 * (t2 - t1) / num_tiles))
+
+    def test_encoding_time_and_size_per_tile(self):
+        y, x = np.mgrid[0:256, 0:256]
+        tile = (np.sin(x / 20.) + np.cos(y / 30.)).astype(np.float32)
+        tile[100:140, 50:90] = np.nan
+        num_tiles = 20
+        for encoding in (dict(format='PNG'),
+                         dict(format='PNG', compress_level=1),
+                         dict(format='PNG', palette=True),
+                         dict(format='PNG', palette=True, compress_level=1),
+                         dict(format='WEBP'),
+                         dict(format='WEBP', quality=80)):
+            image = ColorMappedRgbaImage(NdarrayTiledImage(tile, (256, 256)), value_range=(-2., 2.), encode=True,
+                                         **encoding)
+            t0 = time.perf_counter()
+            for _ in range(num_tiles):
+                encoded_tile = image.compute_tile_from_source_tile(0, 0, (0, 0, 256, 256), tile)
+            t1 = time.perf_counter()
+            print('256x256 tile %s: %.2f ms, %d bytes' % (encoding, 1000 * (t1 - t0) / num_tiles, len(encoded_tile)))
+
+
+class NdarrayDownsamplingImageTest(TestCase):
+    def setUp(self):
+        nan = np.nan
+        a = np.array([[1., 3., 4., 4.],
+                      [nan, 2., 4., 4.],
+                      [nan, nan, 0., 1.],
+                      [nan, -1., 2., 3.]])
+        self.source_image = TransformArrayImage(FastNdarrayDownsamplingImage(a, (2, 2), 0), force_masked=True)
+
+    def test_methods(self):
+        for method, expected in (('first', [[1., 4.], [-1., 0.]]),
+                                 ('min', [[1., 4.], [-1., 0.]]),
+                                 ('max', [[3., 4.], [-1., 3.]]),
+                                 ('sum', [[6., 16.], [-1., 6.]]),
+                                 ('mean', [[2., 4.], [-1., 1.5]])):
+            image = NdarrayDownsamplingImage(self.source_image, aggregator=method)
+            self.assertEqual(image.size, (2, 2))
+            tile = image.get_tile(0, 0)
+            self.assertIsInstance(tile, np.ma.MaskedArray)
+            self.assertEqual(tile.tolist(), expected, msg=method)
+
+    def test_aggregator_functions_are_nan_aware(self):
+        image = NdarrayDownsamplingImage(self.source_image, aggregator=aggregate_ndarray_mean)
+        self.assertEqual(image.get_tile(0, 0).tolist(), [[2., 4.], [-1., 1.5]])
+
+    def test_custom_aggregator_function(self):
+        image = NdarrayDownsamplingImage(self.source_image, aggregator=lambda a1, a2, a3, a4: a4)
+        self.assertEqual(image.get_tile(0, 0).tolist(), [[2., 4.], [-1., 3.]])
+
+
+@unittest.skipUnless(condition=os.environ.get('CATE_BENCHMARK_TESTS', None),
+                     reason="skipped unless CATE_BENCHMARK_TESTS=1")
+class NdarrayDownsamplingImageBenchmarkTest(TestCase):
+    def test_aggregate_and_stitch_time_per_tile(self):
+        def nanmean_with_stitching(a1, a2, a3, a4):
+            return aggregate_ndarray_nanmean(a1, a2, a3, a4)
+
+        rnd = np.random.RandomState(0)
+        num_tiles = 50
+        source_tiles = []
+        for _ in range(4):
+            source_tile = rnd.random_sample((512, 512)).astype(np.float32)
+            source_tile[rnd.random_sample((512, 512)) < 0.1] = np.nan
+            source_tiles.append(source_tile)
+        source_image = MyTiledImage((2048, 1024), (512, 512))
+        target_positions = ((0, 0), (0, 256), (256, 0), (256, 256))
+        for name, aggregator in (('temporary arrays and stitching', nanmean_with_stitching),
+                                 ('2x2 reduction into target tile', 'mean')):
+            image = NdarrayDownsamplingImage(source_image, aggregator=aggregator)
+            for tiles_name, tiles in (('float32', source_tiles),
+                                      ('masked float32', [np.ma.masked_invalid(t) for t in source_tiles])):
+                t0 = time.perf_counter()
+                for _ in range(num_tiles):
+                    image.aggregate_and_stitch_source_tiles(tiles, (512, 512), target_positions)
+                t1 = time.perf_counter()
+                print('512x512 %s tile, nanmean with %s: %.2f ms'
+                      % (tiles_name, name, 1000 * (t1 - t0) / num_tiles))
+
+
 class NdarrayImageTest(TestCase):
     def test_default(self):
         a = np.arange(0, 24, dtype=np.int32)
@@ -306,3 +648,97 @@ class ImagePyramidTest(TestCase):
         self.assertEqual((1, 270, 270), tile_0_1_0.shape)
         self.assertAlmostEqual(0, tile_0_1_0[..., 0, 0])
         self.assertAlmostEqual(0, tile_0_1_0[..., 269, 269])
+
+    def test_create_from_array_with_overviews(self):
+        width = 2160
+        height = 1080
+        array = np.arange(width * height, dtype=np.float64).reshape((1, height, width))
+
+        tiling_scheme = TilingScheme.create(width, height, 270, 270, geo_extent=GeoExtent())
+        pyramid = ImagePyramid.create_from_array(array, tiling_scheme)
+        overview_pyramid = ImagePyramid.create_from_array(array, tiling_scheme, overview_mode='nearest')
+        self.assertEqual(3, overview_pyramid.num_levels)
+
+        # Nearest overviews must yield the same tiles as sub-sampling the full resolution array
+        for z_index in range(pyramid.num_levels):
+            level_image = pyramid.get_level_image(z_index)
+            overview_level_image = overview_pyramid.get_level_image(z_index)
+            self.assertEqual(level_image.size, overview_level_image.size)
+            self.assertEqual(level_image.num_tiles, overview_level_image.num_tiles)
+            num_tiles_x, num_tiles_y = level_image.num_tiles
+            np.testing.assert_equal(overview_level_image.get_tile(num_tiles_x - 1, num_tiles_y - 1),
+                                    level_image.get_tile(num_tiles_x - 1, num_tiles_y - 1))
+
+        mean_pyramid = ImagePyramid.create_from_array(array, tiling_scheme, overview_mode='mean')
+        tile = mean_pyramid.get_level_image(1).get_tile(0, 0)
+        self.assertEqual((1, 270, 270), tile.shape)
+        self.assertAlmostEqual(np.mean(array[0, 0:2, 0:2]), tile[0, 0, 0])
+
+
+class OverviewArraysTest(TestCase):
+    def test_nearest(self):
+        array = np.arange(8 * 6).reshape((6, 8))
+        overviews = OverviewArrays(array, mode='nearest', block_height=2)
+        self.assertIs(array, overviews.get_overview(0))
+        self.assertEqual(np.dtype(int), overviews.dtype)
+        self.assertEqual((3, 4), overviews.get_shape(1))
+        self.assertEqual((1, 2), overviews.get_shape(2))
+        np.testing.assert_equal(overviews.get_overview(1), array[::2, ::2])
+        np.testing.assert_equal(overviews.get_overview(2), array[::4, ::4][:1, :2])
+
+    def test_mean(self):
+        nan = np.nan
+        array = np.array([[1, 3, 5, 7],
+                          [1, 3, -1, -1],
+                          [nan, nan, 2, 4],
+                          [nan, nan, 2, nan]])
+        overviews = OverviewArrays(array, mode='mean', no_data_value=-1, block_height=2)
+        self.assertEqual(np.dtype(np.float64), overviews.dtype)
+        np.testing.assert_equal(overviews.get_overview(1), np.array([[2., 6.],
+                                                                     [-1, 8. / 3.]]))
+        np.testing.assert_almost_equal(overviews.get_overview(2), np.array([[(2. + 6. + 8. / 3.) / 3.]]))
+
+    def test_overviews_are_computed_once_and_lazily(self):
+        class CountingArray:
+            def __init__(self, array):
+                self.array = array
+                self.shape = array.shape
+                self.dtype = array.dtype
+                self.num_reads = 0
+
+            def __getitem__(self, item):
+                self.num_reads += 1
+                return self.array[item]
+
+        array = CountingArray(np.ones((64, 64), dtype=np.float32))
+        overviews = OverviewArrays(array, mode='mean', block_height=16)
+        lazy_overview = overviews.get_lazy_overview(3)
+        self.assertEqual((8, 8), lazy_overview.shape)
+        self.assertEqual(np.float32, lazy_overview.dtype)
+        self.assertEqual(0, array.num_reads)
+
+        np.testing.assert_equal(lazy_overview[0:2, 0:2], np.ones((2, 2)))
+        # The source array is read once, in blocks of 16 rows
+        self.assertEqual(4, array.num_reads)
+        overviews.get_overview(1)
+        overviews.get_overview(2)
+        lazy_overview[...]
+        self.assertEqual(4, array.num_reads)
+
+    def test_overview_dir(self):
+        overview_dir = tempfile.mkdtemp()
+        try:
+            array = np.arange(16 * 16, dtype=np.float32).reshape((16, 16))
+            overviews = OverviewArrays(array, mode='nearest', overview_dir=overview_dir)
+            overview = overviews.get_overview(2)
+            self.assertIsInstance(overview, np.memmap)
+            np.testing.assert_equal(overview, array[::4, ::4])
+            self.assertTrue(os.path.isfile(os.path.join(overview_dir, 'overview-1.npy')))
+            self.assertTrue(os.path.isfile(os.path.join(overview_dir, 'overview-2.npy')))
+            del overview, overviews
+        finally:
+            shutil.rmtree(overview_dir, ignore_errors=True)
+
+    def test_illegal_mode(self):
+        with self.assertRaises(ValueError):
+            OverviewArrays(np.zeros((4, 4)), mode='median')
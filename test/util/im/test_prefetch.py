@@ -0,0 +1,133 @@
+import threading
+from unittest import TestCase
+
+from cate.util.im import TilePrefetcher
+
+
+class MyLevelImage:
+    def __init__(self, num_tiles):
+        self.num_tiles = num_tiles
+
+
+class MyPyramid:
+    def __init__(self, num_levels=3, num_level_zero_tiles=(4, 2), gate=None):
+        self.num_levels = num_levels
+        self.level_images = [MyLevelImage((num_level_zero_tiles[0] << z, num_level_zero_tiles[1] << z))
+                             for z in range(num_levels)]
+        self.gate = gate
+        self.requested_tiles = []
+        self.lock = threading.Lock()
+
+    def get_level_image(self, z_index):
+        return self.level_images[z_index]
+
+    def get_tile(self, tile_x, tile_y, z_index):
+        if self.gate is not None:
+            self.gate.wait()
+        with self.lock:
+            self.requested_tiles.append((tile_x, tile_y, z_index))
+        return tile_x, tile_y, z_index
+
+
+class TilePrefetcherTest(TestCase):
+    def setUp(self):
+        self.prefetcher = None
+
+    def tearDown(self):
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+
+    def test_neighbours_and_children(self):
+        self.prefetcher = TilePrefetcher()
+        pyramid = MyPyramid()
+        self.assertEqual(self.prefetcher.prefetch(pyramid, 2, 1, 1), 8 + 4)
+        self.assertTrue(self.prefetcher.wait(timeout=5))
+        self.assertEqual(set(pyramid.requested_tiles),
+                         {(1, 0, 1), (2, 0, 1), (3, 0, 1),
+                          (1, 1, 1), (3, 1, 1),
+                          (1, 2, 1), (2, 2, 1), (3, 2, 1),
+                          (4, 2, 2), (5, 2, 2), (4, 3, 2), (5, 3, 2)})
+        self.assertEqual(self.prefetcher.prefetch_count, 12)
+
+    def test_wrap_x_and_clamp_y(self):
+        self.prefetcher = TilePrefetcher()
+        pyramid = MyPyramid()
+        # Tile (0, 0) at the highest resolution level has neither children nor neighbours above
+        self.assertEqual(self.prefetcher.prefetch(pyramid, 0, 0, 2), 5)
+        self.assertTrue(self.prefetcher.wait(timeout=5))
+        self.assertEqual(set(pyramid.requested_tiles),
+                         {(15, 0, 2), (1, 0, 2), (15, 1, 2), (0, 1, 2), (1, 1, 2)})
+
+    def test_neighbours_first_and_duplicates_are_ignored(self):
+        gate = threading.Event()
+        self.prefetcher = TilePrefetcher(num_workers=1)
+        pyramid = MyPyramid(gate=gate)
+        self.prefetcher.prefetch(pyramid, 2, 1, 1)
+        self.assertEqual(self.prefetcher.prefetch(pyramid, 2, 1, 1), 0)
+        gate.set()
+        self.assertTrue(self.prefetcher.wait(timeout=5))
+        # The first task may have been taken before the duplicate, all others are unique
+        self.assertEqual(len(set(pyramid.requested_tiles)), 12)
+        self.assertTrue(all(z == 1 for _, _, z in pyramid.requested_tiles[1:8]))
+        self.assertTrue(all(z == 2 for _, _, z in pyramid.requested_tiles[-4:]))
+
+    def test_stale_tasks_are_dropped(self):
+        gate = threading.Event()
+        self.prefetcher = TilePrefetcher(num_workers=1, max_request_lag=2)
+        pyramid = MyPyramid(gate=gate)
+        with self.prefetcher.foreground():
+            self.prefetcher.prefetch(pyramid, 0, 0, 0, group_id='a')
+            self.prefetcher.prefetch(pyramid, 4, 1, 1, group_id='a')
+            self.prefetcher.prefetch(pyramid, 2, 2, 2, group_id='a')
+        gate.set()
+        self.assertTrue(self.prefetcher.wait(timeout=5))
+        # Only the tasks of the last two requests have been computed
+        self.assertNotIn((0, 1, 1), pyramid.requested_tiles)
+        self.assertIn((3, 1, 1), pyramid.requested_tiles)
+        self.assertIn((3, 2, 2), pyramid.requested_tiles)
+        self.assertGreater(self.prefetcher.drop_count, 0)
+
+    def test_back_off_while_foreground_is_busy(self):
+        self.prefetcher = TilePrefetcher()
+        pyramid = MyPyramid()
+        with self.prefetcher.foreground():
+            self.prefetcher.prefetch(pyramid, 0, 0, 0)
+            self.assertFalse(self.prefetcher.wait(timeout=0.1))
+            self.assertEqual(pyramid.requested_tiles, [])
+        self.assertTrue(self.prefetcher.wait(timeout=5))
+        self.assertEqual(len(pyramid.requested_tiles), 5 + 4)
+
+    def test_cancel(self):
+        self.prefetcher = TilePrefetcher(max_queue_size=10)
+        pyramid = MyPyramid()
+        with self.prefetcher.foreground():
+            self.prefetcher.prefetch(pyramid, 0, 0, 0, group_id='a')
+            self.prefetcher.prefetch(pyramid, 2, 1, 1, group_id='b')
+            # Queue is trimmed to the most important tasks: the 8 neighbours of 'b', then neighbours of 'a'
+            self.assertEqual(self.prefetcher.queue_size, 10)
+            self.assertEqual(self.prefetcher.cancel('b'), 8)
+            self.assertEqual(self.prefetcher.queue_size, 2)
+        self.assertTrue(self.prefetcher.wait(timeout=5))
+        self.assertEqual(len(pyramid.requested_tiles), 2)
+        self.assertTrue(all(z == 0 for _, _, z in pyramid.requested_tiles))
+
+    def test_errors_are_counted(self):
+        self.prefetcher = TilePrefetcher()
+
+        class FailingPyramid(MyPyramid):
+            def get_tile(self, tile_x, tile_y, z_index):
+                raise ValueError()
+
+        self.prefetcher.prefetch(FailingPyramid(), 0, 0, 0)
+        self.assertTrue(self.prefetcher.wait(timeout=5))
+        self.assertEqual(self.prefetcher.error_count, 5 + 4)
+        self.assertEqual(self.prefetcher.prefetch_count, 0)
+
+    def test_close(self):
+        prefetcher = TilePrefetcher()
+        with prefetcher.foreground():
+            prefetcher.prefetch(MyPyramid(), 0, 0, 0)
+            prefetcher.close()
+        self.assertTrue(prefetcher.is_closed)
+        self.assertEqual(prefetcher.queue_size, 0)
+        self.assertEqual(prefetcher.prefetch(MyPyramid(), 0, 0, 0), 0)
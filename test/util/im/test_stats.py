@@ -0,0 +1,89 @@
+from unittest import TestCase
+
+import dask.array as da
+import numpy as np
+import xarray as xr
+
+from cate.util.im import compute_array_statistics
+from cate.util.monitor import Monitor
+
+
+class RecordingMonitor(Monitor):
+    def __init__(self):
+        self.total_work = None
+        self.work = 0
+
+    def start(self, label: str, total_work: float = None):
+        self.total_work = total_work
+
+    def progress(self, work: float = None, msg: str = None):
+        self.work += work
+
+    def done(self):
+        pass
+
+
+class ComputeArrayStatisticsTest(TestCase):
+    def setUp(self):
+        rnd = np.random.RandomState(0)
+        self.array = rnd.normal(10.0, 2.0, size=(3, 200, 300))
+        self.array[0, 0:10, 0:10] = np.nan
+        self.array[1, 5, 5] = np.inf
+
+    def assert_exact_statistics(self, statistics, values, histogram_delta=0):
+        values = values[np.isfinite(values)]
+        self.assertEqual(statistics['count'], values.size)
+        self.assertEqual(statistics['min'], np.min(values))
+        self.assertEqual(statistics['max'], np.max(values))
+        self.assertAlmostEqual(statistics['mean'], np.mean(values))
+        self.assertAlmostEqual(statistics['std'], np.std(values))
+        self.assertAlmostEqual(sum(statistics['histogram']['counts']), values.size, delta=histogram_delta)
+
+    def test_ndarray(self):
+        statistics = compute_array_statistics(self.array)
+        self.assert_exact_statistics(statistics, self.array)
+        self.assertEqual(statistics['sample_size'], statistics['count'])
+        self.assertEqual(len(statistics['histogram']['edges']), 129)
+        self.assertEqual(len(statistics['histogram']['counts']), 128)
+        self.assertAlmostEqual(statistics['percentiles']['50'], np.nanmedian(self.array[np.isfinite(self.array)]))
+        self.assertEqual(set(statistics['percentiles'].keys()), {'1', '2', '5', '25', '50', '75', '95', '98', '99'})
+
+    def test_dask_chunks_are_streamed(self):
+        monitor = RecordingMonitor()
+        array = xr.DataArray(da.from_array(self.array, chunks=(1, 100, 300)))
+        statistics = compute_array_statistics(array, max_block_size=100000, monitor=monitor)
+        self.assert_exact_statistics(statistics, self.array)
+        self.assertEqual(monitor.total_work, 3)
+        self.assertEqual(monitor.work, 3)
+
+    def test_masked_array(self):
+        array = np.ma.masked_greater(np.arange(100.0).reshape((10, 10)), 49.0)
+        statistics = compute_array_statistics(array, percentiles=(50,))
+        self.assertEqual(statistics['count'], 50)
+        self.assertEqual(statistics['max'], 49.0)
+        self.assertEqual(statistics['percentiles'], {'50': 24.5})
+
+    def test_sample_is_bounded(self):
+        statistics = compute_array_statistics(self.array, max_sample_size=10000)
+        # Histogram counts are scaled and rounded
+        self.assert_exact_statistics(statistics, self.array, histogram_delta=128)
+        self.assertLessEqual(statistics['sample_size'], 10000)
+        self.assertGreater(statistics['sample_size'], 9000)
+        self.assertAlmostEqual(statistics['percentiles']['50'], 10.0, delta=0.1)
+        self.assertAlmostEqual(statistics['percentiles']['98'], 10.0 + 2.054 * 2.0, delta=0.2)
+
+    def test_stride(self):
+        statistics = compute_array_statistics(self.array, stride=3)
+        self.assert_exact_statistics(statistics, self.array[::3, ::3, ::3])
+
+    def test_no_valid_values(self):
+        statistics = compute_array_statistics(np.full((4, 4), np.nan))
+        self.assertEqual(statistics['count'], 0)
+        self.assertIsNone(statistics['min'])
+        self.assertIsNone(statistics['max'])
+        self.assertIsNone(statistics['histogram'])
+        self.assertIsNone(statistics['percentiles']['50'])
+
+    def test_integer_array(self):
+        statistics = compute_array_statistics(np.arange(10, dtype=np.int16))
+        self.assertEqual((statistics['min'], statistics['max'], statistics['mean']), (0, 9, 4.5))
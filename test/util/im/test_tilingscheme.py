@@ -1,7 +1,7 @@
 from unittest import TestCase
 
 from cate.util.im import GeoExtent
-from cate.util.im.tilingscheme import TilingScheme, pow2_1d_subdivisions, pow2_2d_subdivision
+from cate.util.im.tilingscheme import TilingScheme, pow2_1d_subdivisions, pow2_2d_subdivision, is_chunk_aligned
 
 POS_Y_AXIS_GLOBAL_RECT = GeoExtent(-180., -90., +180., +90., inv_y=False)
 NEG_Y_AXIS_GLOBAL_RECT = GeoExtent(-180., -90., +180., +90., inv_y=True)
@@ -87,6 +87,24 @@ class TilingSchemeTest(TestCase):
         self.assertEqual(TilingScheme.create(4000, 3000, 500, 500, GeoExtent(170., 10., -160., 70., inv_y=True)),
                          TilingScheme(4, 1, 1, 500, 375, GeoExtent(170.0, 10.0, -160.0, 70.0, inv_y=True)))
 
+    def test_create_chunk_aligned(self):
+        # Aerosol CCI - monthly, tiles are multiples of the chunk size
+        self.assertEqual(TilingScheme.create(7200, 3600, 360, 360, POS_Y_AXIS_GLOBAL_RECT,
+                                             chunk_width=100, chunk_height=100),
+                         TilingScheme(3, 6, 3, 300, 300, POS_Y_AXIS_GLOBAL_RECT))
+        # Tiles are divisors of the chunk size
+        self.assertEqual(TilingScheme.create(7200, 3600, 360, 360, POS_Y_AXIS_GLOBAL_RECT,
+                                             chunk_width=1800, chunk_height=1200),
+                         TilingScheme(3, 4, 3, 450, 300, POS_Y_AXIS_GLOBAL_RECT))
+        # No chunk aligned subdivision, chunk sizes are ignored
+        self.assertEqual(TilingScheme.create(7200, 3600, 360, 360, POS_Y_AXIS_GLOBAL_RECT,
+                                             chunk_width=1000, chunk_height=1000),
+                         TilingScheme.create(7200, 3600, 360, 360, POS_Y_AXIS_GLOBAL_RECT))
+        # Chunks covering the whole image are ignored
+        self.assertEqual(TilingScheme.create(7200, 3600, 360, 360, POS_Y_AXIS_GLOBAL_RECT,
+                                             chunk_width=7200, chunk_height=3600),
+                         TilingScheme.create(7200, 3600, 360, 360, POS_Y_AXIS_GLOBAL_RECT))
+
     def test_create_illegal(self):
         # legal - explains why the next must fail
         self.assertEqual(TilingScheme.create(50, 25, 5, 5, GeoExtent(0.0, 77.5, 25.0, 90.0, inv_y=True)),
@@ -189,6 +207,18 @@ class Subdivision1DTest(TestCase):
                           (64800, 810, 5, 5),
                           (64800, 675, 6, 5)])
 
+    def test_size_subdivisions_chunk_aligned(self):
+        subdivisions = pow2_1d_subdivisions(3600, ts_chunk=100)
+        self.assertEqual(subdivisions[0], (3600, 900, 1, 3))
+        self.assertTrue(all(is_chunk_aligned(ts, 100) for _, ts, _, _ in subdivisions[:4]))
+        self.assertEqual(sorted(subdivisions), sorted(pow2_1d_subdivisions(3600)))
+
+    def test_is_chunk_aligned(self):
+        self.assertTrue(is_chunk_aligned(300, 100))
+        self.assertTrue(is_chunk_aligned(300, 900))
+        self.assertFalse(is_chunk_aligned(300, 200))
+        self.assertFalse(is_chunk_aligned(450, 1000))
+
     def test_pow2_1d_subdivision_illegal(self):
         with self.assertRaises(ValueError):
             pow2_1d_subdivisions(-100)
@@ -1,3 +1,4 @@
+import zlib
 from unittest import TestCase
 
 import numpy as np
@@ -39,6 +40,71 @@ class ArrayTest(TestCase):
                                              [1.1, 1.1, 1.1],
                                              [1.1, 1.1, nan]]))
 
+    def test_aggregate_ndarray_nanmean(self):
+        nan = np.nan
+        a = np.array([[1.0, 3.0, nan, nan],
+                      [nan, 2.0, nan, nan]])
+        b = utils.downsample_ndarray(a, aggregator=utils.aggregate_ndarray_nanmean)
+        np.testing.assert_equal(b, np.array([[2.0, nan]]))
+
+
+class DownsampleNdarray2x2Test(TestCase):
+    def setUp(self):
+        nan = np.nan
+        self.a = np.array([[1.0, 3.0, nan, nan, 5.0, 4.0],
+                           [nan, 2.0, nan, nan, 7.0, 8.0]])
+
+    def test_float_with_nan(self):
+        nan = np.nan
+        a = self.a
+        np.testing.assert_equal(utils.downsample_ndarray_2x2(a, 'first'), [[1.0, nan, 5.0]])
+        np.testing.assert_equal(utils.downsample_ndarray_2x2(a, 'min'), [[1.0, nan, 4.0]])
+        np.testing.assert_equal(utils.downsample_ndarray_2x2(a, 'max'), [[3.0, nan, 8.0]])
+        np.testing.assert_equal(utils.downsample_ndarray_2x2(a, 'sum'), [[6.0, nan, 24.0]])
+        np.testing.assert_equal(utils.downsample_ndarray_2x2(a, 'mean'), [[2.0, nan, 6.0]])
+        a[0, 0] = nan
+        np.testing.assert_equal(utils.downsample_ndarray_2x2(a, 'first'), [[3.0, nan, 5.0]])
+
+    def test_masked(self):
+        a = np.ma.masked_array([[1, 3, 0, 0, 5, 4],
+                                [0, 2, 0, 0, 7, 8]],
+                               mask=[[False, False, True, True, True, False],
+                                     [True, False, True, True, False, False]])
+        b = utils.downsample_ndarray_2x2(a, 'mean')
+        self.assertIsInstance(b, np.ma.MaskedArray)
+        self.assertEqual(b.dtype, np.float64)
+        self.assertEqual(b.tolist(), [[2.0, None, 19. / 3.]])
+        b = utils.downsample_ndarray_2x2(a, 'first')
+        self.assertEqual(b.dtype, a.dtype)
+        self.assertEqual(b.tolist(), [[1, None, 4]])
+        self.assertEqual(utils.downsample_ndarray_2x2(a, 'min').tolist(), [[1, None, 4]])
+        self.assertEqual(utils.downsample_ndarray_2x2(a, 'max').tolist(), [[3, None, 8]])
+        self.assertEqual(utils.downsample_ndarray_2x2(a, 'sum').tolist(), [[6, None, 19]])
+
+    def test_integer(self):
+        a = np.arange(24, dtype=np.int16).reshape((2, 3, 4))
+        b = utils.downsample_ndarray_2x2(a, 'mean')
+        self.assertEqual(b.dtype, np.float64)
+        np.testing.assert_equal(b, [[[2.5, 4.5]], [[14.5, 16.5]]])
+        b = utils.downsample_ndarray_2x2(a, 'max')
+        self.assertEqual(b.dtype, np.int16)
+        np.testing.assert_equal(b, [[[5, 7]], [[17, 19]]])
+
+    def test_out(self):
+        out = np.zeros((2, 6))
+        out_mask = np.ones((2, 6), dtype=np.bool_)
+        b = utils.downsample_ndarray_2x2(self.a, 'mean', out=out[1:, 3:], out_mask=out_mask[1:, 3:])
+        self.assertIs(b.base, out)
+        np.testing.assert_equal(out, [[0., 0., 0., 0., 0., 0.],
+                                      [0., 0., 0., 2.0, np.nan, 6.0]])
+        np.testing.assert_equal(out_mask[1, 3:], [False, True, False])
+        with self.assertRaises(ValueError):
+            utils.downsample_ndarray_2x2(self.a, 'mean', out=out)
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            utils.downsample_ndarray_2x2(self.a, 'median')
+
 
 class GetChunkSizeTest(TestCase):
     def test_any_obj(self):
@@ -60,3 +126,63 @@ class GetChunkSizeTest(TestCase):
         netcdf4_var = X()
         netcdf4_var.chunks = (1, 900, 1800)
         self.assertEqual(utils.get_chunk_size(netcdf4_var), (1, 900, 1800))
+
+
+class EncodeNdarrayTest(TestCase):
+    def setUp(self):
+        self.array = np.ma.masked_array([[0.5, 1.5, 2.5],
+                                         [np.nan, 4.5, 100.5]],
+                                        mask=[[False, True, False],
+                                              [False, False, False]])
+
+    def test_float32(self):
+        data, info = utils.encode_ndarray(self.array)
+        self.assertEqual(info, dict(width=3, height=2, dtype='float32', compression=None))
+        self.assertEqual(len(data), 6 * 4)
+        decoded = np.frombuffer(data, dtype='<f4').reshape((2, 3))
+        np.testing.assert_equal(decoded, np.array([[0.5, np.nan, 2.5],
+                                                   [np.nan, 4.5, 100.5]]))
+
+    def test_float16_zlib(self):
+        data, info = utils.encode_ndarray(self.array, dtype='float16', compression='zlib')
+        self.assertEqual(info, dict(width=3, height=2, dtype='float16', compression='zlib'))
+        decoded = np.frombuffer(zlib.decompress(data), dtype='<f2').reshape((2, 3))
+        np.testing.assert_equal(decoded, np.array([[0.5, np.nan, 2.5],
+                                                   [np.nan, 4.5, 100.5]], dtype=np.float16))
+
+    def test_uint16(self):
+        data, info = utils.encode_ndarray(self.array, dtype='uint16')
+        self.assertEqual(info['dtype'], 'uint16')
+        self.assertEqual(info['no_data'], utils.UINT16_NO_DATA)
+        self.assertEqual(info['offset'], 0.5)
+        self.assertAlmostEqual(info['scale'], 100. / 65534)
+        encoded = np.frombuffer(data, dtype='<u2').reshape((2, 3))
+        self.assertEqual(encoded[0, 0], 0)
+        self.assertEqual(encoded[1, 2], 65534)
+        self.assertEqual(encoded[0, 1], utils.UINT16_NO_DATA)
+        self.assertEqual(encoded[1, 0], utils.UINT16_NO_DATA)
+        decoded = encoded * info['scale'] + info['offset']
+        np.testing.assert_allclose(decoded[~(encoded == utils.UINT16_NO_DATA)], [0.5, 2.5, 4.5, 100.5],
+                                   atol=info['scale'])
+
+    def test_uint16_constant_and_empty(self):
+        data, info = utils.encode_ndarray(np.full((2, 2), 7.0), dtype='uint16')
+        self.assertEqual((info['scale'], info['offset']), (1.0, 7.0))
+        np.testing.assert_equal(np.frombuffer(data, dtype='<u2'), [0, 0, 0, 0])
+        data, info = utils.encode_ndarray(np.full((2, 2), np.nan), dtype='uint16')
+        np.testing.assert_equal(np.frombuffer(data, dtype='<u2'), [utils.UINT16_NO_DATA] * 4)
+
+    def test_array_like(self):
+        class ArrayLike:
+            def __array__(self, dtype=None):
+                return np.array([[1.0, np.nan], [3.0, 5.0]])
+
+        data, info = utils.encode_ndarray(ArrayLike(), dtype='uint16')
+        self.assertEqual((info['width'], info['height'], info['offset']), (2, 2, 1.0))
+        np.testing.assert_equal(np.frombuffer(data, dtype='<u2'), [0, utils.UINT16_NO_DATA, 32767, 65534])
+
+    def test_illegal_args(self):
+        with self.assertRaises(ValueError):
+            utils.encode_ndarray(self.array, dtype='int8')
+        with self.assertRaises(ValueError):
+            utils.encode_ndarray(self.array, compression='lz4')
@@ -1,8 +1,20 @@
 import os
+import random
 import shutil
-from unittest import TestCase
+import threading
+import time
+import tracemalloc
+import unittest
+from unittest import TestCase, mock
 
-from cate.util.cache import CacheStore, Cache, MemoryCacheStore, FileCacheStore
+import dask.array as da
+import numpy as np
+import xarray as xr
+from PIL import Image
+
+from cate.util.cache import CacheStore, Cache, ShardedCache, MemoryCacheStore, FileCacheStore, \
+    IndexedFileCacheStore, SegmentedFileCacheStore, POLICY_LRU, POLICY_MRU, POLICY_LFU, POLICY_RR, POLICY_TINY_LFU, \
+    compute_object_size, register_object_sizer
 
 
 class MemoryCacheStoreTest(TestCase):
@@ -92,6 +104,260 @@ class FileCacheStoreTest(TestCase):
         with self.assertRaises(FileNotFoundError):
             self.cache_store.restore_value('c', self.stored_value_c)
 
+    def test_discard_value_prunes_empty_dirs(self):
+        stored_value, _ = self.cache_store.store_value('x/y/z', bytes('jkl', 'utf8'))
+        self.assertTrue(os.path.isfile(os.path.join(FileCacheStoreTest.DIR, 'x', 'y', 'z.dat')))
+        self.cache_store.discard_value('x/y/z', stored_value)
+        self.assertFalse(os.path.exists(os.path.join(FileCacheStoreTest.DIR, 'x')))
+        self.assertTrue(os.path.isdir(FileCacheStoreTest.DIR))
+
+    def test_store_value_leaves_no_temp_files(self):
+        self.cache_store.store_value('a', bytes('xyz', 'utf8'))
+        self.assertEqual(sorted(os.listdir(FileCacheStoreTest.DIR)), ['a.dat', 'b.dat', 'c.dat'])
+
+
+class IndexedFileCacheStoreTest(TestCase):
+    DIR = '__test_indexed_file_cache__'
+
+    def setUp(self):
+        shutil.rmtree(IndexedFileCacheStoreTest.DIR, ignore_errors=True)
+
+    def tearDown(self):
+        shutil.rmtree(IndexedFileCacheStoreTest.DIR, ignore_errors=True)
+
+    def _new_cache(self):
+        return Cache(IndexedFileCacheStore(IndexedFileCacheStoreTest.DIR, '.dat'), capacity=40, threshold=0.5)
+
+    def test_index_survives_restart(self):
+        cache = self._new_cache()
+        cache.put_value('a/1', b'aaaaa')
+        cache.put_value('a/2', b'bbbbb')
+        cache.put_value('b/1', b'ccccc')
+        cache.get_value('a/1')
+        self.assertEqual(cache.size, 15)
+        cache.store.close()
+
+        cache = self._new_cache()
+        self.assertEqual(cache.size, 15)
+        self.assertEqual(cache.get_value('a/1'), b'aaaaa')
+        # a/2 is least recently used
+        cache.put_value('c/1', b'ddddd')
+        cache.put_value('c/2', b'eeeee')
+        self.assertEqual(cache.size, 20)
+        self.assertFalse(os.path.exists(os.path.join(IndexedFileCacheStoreTest.DIR, 'a', '2.dat')))
+        self.assertEqual(cache.get_value('a/2'), None)
+        self.assertEqual(cache.get_value('b/1'), b'ccccc')
+        cache.store.close()
+
+    def test_capacity_is_enforced_on_restart(self):
+        cache = Cache(IndexedFileCacheStore(IndexedFileCacheStoreTest.DIR, '.dat'), capacity=100, threshold=1.0)
+        for i in range(10):
+            cache.put_value('k%d' % i, b'0123456789')
+        self.assertEqual(cache.size, 100)
+        cache.store.close()
+
+        cache = self._new_cache()
+        self.assertEqual(cache.size, 20)
+        self.assertEqual(cache.get_value('k0'), None)
+        self.assertEqual(cache.get_value('k9'), b'0123456789')
+        cache.store.close()
+
+    def test_clear(self):
+        cache = self._new_cache()
+        cache.put_value('a/1', b'aaaaa')
+        cache.put_value('a/2', b'bbbbb')
+        cache.clear()
+        self.assertEqual(cache.size, 0)
+        self.assertFalse(os.path.exists(IndexedFileCacheStoreTest.DIR))
+        self.assertEqual(cache.get_value('a/1'), None)
+        cache.put_value('a/1', b'aaaaa')
+        self.assertEqual(cache.get_value('a/1'), b'aaaaa')
+        cache.store.close()
+
+    def test_files_deleted_externally_are_misses(self):
+        cache = self._new_cache()
+        cache.put_value('a/1', b'aaaaa')
+        cache.put_value('a/2', b'bbbbb')
+        cache.reset_stats()
+        os.remove(os.path.join(IndexedFileCacheStoreTest.DIR, 'a', '1.dat'))
+        self.assertEqual(cache.get_value('a/1'), None)
+        self.assertEqual(cache.stats.hit_count, 0)
+        self.assertEqual(cache.stats.miss_count, 1)
+        self.assertFalse(cache.has_value('a/1'))
+        self.assertEqual(cache.size, 5)
+        cache.store.close()
+
+        cache = self._new_cache()
+        self.assertEqual(cache.size, 5)
+        self.assertEqual(cache.get_value('a/2'), b'bbbbb')
+        cache.store.close()
+
+    def test_recovers_unindexed_files(self):
+        os.makedirs(IndexedFileCacheStoreTest.DIR)
+        with open(os.path.join(IndexedFileCacheStoreTest.DIR, 'x.dat'), 'wb') as fp:
+            fp.write(b'xxx')
+        cache = self._new_cache()
+        self.assertEqual(cache.size, 0)
+        self.assertEqual(cache.get_value('x'), b'xxx')
+        self.assertEqual(cache.size, 3)
+        cache.store.close()
+
+        cache = self._new_cache()
+        self.assertEqual(cache.size, 3)
+        cache.store.close()
+
+
+class SegmentedFileCacheStoreTest(TestCase):
+    DIR = '__test_segmented_file_cache__'
+
+    def setUp(self):
+        shutil.rmtree(SegmentedFileCacheStoreTest.DIR, ignore_errors=True)
+
+    def tearDown(self):
+        shutil.rmtree(SegmentedFileCacheStoreTest.DIR, ignore_errors=True)
+
+    @staticmethod
+    def _new_store(**kwargs):
+        return SegmentedFileCacheStore(SegmentedFileCacheStoreTest.DIR, **kwargs)
+
+    @staticmethod
+    def _segment_files():
+        return sorted(os.listdir(SegmentedFileCacheStoreTest.DIR))
+
+    def test_store_restore_discard(self):
+        store = self._new_store()
+        stored_value_a, size_a = store.store_value('a/0/0', b'abc')
+        stored_value_b, size_b = store.store_value('b/0/0', b'defgh')
+        self.assertEqual(size_a, 3)
+        self.assertEqual(size_b, 5)
+        value = store.restore_value('a/0/0', stored_value_a)
+        self.assertIsInstance(value, memoryview)
+        self.assertEqual(bytes(value), b'abc')
+        self.assertEqual(bytes(store.restore_value('b/0/0', stored_value_b)), b'defgh')
+        store.discard_value('a/0/0', stored_value_a)
+        self.assertEqual(store.restore_value('a/0/0', stored_value_a), None)
+        self.assertTrue(store.can_load_from_key('b/0/0'))
+        self.assertFalse(store.can_load_from_key('a/0/0'))
+        self.assertEqual(self._segment_files(), ['segment-000000.dat'])
+        store.close()
+
+    def test_index_survives_restart(self):
+        store = self._new_store()
+        store.store_value('a', b'111')
+        store.store_value('b', b'222')
+        store.store_value('c', b'333')
+        store.discard_value('b', 'b')
+        store.store_value('a', b'444')
+        store.close()
+
+        store = self._new_store()
+        self.assertEqual(store.load_index(), [('c', 'c', 3), ('a', 'a', 3)])
+        self.assertEqual(bytes(store.restore_value('a', 'a')), b'444')
+        self.assertEqual(store.restore_value('b', 'b'), None)
+        store.close()
+
+    def test_segments_are_compacted(self):
+        store = self._new_store(segment_size=100)
+        for i in range(20):
+            store.store_value('k%02d' % i, bytes(20))
+        num_segments = len(self._segment_files())
+        self.assertGreater(num_segments, 4)
+        values = [store.restore_value('k%02d' % i, None) for i in range(0, 20, 2)]
+        for i in range(1, 20, 2):
+            store.discard_value('k%02d' % i, None)
+        self.assertLess(len(self._segment_files()), num_segments)
+        for i in range(0, 20, 2):
+            self.assertEqual(bytes(store.restore_value('k%02d' % i, None)), bytes(20))
+        # Previously restored values remain valid
+        for value in values:
+            self.assertEqual(bytes(value), bytes(20))
+        store.close()
+
+        store = self._new_store(segment_size=100)
+        self.assertEqual(sorted(key for key, _, _ in store.load_index()), ['k%02d' % i for i in range(0, 20, 2)])
+        store.close()
+
+    @staticmethod
+    def _fail_on_segment_files(remove, name=SegmentedFileCacheStore.SEGMENT_FILE_EXT):
+        def remove_or_fail(path, *args, **kwargs):
+            if str(path).endswith(name):
+                raise PermissionError('segment file is memory-mapped')
+            return remove(path, *args, **kwargs)
+
+        return remove_or_fail
+
+    def test_undeleted_segments_are_deleted_later(self):
+        # Segments hold 3 values each: k00-k02 in segment 0, k03-k05 in segment 1, ..., k18-k19 in segment 6
+        store = self._new_store(segment_size=100)
+        for i in range(20):
+            store.store_value('k%02d' % i, bytes(20))
+        with mock.patch('os.remove', side_effect=self._fail_on_segment_files(os.remove, 'segment-000001.dat')):
+            # Compacts segment 1, the tombstones of k03 and k04 are in segment 6
+            store.discard_value('k03', None)
+            store.discard_value('k04', None)
+            self.assertIn('segment-000001.dat', self._segment_files())
+            # Compacts segment 6, the tombstones must be kept, because segment 1 still holds k03 and k04
+            store.discard_value('k18', None)
+            store.discard_value('k19', None)
+            self.assertNotIn('segment-000006.dat', self._segment_files())
+            self.assertIn('segment-000001.dat', self._segment_files())
+        expected_keys = ['k%02d' % i for i in range(20) if i not in (3, 4, 18, 19)]
+
+        # A rescan must not restore discarded values from the undeleted segment
+        scanning_store = self._new_store(segment_size=100)
+        self.assertEqual(sorted(key for key, _, _ in scanning_store.load_index()), expected_keys)
+        scanning_store.close()
+
+        store.close()
+        self.assertNotIn('segment-000001.dat', self._segment_files())
+        store = self._new_store(segment_size=100)
+        self.assertEqual(sorted(key for key, _, _ in store.load_index()), expected_keys)
+        store.close()
+
+    def test_clear_with_undeleted_segments(self):
+        store = self._new_store(segment_size=100)
+        for i in range(20):
+            store.store_value('k%02d' % i, bytes(20))
+        with mock.patch('os.unlink', side_effect=self._fail_on_segment_files(os.unlink)):
+            self.assertTrue(store.clear())
+        self.assertEqual(store.load_index(), [])
+        store.close()
+
+        store = self._new_store(segment_size=100)
+        self.assertEqual(store.load_index(), [])
+        store.close()
+
+    def test_truncated_segment_is_recovered(self):
+        store = self._new_store()
+        store.store_value('a', b'111')
+        store.store_value('b', b'222')
+        store.close()
+        path = os.path.join(SegmentedFileCacheStoreTest.DIR, 'segment-000000.dat')
+        with open(path, 'r+b') as fp:
+            fp.truncate(os.path.getsize(path) - 1)
+
+        store = self._new_store()
+        self.assertEqual(store.load_index(), [('a', 'a', 3)])
+        store.store_value('c', b'333')
+        self.assertEqual(bytes(store.restore_value('c', 'c')), b'333')
+        store.close()
+
+    def test_with_cache(self):
+        cache = Cache(self._new_store(segment_size=1000), capacity=100, threshold=0.5)
+        for i in range(10):
+            cache.put_value('tile/%d' % i, b'0123456789')
+        self.assertEqual(cache.size, 50)
+        self.assertEqual(cache.get_value('tile/0'), None)
+        self.assertEqual(bytes(cache.get_value('tile/9')), b'0123456789')
+        cache.store.close()
+
+        cache = Cache(self._new_store(segment_size=1000), capacity=100, threshold=0.5)
+        self.assertEqual(cache.size, 50)
+        self.assertEqual(bytes(cache.get_value('tile/5')), b'0123456789')
+        cache.clear()
+        self.assertEqual(cache.size, 0)
+        self.assertFalse(os.path.exists(SegmentedFileCacheStoreTest.DIR))
+
 
 class TracingCacheStore(CacheStore):
     def __init__(self):
@@ -188,3 +454,391 @@ class CacheTest(TestCase):
         self.assertEqual(cache.get_value('k5'), 'yyyy')
         self.assertEqual(cache.size, 600)
         self.assertEqual(cache_store.trace, 'can_load_from_key(k5);load_from_key(k5);restore(k5, S/yyyy);')
+
+
+class UnitSizeCacheStore(MemoryCacheStore):
+    def store_value(self, key, value):
+        return [key, value], 1
+
+
+class CachePolicyTest(TestCase):
+    @staticmethod
+    def _new_cache(policy):
+        # max_size is 4
+        return Cache(store=UnitSizeCacheStore(), capacity=8, threshold=0.5, policy=policy)
+
+    @staticmethod
+    def _keys(cache):
+        return sorted(key for key in 'abcdef' if cache.get_value(key) is not None)
+
+    def test_lru(self):
+        cache = self._new_cache(POLICY_LRU)
+        for key in 'abcd':
+            cache.put_value(key, key.upper())
+        cache.get_value('a')
+        cache.put_value('e', 'E')
+        self.assertEqual(cache.size, 4)
+        self.assertEqual(self._keys(cache), ['a', 'c', 'd', 'e'])
+
+    def test_mru(self):
+        cache = self._new_cache(POLICY_MRU)
+        for key in 'abcd':
+            cache.put_value(key, key.upper())
+        cache.get_value('b')
+        cache.put_value('e', 'E')
+        self.assertEqual(cache.size, 4)
+        self.assertEqual(self._keys(cache), ['a', 'c', 'd', 'e'])
+
+    def test_lfu(self):
+        cache = self._new_cache(POLICY_LFU)
+        for key in 'abcd':
+            cache.put_value(key, key.upper())
+        for key in 'aabccdd':
+            cache.get_value(key)
+        cache.put_value('e', 'E')
+        self.assertEqual(cache.size, 4)
+        self.assertEqual(cache.get_value('b'), None)
+        cache.remove_value('e')
+        cache.put_value('f', 'F')
+        cache.put_value('e', 'E')
+        self.assertEqual(cache.size, 4)
+        self.assertEqual(cache.get_value('f'), None)
+        self.assertEqual(cache.get_value('e'), 'E')
+
+    def test_rr(self):
+        cache = self._new_cache(POLICY_RR)
+        for key in 'abcdef':
+            cache.put_value(key, key.upper())
+        self.assertEqual(cache.size, 4)
+        self.assertEqual(len(self._keys(cache)), 4)
+        cache.clear()
+        self.assertEqual(cache.size, 0)
+
+    def test_sort_key(self):
+        # Legacy policy given as sort key: evicts the alphabetically greatest key first
+        cache = self._new_cache(lambda item: -ord(item.key))
+        for key in 'abcde':
+            cache.put_value(key, key.upper())
+        self.assertEqual(cache.size, 4)
+        self.assertEqual(self._keys(cache), ['a', 'b', 'c', 'e'])
+
+    def test_tiny_lfu(self):
+        cache = self._new_cache(POLICY_TINY_LFU)
+        for key in 'abcd':
+            cache.put_value(key, key.upper())
+        for key in 'aabbccdd':
+            cache.get_value(key)
+        # 'e' is admitted to the window, but not to the main space, as it is less frequently used
+        cache.put_value('e', 'E')
+        cache.put_value('f', 'F')
+        self.assertEqual(cache.size, 4)
+        self.assertEqual(cache.get_value('e'), None)
+        self.assertEqual([key for key in 'abcd' if cache.get_value(key) is not None], ['a', 'b', 'c'])
+
+    def test_tiny_lfu_is_scan_resistant(self):
+        hot_keys = ['hot-%d' % i for i in range(50)]
+        scan_keys = ['scan-%d' % i for i in range(1000)]
+        for policy, expected_min_hits in ((POLICY_LRU, 0), (POLICY_TINY_LFU, 45)):
+            cache = Cache(store=UnitSizeCacheStore(), capacity=200, threshold=0.5, policy=policy)
+            for _ in range(5):
+                for key in hot_keys:
+                    if cache.get_value(key) is None:
+                        cache.put_value(key, key)
+            for key in scan_keys:
+                cache.put_value(key, key)
+            cache.reset_stats()
+            for key in hot_keys:
+                cache.get_value(key)
+            self.assertEqual(cache.size, 100)
+            self.assertGreaterEqual(cache.hit_count, expected_min_hits)
+            if policy is POLICY_LRU:
+                self.assertEqual(cache.hit_count, 0)
+
+    def test_tiny_lfu_rejects_oversized_items(self):
+        cache = Cache(store=MemoryCacheStore(), capacity=2000, threshold=0.5, policy=POLICY_TINY_LFU)
+        small_values = [bytes(10) for _ in range(50)]
+        for i, value in enumerate(small_values):
+            cache.put_value(i, value)
+        cache.put_value('big', bytes(1200))
+        cache.put_value('small', bytes(10))
+        self.assertIsNone(cache.get_value('big'))
+        self.assertLessEqual(cache.size, 1000)
+
+    def test_hit_ratio(self):
+        cache = self._new_cache(POLICY_TINY_LFU)
+        self.assertEqual(cache.hit_ratio, 0.0)
+        cache.put_value('a', 'A')
+        cache.get_value('a')
+        cache.get_value('a')
+        cache.get_value('a')
+        cache.get_value('b')
+        self.assertEqual(cache.hit_count, 3)
+        self.assertEqual(cache.miss_count, 1)
+        self.assertEqual(cache.hit_ratio, 0.75)
+        cache.reset_stats()
+        self.assertEqual(cache.hit_count, 0)
+        self.assertEqual(cache.miss_count, 0)
+
+    def test_stats(self):
+        parent_cache = self._new_cache(POLICY_LRU)
+        cache = Cache(store=UnitSizeCacheStore(), capacity=4, threshold=0.5, parent_cache=parent_cache)
+        for key in 'abc':
+            cache.put_value(key, key.upper())
+        cache.get_value('c')
+        cache.get_value('a')
+        cache.get_value('x')
+        stats = cache.stats
+        self.assertEqual(stats.put_count, 3)
+        self.assertEqual(stats.hit_count, 1)
+        self.assertEqual(stats.miss_count, 2)
+        self.assertEqual(stats.parent_hit_count, 1)
+        self.assertEqual(stats.eviction_count, 1)
+        self.assertEqual(stats.evicted_size, 1)
+        self.assertGreater(stats.trim_time, 0.0)
+        self.assertGreater(stats.store_time, 0.0)
+        self.assertGreater(stats.restore_time, 0.0)
+        self.assertAlmostEqual(stats.to_dict()['hit_ratio'], 1 / 3)
+        self.assertEqual(parent_cache.stats.put_count, 1)
+        cache.reset_stats()
+        self.assertEqual(cache.stats.to_dict()['put_count'], 0)
+        # stats is a snapshot
+        self.assertEqual(stats.put_count, 3)
+
+    def test_parent_cache(self):
+        parent_cache = self._new_cache(POLICY_LRU)
+        cache = Cache(store=UnitSizeCacheStore(), capacity=4, threshold=0.5, parent_cache=parent_cache)
+        for key in 'abcd':
+            cache.put_value(key, key.upper())
+        self.assertEqual(cache.size, 2)
+        self.assertEqual(parent_cache.size, 2)
+        self.assertEqual(cache.get_value('a'), 'A')
+        self.assertEqual(cache.get_value('d'), 'D')
+
+
+class ShardedCacheTest(TestCase):
+    def test_props(self):
+        cache = ShardedCache(store=UnitSizeCacheStore(), capacity=64, threshold=0.5, num_shards=4)
+        self.assertEqual(cache.num_shards, 4)
+        self.assertEqual(cache.capacity, 64)
+        self.assertEqual(cache.max_size, 32)
+        self.assertEqual(cache.size, 0)
+        for shard in cache.shards:
+            self.assertEqual(shard.capacity, 16)
+            self.assertEqual(shard.max_size, 8)
+        with self.assertRaises(ValueError):
+            ShardedCache(num_shards=0)
+        with self.assertRaises(ValueError):
+            ShardedCache(policy=POLICY_LRU())
+
+    def test_change_capacity(self):
+        cache = ShardedCache(store=UnitSizeCacheStore(), capacity=64, threshold=0.5, num_shards=4)
+        for i in range(32):
+            cache.put_value(i, i)
+        self.assertEqual(cache.size, 32)
+        cache.capacity = 32
+        self.assertEqual(cache.capacity, 32)
+        self.assertEqual(cache.max_size, 16)
+        self.assertEqual(cache.size, 16)
+        for shard in cache.shards:
+            self.assertEqual(shard.capacity, 8)
+
+    def test_stats(self):
+        cache = ShardedCache(store=UnitSizeCacheStore(), capacity=64, threshold=0.5, num_shards=4)
+        for i in range(16):
+            cache.put_value(i, i)
+        for i in range(32):
+            cache.get_value(i)
+        self.assertEqual(cache.stats.put_count, 16)
+        self.assertEqual(cache.stats.hit_count, 16)
+        self.assertEqual(cache.stats.miss_count, 16)
+        self.assertEqual(cache.hit_ratio, 0.5)
+        cache.reset_stats()
+        self.assertEqual(cache.stats.put_count, 0)
+
+    def test_put_get_remove(self):
+        cache = ShardedCache(store=UnitSizeCacheStore(), capacity=64, threshold=0.5, num_shards=4)
+        for i in range(16):
+            cache.put_value('k%d' % i, i)
+        self.assertEqual(cache.size, sum(shard.size for shard in cache.shards))
+        self.assertLessEqual(cache.size, 16)
+        for shard in cache.shards:
+            self.assertLessEqual(shard.size, shard.max_size)
+        cache.put_value('x', 'X')
+        self.assertIs(cache.get_shard('x').get_value('x'), 'X')
+        self.assertEqual(cache.get_value('x'), 'X')
+        self.assertTrue(cache.has_value('x'))
+        cache.remove_value('x')
+        self.assertFalse(cache.has_value('x'))
+        self.assertEqual(cache.get_value('x'), None)
+        cache.clear()
+        self.assertEqual(cache.size, 0)
+
+    def test_concurrent_access(self):
+        cache = ShardedCache(store=UnitSizeCacheStore(), capacity=200, threshold=0.5, num_shards=8)
+        errors = []
+
+        def run(seed):
+            rnd = random.Random(seed)
+            try:
+                for _ in range(2000):
+                    key = 'tile-%d' % rnd.randrange(400)
+                    value = cache.get_value(key)
+                    if value is None:
+                        cache.put_value(key, key)
+                    elif value != key:
+                        errors.append(value)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(seed,)) for seed in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertLessEqual(cache.size, cache.max_size)
+
+
+class ComputeObjectSizeTest(TestCase):
+    def assertSizeMatchesTracedMemory(self, factory):
+        # Compare the computed size with the memory allocated by factory() and kept alive by its result
+        tracemalloc.start()
+        try:
+            memory_before = tracemalloc.get_traced_memory()[0]
+            obj = factory()
+            traced_size = tracemalloc.get_traced_memory()[0] - memory_before
+        finally:
+            tracemalloc.stop()
+        size = compute_object_size(obj)
+        self.assertAlmostEqual(size, traced_size, delta=0.05 * traced_size + 1024)
+        return size
+
+    def test_ndarray(self):
+        size = self.assertSizeMatchesTracedMemory(lambda: np.zeros((256, 256), dtype=np.float32))
+        self.assertGreaterEqual(size, 256 * 256 * 4)
+
+    def test_masked_array(self):
+        def factory():
+            array = np.zeros((256, 256), dtype=np.float64)
+            array[0, 0] = np.nan
+            return np.ma.masked_invalid(array)
+
+        size = self.assertSizeMatchesTracedMemory(factory)
+        self.assertGreaterEqual(size, 256 * 256 * (8 + 1))
+
+    def test_masked_array_without_mask(self):
+        self.assertSizeMatchesTracedMemory(lambda: np.ma.MaskedArray(np.zeros((256, 256))))
+
+    def test_views_keep_base_alive(self):
+        # A flipped tile, as produced by TransformArrayImage
+        self.assertSizeMatchesTracedMemory(lambda: np.ma.masked_invalid(np.zeros((256, 256)))[::-1, :])
+        # A small view of a large array keeps the large array alive
+        size = self.assertSizeMatchesTracedMemory(lambda: np.zeros((1024, 1024))[0:16, 0:16])
+        self.assertGreaterEqual(size, 1024 * 1024 * 8)
+
+    def test_bytes_and_memoryview(self):
+        self.assertSizeMatchesTracedMemory(lambda: bytes(100000))
+        self.assertSizeMatchesTracedMemory(lambda: memoryview(bytes(100000))[0:10])
+
+    def test_xarray(self):
+        def new_data_array():
+            return xr.DataArray(np.zeros((180, 360)), dims=['lat', 'lon'],
+                                coords=dict(lat=np.linspace(-89.5, 89.5, 180), lon=np.linspace(-179.5, 179.5, 360)))
+
+        size = self.assertSizeMatchesTracedMemory(new_data_array)
+        self.assertGreaterEqual(size, (180 * 360 + 180 + 360) * 8)
+        size = self.assertSizeMatchesTracedMemory(lambda: xr.Dataset(dict(a=new_data_array(), b=new_data_array())))
+        self.assertGreaterEqual(size, 2 * 180 * 360 * 8)
+
+    def test_dask_array(self):
+        self.assertSizeMatchesTracedMemory(lambda: da.from_array(np.zeros((512, 512)), chunks=64))
+        # Data of computed arrays is not kept in memory
+        self.assertLess(compute_object_size(da.zeros((1024, 1024), chunks=256)), 1024 * 1024)
+
+    def test_pil_image(self):
+        self.assertGreaterEqual(compute_object_size(Image.new('RGB', (256, 256))), 256 * 256 * 4)
+        self.assertGreaterEqual(compute_object_size(Image.new('L', (256, 256))), 256 * 256)
+        self.assertLess(compute_object_size(Image.new('L', (256, 256))), 256 * 256 * 2)
+
+    def test_register_object_sizer(self):
+        class Tile:
+            pass
+
+        class SubTile(Tile):
+            pass
+
+        register_object_sizer(Tile, lambda tile: 42)
+        self.assertEqual(compute_object_size(Tile()), 42)
+        self.assertEqual(compute_object_size(SubTile()), 42)
+        register_object_sizer(SubTile, lambda tile: 43)
+        self.assertEqual(compute_object_size(SubTile()), 43)
+
+    def test_memory_cache_store(self):
+        value = np.ma.masked_invalid(np.zeros((256, 256)))
+        _, size = MemoryCacheStore().store_value('tile', value)
+        self.assertEqual(size, compute_object_size(value))
+
+
+@unittest.skipUnless(condition=os.environ.get('CATE_BENCHMARK_TESTS', None),
+                     reason="skipped unless CATE_BENCHMARK_TESTS=1")
+class CacheBenchmarkTest(TestCase):
+    def test_put_get_throughput(self):
+        for policy in (POLICY_LRU, POLICY_MRU, POLICY_LFU, POLICY_RR, POLICY_TINY_LFU):
+            for num_items in (1000, 10000, 100000):
+                cache = Cache(store=UnitSizeCacheStore(), capacity=num_items, threshold=0.75, policy=policy)
+                keys = ['tile-%d' % i for i in range(num_items)]
+                t0 = time.perf_counter()
+                for key in keys:
+                    cache.put_value(key, key)
+                t1 = time.perf_counter()
+                for key in keys:
+                    cache.get_value(key)
+                t2 = time.perf_counter()
+                print('%s: %d items: put %.0f ops/s, get %.0f ops/s' % (policy.__name__, num_items,
+                                                                        num_items / (t1 - t0),
+                                                                        num_items / (t2 - t1)))
+
+    def test_tile_trace_hit_ratio(self):
+        # Synthetic tile request trace: users keep returning to the low zoom levels,
+        # interrupted by pans across high zoom levels visiting many tiles only once.
+        rnd = random.Random(0)
+        trace = []
+        for _ in range(200):
+            for _ in range(100):
+                z = min(int(rnd.expovariate(1.0)), 4)
+                trace.append('tile-%d-%d-%d' % (z, rnd.randrange(2 ** z), rnd.randrange(2 ** z)))
+            z = rnd.randrange(10, 14)
+            y = rnd.randrange(2 ** z)
+            x = rnd.randrange(2 ** z - 200)
+            trace.extend('tile-%d-%d-%d' % (z, y, x + i) for i in range(rnd.randrange(50, 200)))
+
+        for policy in (POLICY_LRU, POLICY_MRU, POLICY_LFU, POLICY_RR, POLICY_TINY_LFU):
+            cache = Cache(store=UnitSizeCacheStore(), capacity=400, threshold=0.75, policy=policy)
+            for key in trace:
+                if cache.get_value(key) is None:
+                    cache.put_value(key, key)
+            print('%s: %d requests: hit ratio %.3f' % (policy.__name__, len(trace), cache.hit_ratio))
+
+    def test_concurrent_tile_access(self):
+        num_requests = 20000
+        num_keys = 20000
+
+        def run(cache, seed):
+            rnd = random.Random(seed)
+            for _ in range(num_requests):
+                key = 'tile-%d' % rnd.randrange(num_keys)
+                if cache.get_value(key) is None:
+                    cache.put_value(key, key)
+
+        for num_threads in (8, 16, 32):
+            for cache in (Cache(store=UnitSizeCacheStore(), capacity=num_keys // 2),
+                          ShardedCache(store=UnitSizeCacheStore(), capacity=num_keys // 2, num_shards=32)):
+                threads = [threading.Thread(target=run, args=(cache, seed)) for seed in range(num_threads)]
+                t0 = time.perf_counter()
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                t1 = time.perf_counter()
+                print('%s: %d threads: %.0f requests/s' % (type(cache).__name__, num_threads,
+                                                           num_threads * num_requests / (t1 - t0)))
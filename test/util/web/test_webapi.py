@@ -1,7 +1,10 @@
+import concurrent.futures
 import re
+import threading
 import unittest
 
 from cate.util.web import webapi
+from cate.util.web.webapi import BoundedRequestExecutor
 
 
 class UrlPatternTest(unittest.TestCase):
@@ -104,3 +107,56 @@ class WebAPIRequestHandlerTest(unittest.TestCase):
             self.assertEqual(status['error']['type'], 'ValueError')
             self.assertIsNotNone(status['error']['traceback'])
             self.assertEqual(status['status'], 'error')
+
+
+class BoundedRequestExecutorTest(unittest.TestCase):
+    def test_submit(self):
+        executor = BoundedRequestExecutor(max_workers=2, max_queue_size=2)
+        try:
+            self.assertEqual(executor.submit(pow, 2, 10).result(timeout=5), 1024)
+            self.assertEqual(executor.submit(int, '11', base=2).result(timeout=5), 3)
+            self.assertEqual(executor.num_pending, 0)
+        finally:
+            executor.shutdown()
+
+    def test_full_queue_rejects(self):
+        executor = BoundedRequestExecutor(max_workers=1, max_queue_size=1)
+        gate = threading.Event()
+        try:
+            future1 = executor.submit(gate.wait)
+            future2 = executor.submit(gate.wait)
+            self.assertEqual(executor.num_pending, 2)
+            self.assertIsNone(executor.submit(gate.wait))
+            self.assertEqual(executor.reject_count, 1)
+            gate.set()
+            self.assertTrue(future1.result(timeout=5))
+            self.assertTrue(future2.result(timeout=5))
+            self.assertIsNotNone(executor.submit(gate.wait))
+        finally:
+            gate.set()
+            executor.shutdown()
+
+    def test_stale_requests_are_dropped(self):
+        executor = BoundedRequestExecutor(max_workers=1, max_queue_size=1)
+        gate = threading.Event()
+        calls = []
+        try:
+            executor.submit(gate.wait)
+            future = executor.submit(calls.append, 'called', is_stale=lambda: True)
+            gate.set()
+            with self.assertRaises(concurrent.futures.CancelledError):
+                future.result(timeout=5)
+            self.assertEqual(calls, [])
+            self.assertEqual(executor.drop_count, 1)
+        finally:
+            gate.set()
+            executor.shutdown()
+        self.assertEqual(executor.num_pending, 0)
+
+
+class MakeETagTest(unittest.TestCase):
+    def test_make_etag(self):
+        etag = webapi.make_etag('ds', 3, (0,), float('nan'))
+        self.assertRegex(etag, '^"[0-9a-f]{40}"$')
+        self.assertEqual(etag, webapi.make_etag('ds', 3, (0,), float('nan')))
+        self.assertNotEqual(etag, webapi.make_etag('ds', 4, (0,), float('nan')))
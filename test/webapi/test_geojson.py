@@ -1,4 +1,6 @@
 import os.path
+import time
+import unittest
 from collections import OrderedDict
 from unittest import TestCase
 
@@ -6,7 +8,9 @@ import fiona
 import numpy as np
 import pyproj
 
-from cate.webapi.geojson import get_geometry_transform, write_feature_collection, simplify_geometry
+from cate.webapi.geojson import get_geometry_transform, write_feature_collection, simplify_geometry, \
+    transform_geometries, compute_effective_areas, compute_point_ranks, get_most_important_points, \
+    FeatureGeometries, _get_proj
 
 source_prj = pyproj.Proj(init='EPSG:4326')
 target_prj = pyproj.Proj(init='EPSG:3395')
@@ -186,6 +190,112 @@ class WriteFeatureCollectionTest(TestCase):
         self.assertEqual(num_written, 179)
 
 
+class ComputeEffectiveAreasTest(TestCase):
+    def test_square(self):
+        x = np.array([1., 2., 3., 3., 3., 2., 1., 1., 1.])
+        y = np.array([1., 1., 1., 2., 3., 3., 3., 2., 1.])
+        areas = np.zeros(x.size)
+        compute_effective_areas(x, y, areas)
+        self.assertEqual(list(areas), [np.inf, 0.0, 2.0, 0.0, 2.0, 0.0, 2.0, 0.0, np.inf])
+        self.assertEqual(list(get_most_important_points(areas, 9)), [0, 1, 2, 3, 4, 5, 6, 7, 8])
+        self.assertEqual(list(get_most_important_points(areas, 5)), [0, 2, 4, 6, 8])
+        self.assertEqual(list(get_most_important_points(areas, 4)), [0, 4, 6, 8])
+
+    def test_effective_areas_do_not_decrease(self):
+        x = np.array([0., 1., 2., 3., 4.])
+        y = np.array([0., -1., 0.5, 0., 0.])
+        areas = np.zeros(x.size)
+        compute_effective_areas(x, y, areas)
+        # Once point 1 is removed, the triangle of point 2 has an area of 1.0 only
+        self.assertEqual(list(areas), [np.inf, 1.25, 1.25, 0.25, np.inf])
+
+    def test_short_line_strings(self):
+        areas = np.zeros(2)
+        compute_effective_areas(np.array([1., 2.]), np.array([1., 2.]), areas)
+        self.assertEqual(list(areas), [np.inf, np.inf])
+        areas = np.zeros(0)
+        compute_effective_areas(np.zeros(0), np.zeros(0), areas)
+        self.assertEqual(areas.size, 0)
+
+
+class FeatureGeometriesTest(TestCase):
+    @staticmethod
+    def new_collection():
+        return [dict(type='Feature',
+                     geometry=dict(type='Polygon',
+                                   coordinates=[[(12.0, 53.0), (13.0, 54.0), (13.3, 55.1), (13.0, 56.0),
+                                                 (12.0, 53.0)]]),
+                     properties=dict(id='1')),
+                dict(type='Feature',
+                     geometry=dict(type='MultiPolygon', coordinates=LARGE_MULTI_POLYGON),
+                     properties=dict(id='2')),
+                dict(type='Feature',
+                     geometry=dict(type='LineString', coordinates=[(12.0, 53.0), (13.0, 54.0), (13.1, 54.2)]),
+                     properties=dict(id='3')),
+                dict(type='Feature',
+                     geometry=dict(type='Point', coordinates=(12.0, 53.0)),
+                     properties=dict(id='4'))]
+
+    def test_same_output_as_without_precomputation(self):
+        from io import StringIO
+        for crs in (None, dict(init='epsg:3395')):
+            feature_geometries = FeatureGeometries(crs)
+            for conservation_ratio in (1.0, 0.5, 0.125, 0.0):
+                expected_io = StringIO()
+                write_feature_collection(self.new_collection(), expected_io, crs=crs,
+                                         conservation_ratio=conservation_ratio)
+                actual_io = StringIO()
+                write_feature_collection(self.new_collection(), actual_io, crs=crs,
+                                         conservation_ratio=conservation_ratio,
+                                         feature_geometries=feature_geometries)
+                self.assertEqual(actual_io.getvalue(), expected_io.getvalue())
+                self.assertEqual(feature_geometries.num_batches, 1)
+
+    def test_batches_are_computed_once(self):
+        feature_geometries = FeatureGeometries()
+        batch = feature_geometries.get_batch(0, self.new_collection())
+        self.assertFalse(batch.is_reprojected)
+        self.assertEqual(batch.num_features, 4)
+        self.assertEqual(batch.num_points, 5 + 3 + 1 + sum(len(ring)
+                                                           for polygon in LARGE_MULTI_POLYGON
+                                                           for ring in polygon))
+        self.assertIs(feature_geometries.get_batch(0, self.new_collection()), batch)
+        with self.assertRaises(ValueError):
+            feature_geometries.get_batch(0, self.new_collection()[1:])
+        with self.assertRaises(IndexError):
+            feature_geometries.get_batch(2, self.new_collection())
+
+    def test_points_are_ranked_lazily(self):
+        collection = self.new_collection()
+        batch = FeatureGeometries(dict(init='epsg:3395')).get_batch(0, collection)
+        geometries = [(feature['geometry']['type'], feature['geometry']['coordinates'], 1.0)
+                      for feature in collection]
+        batch.transform_geometries(range(4), geometries)
+        self.assertFalse(batch.is_ranked)
+        batch.transform_geometries(range(4), [(type_name, coordinates, 0.0)
+                                              for type_name, coordinates, _ in geometries])
+        self.assertFalse(batch.is_ranked)
+        batch.transform_geometries(range(4), [(type_name, coordinates, 0.5)
+                                              for type_name, coordinates, _ in geometries])
+        self.assertTrue(batch.is_ranked)
+
+
+class ComputePointRanksTest(TestCase):
+    def test_ranks_select_most_important_points(self):
+        x = np.array([1., 2., 3., 3., 3., 2., 1., 1., 1., 0., 1., 2.])
+        y = np.array([1., 1., 1., 2., 3., 3., 3., 2., 1., 0., 1., 0.])
+        ring_offsets = np.array([0, 9, 12])
+        ranks = np.zeros(x.size, dtype=np.int64)
+        compute_point_ranks(x, y, ring_offsets, ranks)
+        self.assertEqual(list(ranks[0:9]), [1, 8, 4, 7, 3, 6, 2, 5, 0])
+        self.assertEqual(list(ranks[9:12]), [1, 2, 0])
+        areas = np.zeros(9)
+        compute_effective_areas(x[0:9], y[0:9], areas)
+        for point_count in range(1, 10):
+            self.assertEqual(list(np.nonzero(ranks[0:9] < point_count)[0]),
+                             list(get_most_important_points(areas, point_count)))
+
+
 class SimplifyGeometryTest(TestCase):
     def test_simplify_none(self):
         # A triangle (ring)
@@ -291,6 +401,86 @@ class SimplifyGeometryTest(TestCase):
         self.assertEqual(list(sy), [1, 3, 3, 1])
 
 
+class TransformGeometriesTest(TestCase):
+    def test_transform_geometries_at_once(self):
+        geometries = [('Point', (12.0, 53.0), 1.0),
+                      ('Polygon', [[(12.0, 53.0), (13.0, 54.0), (13.0, 56.0), (12.0, 53.0)]], 1.0),
+                      ('MultiPolygon', LARGE_MULTI_POLYGON, 0.5),
+                      ('MultiLineString', [[(12.0, 53.0), (13.0, 54.0), (13.0, 56.0)]], 0.0)]
+        transformed_geometries = transform_geometries(source_prj, target_prj, geometries)
+        self.assertEqual(len(transformed_geometries), 4)
+        for (type_name, coordinates, conservation_ratio), transformed_coordinates in zip(geometries,
+                                                                                         transformed_geometries):
+            transform = get_geometry_transform(type_name)
+            self.assertEqual(transformed_coordinates,
+                             transform(source_prj, target_prj, conservation_ratio, coordinates))
+        self.assertAlmostEqual(transformed_geometries[0][0], 1335833., delta=1e0)
+        self.assertAlmostEqual(transformed_geometries[0][1], 6948849., delta=1e0)
+        self.assertAlmostEqual(transformed_geometries[1][0][0][0], 1335833., delta=1e0)
+        self.assertEqual(len(transformed_geometries[2]), 13)
+        self.assertEqual(len(transformed_geometries[3]), 2)
+
+    def test_failing_geometry_is_none(self):
+        geometries = [('LineString', [(12.0, 53.0), (13.0, 54.0)], 1.0),
+                      ('LineString', [(12.0, 53.0), (13.0,)], 1.0),
+                      ('Polygon', [[]], 0.0)]
+        transformed_geometries = transform_geometries(source_prj, target_prj, geometries)
+        self.assertEqual(len(transformed_geometries), 3)
+        self.assertEqual(len(transformed_geometries[0]), 2)
+        self.assertIsNone(transformed_geometries[1])
+        self.assertIsNone(transformed_geometries[2])
+
+    def test_no_transformation(self):
+        line_string = [(12.0, 53.0), (13.0, 54.0)]
+        transformed_geometries = transform_geometries(None, None, [('LineString', line_string, 1.0)])
+        self.assertIs(transformed_geometries[0], line_string)
+
+    def test_projections_are_cached(self):
+        self.assertIs(_get_proj(dict(init='epsg:3395')), _get_proj(dict(init='epsg:3395')))
+
+
+@unittest.skipUnless(condition=os.environ.get('CATE_BENCHMARK_TESTS', None),
+                     reason="skipped unless CATE_BENCHMARK_TESTS=1")
+class WriteFeatureCollectionBenchmarkTest(TestCase):
+    def test_write_100k_polygons(self):
+        class NullIO:
+            def write(self, text):
+                pass
+
+            def flush(self):
+                pass
+
+        num_features = 100000
+        num_points = 10
+        angles = np.linspace(0, 2 * np.pi, num_points)
+        ring_x = 20000. * np.cos(angles)
+        ring_y = 20000. * np.sin(angles)
+        ring_x[-1] = ring_x[0]
+        ring_y[-1] = ring_y[0]
+        center_x = np.random.uniform(-1.5e7, 1.5e7, num_features)
+        center_y = np.random.uniform(-1.0e7, 1.0e7, num_features)
+
+        crs = dict(init='epsg:3395')
+        feature_geometries = FeatureGeometries(crs)
+        for precomputed in (False, True, True):
+            for conservation_ratio in (1.0, 0.5, 0.0):
+                collection = [dict(type='Feature',
+                                   geometry=dict(type='Polygon',
+                                                 coordinates=[list(zip((ring_x + cx).tolist(),
+                                                                       (ring_y + cy).tolist()))]),
+                                   properties=dict(id=i))
+                              for i, cx, cy in zip(range(num_features), center_x.tolist(), center_y.tolist())]
+                t0 = time.perf_counter()
+                num_written = write_feature_collection(collection, NullIO(),
+                                                       crs=crs,
+                                                       conservation_ratio=conservation_ratio,
+                                                       feature_geometries=feature_geometries if precomputed else None)
+                t1 = time.perf_counter()
+                self.assertEqual(num_written, num_features)
+                print('write_feature_collection: %d polygons, conservation ratio %s, precomputed %s: %.2f s'
+                      % (num_features, conservation_ratio, precomputed, t1 - t0))
+
+
 LARGE_MULTI_POLYGON = [
     [
         [
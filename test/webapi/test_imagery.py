@@ -0,0 +1,165 @@
+import shutil
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from cate.conf.defaults import WEBAPI_WORKSPACE_MEM_TILE_CACHE_CAPACITY
+from cate.core.workspace import Workspace
+from cate.util.im import ImagePyramid, TilingScheme, GeoExtent
+from cate.util.im.image import OpImage
+from cate.webapi.imagery import PyramidRegistry, WorkspaceImagery, get_workspace_imagery, \
+    get_open_workspace_imageries, get_tile_encoding, get_tile_encoding_id, get_tile_mime_type, get_tile_file_extension, \
+    WORKSPACE_IMAGERY_KEY
+
+
+def _new_pyramid():
+    tiling_scheme = TilingScheme.create(360, 180, 180, 180, GeoExtent())
+    return ImagePyramid.create_from_array(np.zeros((180, 360)), tiling_scheme)
+
+
+class DisposablePyramid:
+    def __init__(self):
+        self.disposed = False
+
+    def dispose(self):
+        self.disposed = True
+
+
+class EncodedTileImage(OpImage):
+    def __init__(self, tile_cache):
+        super().__init__((4, 4), (2, 2), (2, 2), format='PNG', image_id='encoded', tile_cache=tile_cache)
+
+    def compute_tile(self, tile_x, tile_y, rectangle):
+        return b'tile-%d-%d' % (tile_x, tile_y)
+
+
+class PyramidRegistryTest(TestCase):
+    def test_get_and_add(self):
+        registry = PyramidRegistry()
+        self.assertIsNone(registry.get('p1'))
+        pyramid = _new_pyramid()
+        self.assertIs(registry.add('p1', pyramid), pyramid)
+        self.assertIs(registry.add('p1', _new_pyramid()), pyramid)
+        self.assertIs(registry.get('p1'), pyramid)
+        self.assertEqual(len(registry), 1)
+
+    def test_least_recently_used_pyramids_are_disposed(self):
+        registry = PyramidRegistry(max_num_pyramids=2)
+        p1, p2, p3 = DisposablePyramid(), DisposablePyramid(), DisposablePyramid()
+        registry.add('p1', p1)
+        registry.add('p2', p2)
+        registry.get('p1')
+        registry.add('p3', p3)
+        self.assertEqual(len(registry), 2)
+        self.assertIn('p1', registry)
+        self.assertNotIn('p2', registry)
+        self.assertIn('p3', registry)
+        self.assertEqual((p1.disposed, p2.disposed, p3.disposed), (False, True, False))
+
+        registry.clear()
+        self.assertEqual(len(registry), 0)
+        self.assertEqual((p1.disposed, p2.disposed, p3.disposed), (True, True, True))
+
+    def test_on_remove(self):
+        removed_ids = []
+        registry = PyramidRegistry(max_num_pyramids=1, on_remove=removed_ids.append)
+        registry.add('p1', DisposablePyramid())
+        registry.add('p2', DisposablePyramid())
+        self.assertEqual(removed_ids, ['p1'])
+        registry.clear()
+        self.assertEqual(removed_ids, ['p1', 'p2'])
+
+
+class WorkspaceImageryTest(TestCase):
+    def test_props(self):
+        imagery = WorkspaceImagery('/path')
+        self.assertEqual(imagery.base_dir, '/path')
+        self.assertIsNotNone(imagery.mem_tile_cache)
+        self.assertIsNone(imagery.file_tile_cache)
+        self.assertEqual(len(imagery.pyramids), 0)
+        self.assertEqual(len(imagery.array_pyramids), 0)
+        self.assertIsNotNone(imagery.prefetcher)
+        self.assertIsNone(WorkspaceImagery('/path', prefetch_num_workers=0).prefetcher)
+
+    def test_close(self):
+        imagery = WorkspaceImagery('/path')
+        pyramid = DisposablePyramid()
+        array_pyramid = DisposablePyramid()
+        imagery.pyramids.add('p1', pyramid)
+        imagery.array_pyramids.add('a1', array_pyramid)
+        imagery.mem_tile_cache.put_value('tile', np.zeros((16, 16)))
+        imagery.close()
+        self.assertTrue(imagery.is_closed)
+        self.assertIsNone(imagery.pyramids.get('p1'))
+        self.assertIsNone(imagery.array_pyramids.get('a1'))
+        self.assertTrue(pyramid.disposed)
+        self.assertTrue(array_pyramid.disposed)
+        self.assertEqual(imagery.mem_tile_cache.size, 0)
+        self.assertTrue(imagery.prefetcher.is_closed)
+
+    def test_file_tiles_survive_close(self):
+        base_dir = tempfile.mkdtemp()
+        try:
+            for store in ['files', 'segments']:
+                imagery = WorkspaceImagery(base_dir, file_tile_cache_store=store, prefetch_num_workers=0)
+                image = EncodedTileImage(imagery.file_tile_cache)
+                imagery.pyramids.add('p1', ImagePyramid(TilingScheme(1, 2, 2, 2, 2, GeoExtent()), [image]))
+                self.assertEqual(image.get_tile(1, 0), b'tile-1-0')
+                imagery.close()
+
+                imagery = WorkspaceImagery(base_dir, file_tile_cache_store=store, prefetch_num_workers=0)
+                try:
+                    self.assertEqual(bytes(imagery.file_tile_cache.get_value('encoded/1/0')), b'tile-1-0')
+                finally:
+                    imagery.close()
+        finally:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+
+class GetWorkspaceImageryTest(TestCase):
+    def test_budget_is_divided_among_workspaces(self):
+        ws1 = Workspace.create('/path/ws1')
+        ws2 = Workspace.create('/path/ws2')
+
+        imagery1 = get_workspace_imagery(ws1)
+        self.assertIs(get_workspace_imagery(ws1), imagery1)
+        self.assertIs(ws1.user_data[WORKSPACE_IMAGERY_KEY], imagery1)
+        self.assertEqual(imagery1.mem_tile_cache.capacity, WEBAPI_WORKSPACE_MEM_TILE_CACHE_CAPACITY)
+
+        imagery2 = get_workspace_imagery(ws2)
+        self.assertIsNot(imagery2, imagery1)
+        self.assertIsNot(imagery2.mem_tile_cache, imagery1.mem_tile_cache)
+        self.assertEqual(imagery1.mem_tile_cache.capacity, WEBAPI_WORKSPACE_MEM_TILE_CACHE_CAPACITY / 2)
+        self.assertEqual(imagery2.mem_tile_cache.capacity, WEBAPI_WORKSPACE_MEM_TILE_CACHE_CAPACITY / 2)
+        self.assertIn(imagery1, get_open_workspace_imageries())
+        self.assertIn(imagery2, get_open_workspace_imageries())
+
+        ws1.close()
+        self.assertTrue(imagery1.is_closed)
+        self.assertNotIn(imagery1, get_open_workspace_imageries())
+        self.assertEqual(imagery2.mem_tile_cache.capacity, WEBAPI_WORKSPACE_MEM_TILE_CACHE_CAPACITY)
+
+        ws2.close()
+        self.assertTrue(imagery2.is_closed)
+        self.assertNotIn(imagery2, get_open_workspace_imageries())
+
+
+class TileEncodingTest(TestCase):
+    def test_default(self):
+        tile_encoding = get_tile_encoding({})
+        self.assertEqual(tile_encoding, dict(format='PNG', palette=True, compress_level=6, quality=None))
+        self.assertEqual(get_tile_encoding_id(tile_encoding), 'png-p-6-None')
+        self.assertEqual(get_tile_mime_type(tile_encoding), 'image/png')
+        self.assertEqual(get_tile_file_extension(tile_encoding), '.png')
+
+    def test_webp(self):
+        tile_encoding = get_tile_encoding(dict(tile_format='webp', tile_webp_quality=80))
+        if tile_encoding['format'] == 'WEBP':
+            self.assertEqual(get_tile_encoding_id(tile_encoding), 'webp-p-6-80')
+            self.assertEqual(get_tile_mime_type(tile_encoding), 'image/webp')
+            self.assertEqual(get_tile_file_extension(tile_encoding), '.webp')
+
+    def test_illegal_format(self):
+        with self.assertRaises(ValueError):
+            get_tile_encoding(dict(tile_format='GIF'))
@@ -23,3 +23,40 @@ class WebAPITest(AsyncHTTPTestCase):
         self.assertIn('content', json_dict)
         self.assertIn('name', json_dict['content'])
         self.assertIn('version', json_dict['content'])
+
+    def test_caches(self):
+        response = self.fetch('/ws/caches')
+        self.assertEqual(response.code, 200)
+        json_dict = json.loads(response.body.decode('utf-8'))
+        self.assertEqual(json_dict.get('status'), 'ok')
+        # Tile caches are named "mem_tile_cache:<base_dir>" and "file_tile_cache:<base_dir>" per open workspace
+        self.assertIsInstance(json_dict['content'], dict)
+        for cache_name, cache_info in json_dict['content'].items():
+            self.assertIn('size', cache_info)
+            self.assertIn('capacity', cache_info)
+            self.assertIn('hit_ratio', cache_info['stats'])
+
+    def test_ne2_tile_is_cached(self):
+        response = self.fetch('/ws/ne2/tile/0/0/0.jpg')
+        self.assertEqual(response.code, 200)
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        etag = response.headers['Etag']
+        self.assertTrue(etag)
+
+        response = self.fetch('/ws/ne2/tile/0/0/0.jpg', headers={'If-None-Match': etag})
+        self.assertEqual(response.code, 304)
+        self.assertEqual(response.body, b'')
+
+    def test_countries_are_validated(self):
+        response = self.fetch('/ws/countries?level=0')
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.headers['Cache-Control'], 'no-cache')
+        etag = response.headers['Etag']
+        last_modified = response.headers['Last-Modified']
+
+        response = self.fetch('/ws/countries?level=0', headers={'If-None-Match': etag})
+        self.assertEqual(response.code, 304)
+        response = self.fetch('/ws/countries?level=0', headers={'If-Modified-Since': last_modified})
+        self.assertEqual(response.code, 304)
+        response = self.fetch('/ws/countries?level=1', headers={'If-None-Match': etag})
+        self.assertEqual(response.code, 200)
@@ -0,0 +1,68 @@
+import os.path
+import shutil
+import tempfile
+from unittest import TestCase
+
+from cate.core.workspace import Workspace, mk_op_kwargs
+from cate.util.im import TilingScheme, GeoExtent
+from cate.webapi.imagery import WorkspaceImagery, WORKSPACE_IMAGERY_CACHE_STORE
+from cate.webapi.prerender import get_tile_blocks, render_tiles
+from cate.webapi.rest import ResVarTileHandler, TILE_ENCODING_ID
+
+NETCDF_TEST_FILE = os.path.join(os.path.dirname(__file__), '..', 'data', 'precip_and_temp.nc')
+
+
+class GetTileBlocksTest(TestCase):
+    def test_blocks_cover_all_tiles_once(self):
+        tiling_scheme = TilingScheme(3, 2, 1, 180, 180, GeoExtent())
+        blocks = get_tile_blocks(tiling_scheme, 2, 3)
+        self.assertEqual(blocks[0], (0, 0, 0, 2, 1))
+        self.assertEqual([block[0] for block in blocks], sorted(block[0] for block in blocks))
+        tiles = [(level, x, y)
+                 for level, x1, y1, x2, y2 in blocks
+                 for y in range(y1, y2)
+                 for x in range(x1, x2)]
+        self.assertEqual(len(tiles), len(set(tiles)))
+        self.assertEqual(len(tiles), 2 * 1 + 4 * 2 + 8 * 4)
+
+    def test_max_level(self):
+        tiling_scheme = TilingScheme(3, 2, 1, 180, 180, GeoExtent())
+        self.assertEqual(get_tile_blocks(tiling_scheme, 0, 4), [(0, 0, 0, 2, 1)])
+
+    def test_illegal_block_size(self):
+        tiling_scheme = TilingScheme(3, 2, 1, 180, 180, GeoExtent())
+        with self.assertRaises(ValueError):
+            get_tile_blocks(tiling_scheme, 2, 0)
+
+
+class RenderTilesTest(TestCase):
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+        workspace = Workspace.create(self.base_dir)
+        workspace.set_resource('cate.ops.io.read_netcdf', mk_op_kwargs(file=NETCDF_TEST_FILE), res_name='ds')
+        workspace.save()
+        workspace.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.base_dir, ignore_errors=True)
+
+    def test_tiles_are_put_into_file_tile_cache(self):
+        num_tiles = render_tiles(self.base_dir, 'ds', 'temperature', var_index=(1,),
+                                 cmap_name='viridis', cmap_max=300.0, num_workers=0)
+        self.assertGreater(num_tiles, 0)
+
+        array_id = ResVarTileHandler.get_array_id('ds', 'temperature', (1,))
+        image_id = ResVarTileHandler.get_image_id(array_id, 'viridis', float('nan'), 300.0)
+        imagery = WorkspaceImagery(self.base_dir,
+                                   file_tile_cache_store=WORKSPACE_IMAGERY_CACHE_STORE,
+                                   prefetch_num_workers=0)
+        try:
+            tile = imagery.file_tile_cache.get_value('rgb-%s-%s/0/0/0' % (image_id, TILE_ENCODING_ID))
+            self.assertIsNotNone(tile)
+            self.assertEqual(bytes(tile[1:4]), b'PNG')
+        finally:
+            imagery.close()
+
+    def test_unknown_resource(self):
+        with self.assertRaises(Exception):
+            render_tiles(self.base_dir, 'ds2', 'temperature', num_workers=0)
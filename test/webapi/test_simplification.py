@@ -0,0 +1,62 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from cate.core.workspace import Workspace
+from cate.webapi.geojson import FeatureGeometries
+from cate.webapi.simplification import FeatureGeometriesCache, get_resource_feature_geometries, \
+    get_file_feature_geometries, WORKSPACE_FEATURE_GEOMETRIES_KEY
+
+
+class FeatureGeometriesCacheTest(TestCase):
+    def test_version_invalidates(self):
+        cache = FeatureGeometriesCache()
+        feature_geometries = FeatureGeometries()
+        cache.put('k', 0, feature_geometries)
+        self.assertIs(cache.get('k', 0), feature_geometries)
+        self.assertIsNone(cache.get('k', 1))
+        self.assertEqual(len(cache), 0)
+
+    def test_least_recently_used_entries_are_removed(self):
+        cache = FeatureGeometriesCache(max_num_entries=2)
+        cache.put('k1', 0, FeatureGeometries())
+        cache.put('k2', 0, FeatureGeometries())
+        cache.get('k1', 0)
+        cache.put('k3', 0, FeatureGeometries())
+        self.assertIsNotNone(cache.get('k1', 0))
+        self.assertIsNone(cache.get('k2', 0))
+        self.assertIsNotNone(cache.get('k3', 0))
+        cache.close()
+        self.assertEqual(len(cache), 0)
+
+
+class GetFeatureGeometriesTest(TestCase):
+    def test_resource_feature_geometries_cached_until_resource_changes(self):
+        workspace = Workspace.create('/path')
+        workspace.resource_cache['df'] = [dict(type='Feature', geometry=None, properties={})]
+
+        feature_geometries = get_resource_feature_geometries(workspace, 'df')
+        self.assertIs(get_resource_feature_geometries(workspace, 'df'), feature_geometries)
+        self.assertIn(WORKSPACE_FEATURE_GEOMETRIES_KEY, workspace.user_data)
+
+        workspace.resource_cache['df'] = []
+        self.assertIsNot(get_resource_feature_geometries(workspace, 'df'), feature_geometries)
+
+        with self.assertRaises(ValueError):
+            get_resource_feature_geometries(workspace, 'x')
+
+        workspace.close()
+        self.assertNotIn(WORKSPACE_FEATURE_GEOMETRIES_KEY, workspace.user_data)
+
+    def test_file_feature_geometries_cached_until_file_changes(self):
+        fd, file_path = tempfile.mkstemp(suffix='.geojson')
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                fp.write('{"type": "FeatureCollection", "features": []}')
+            feature_geometries = get_file_feature_geometries(file_path)
+            self.assertIs(get_file_feature_geometries(file_path), feature_geometries)
+            with open(file_path, 'w') as fp:
+                fp.write('{"type": "FeatureCollection", "features": [ ]}')
+            self.assertIsNot(get_file_feature_geometries(file_path), feature_geometries)
+        finally:
+            os.remove(file_path)
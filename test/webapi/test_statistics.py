@@ -0,0 +1,61 @@
+from unittest import TestCase
+
+import numpy as np
+import xarray as xr
+
+from cate.core.workspace import Workspace
+from cate.webapi.statistics import StatisticsCache, get_variable_statistics, WORKSPACE_STATISTICS_KEY
+
+
+class StatisticsCacheTest(TestCase):
+    def test_update_count_invalidates(self):
+        cache = StatisticsCache()
+        cache.put('k', 0, dict(min=1))
+        self.assertEqual(cache.get('k', 0), dict(min=1))
+        self.assertIsNone(cache.get('k', 1))
+        self.assertEqual(len(cache), 0)
+
+    def test_least_recently_used_entries_are_removed(self):
+        cache = StatisticsCache(max_num_entries=2)
+        cache.put('k1', 0, dict(min=1))
+        cache.put('k2', 0, dict(min=2))
+        cache.get('k1', 0)
+        cache.put('k3', 0, dict(min=3))
+        self.assertIsNotNone(cache.get('k1', 0))
+        self.assertIsNone(cache.get('k2', 0))
+        self.assertIsNotNone(cache.get('k3', 0))
+        cache.close()
+        self.assertEqual(len(cache), 0)
+
+
+class GetVariableStatisticsTest(TestCase):
+    def test_cached_until_resource_changes(self):
+        workspace = Workspace.create('/path')
+        dataset = xr.Dataset(dict(sst=(('time', 'lat', 'lon'), np.arange(24.0).reshape((2, 3, 4)))))
+        workspace.resource_cache['ds'] = dataset
+
+        statistics = get_variable_statistics(workspace, 'ds', 'sst', [1])
+        self.assertEqual((statistics['min'], statistics['max']), (12.0, 23.0))
+        self.assertIs(get_variable_statistics(workspace, 'ds', 'sst', (1,)), statistics)
+        self.assertIn(WORKSPACE_STATISTICS_KEY, workspace.user_data)
+
+        statistics = get_variable_statistics(workspace, 'ds', 'sst')
+        self.assertEqual((statistics['min'], statistics['max']), (0.0, 23.0))
+
+        workspace.resource_cache['ds'] = dataset * 2
+        statistics = get_variable_statistics(workspace, 'ds', 'sst', [1])
+        self.assertEqual((statistics['min'], statistics['max']), (24.0, 46.0))
+
+        workspace.close()
+        self.assertNotIn(WORKSPACE_STATISTICS_KEY, workspace.user_data)
+
+    def test_errors(self):
+        workspace = Workspace.create('/path')
+        workspace.resource_cache['df'] = 42
+        workspace.resource_cache['ds'] = xr.Dataset()
+        with self.assertRaises(ValueError):
+            get_variable_statistics(workspace, 'x', 'sst')
+        with self.assertRaises(ValueError):
+            get_variable_statistics(workspace, 'df', 'sst')
+        with self.assertRaises(ValueError):
+            get_variable_statistics(workspace, 'ds', 'sst')